@@ -0,0 +1,107 @@
+import json
+import threading
+from collections import OrderedDict
+
+from context import message_tokens
+
+
+def parse_keep_alive(spec):
+    """Parse a keep_alive policy such as "llama3=30m,phi3=-1,*=5m" into a dict.
+
+    Values are passed to Ollama as-is; numeric ones are sent as numbers
+    (seconds, or -1 to keep the model loaded indefinitely).
+    """
+    policy = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        model, _, value = item.partition('=')
+        value = value.strip()
+        try:
+            value = int(value)
+        except ValueError:
+            pass
+        policy[model.strip()] = value
+    return policy
+
+
+def keep_alive_for(policy, model):
+    """The keep_alive value for `model`, trying `name:tag`, then `name`, then `*`."""
+    if model in policy:
+        return policy[model]
+    base = model.split(':', 1)[0] if model else model
+    if base in policy:
+        return policy[base]
+    return policy.get('*')
+
+
+def canonical_messages(messages):
+    """Rebuild messages with a fixed key order: role, content, images, then any other keys sorted.
+
+    The same conversation then serialises to the same bytes on every turn, so
+    Ollama sees an identical prompt prefix and can reuse its KV cache. Every
+    field is kept, so tool calls, tool results and thinking pass through.
+    """
+    canonical = []
+    for message in messages:
+        item = {"role": message.get('role', 'user'), "content": message.get('content') or ''}
+        if 'images' in message:
+            item['images'] = message['images']
+        for key in sorted(message):
+            if key not in item:
+                item[key] = message[key]
+        canonical.append(item)
+    return canonical
+
+
+class PrefixStats:
+    """Per-conversation prompt-cache reuse, for the most recent conversations.
+
+    A turn can reuse Ollama's cache for the messages it shares, unchanged
+    and in order, with the previous turn, provided both ran on the same
+    backend. Those messages' estimated tokens are counted as reused; Ollama's
+    own `prompt_eval_count` is kept alongside for comparison.
+    """
+
+    def __init__(self, max_conversations=10000):
+        self.max_conversations = max_conversations
+        self.conversations = OrderedDict()
+        self.lock = threading.Lock()
+
+    def record(self, conversation, backend, messages, result):
+        """Account for one completed turn and return its reused prompt tokens."""
+        digests = [hash(json.dumps(message, sort_keys=True)) for message in messages]
+        with self.lock:
+            stats = self.conversations.pop(conversation, None) or {
+                "turns": 0,
+                "prompt_tokens": 0,
+                "reused_tokens": 0,
+                "prompt_eval_count": 0,
+                "backend": None,
+                "digests": []
+            }
+            shared = 0
+            if stats["backend"] == backend:
+                for previous, current in zip(stats["digests"], digests):
+                    if previous != current:
+                        break
+                    shared += 1
+            reused = sum(message_tokens(message) for message in messages[:shared])
+            stats["turns"] += 1
+            stats["prompt_tokens"] += sum(message_tokens(message) for message in messages)
+            stats["reused_tokens"] += reused
+            stats["prompt_eval_count"] += result.get('prompt_eval_count') or 0
+            stats["backend"] = backend
+            stats["digests"] = digests
+            self.conversations[conversation] = stats
+            while len(self.conversations) > self.max_conversations:
+                self.conversations.popitem(last=False)
+        return reused
+
+    def get(self, conversation):
+        with self.lock:
+            stats = self.conversations.get(conversation)
+            if stats is None:
+                return None
+            stats = dict(stats)
+        stats["messages"] = len(stats.pop("digests"))
+        stats["reuse_ratio"] = round(stats["reused_tokens"] / stats["prompt_tokens"], 3) if stats["prompt_tokens"] else 0.0
+        return stats
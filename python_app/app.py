@@ -1,10 +1,42 @@
 import os
 import json
+import queue
+import re
+import socket
 import datetime
+import functools
+import hashlib
+import io
+import threading
+import time
+import numpy as np
 import requests
-from flask import Flask, render_template, request, jsonify
+from flask import (Flask, Response, g, has_request_context, make_response, render_template, request, jsonify,
+                   stream_with_context, url_for)
 from dotenv import load_dotenv
 
+from affinity import PrefixStats, canonical_messages, keep_alive_for, parse_keep_alive
+from assets import AssetManifest
+from backends import Backend, BackendPool, full_model_name
+from broadcast import Hub
+from cascade import SIGNALS, Cascade, parse_tiers
+from cache import TTLCache
+from coalesce import Cancelled, Flight, FlightTable
+from compress import COMPRESSIBLE, compress, compress_stream, negotiate
+from context import message_tokens, trim_messages
+from embeddings import EmbedBatcher, EmbeddingStore
+from jobs import ACTIVE, JobStore
+from limiter import AdaptiveLimiter
+from metrics import RATE_BUCKETS, Registry
+from modelinfo import ContextSizer, ModelInfoCache
+from pipeline import PipelineError, build_pipeline, pipeline_spec, redact_patterns
+from response_cache import ResponseCache, canonical_key, is_deterministic
+from scheduler import AdmissionError, AdmissionScheduler
+from semantic import SemanticCache
+from sessions import SessionStore
+from upstream import CircuitBreaker, CircuitOpenError, OllamaClient, abort
+from warmup import WarmPool, parse_hours
+
 # Load environment variables
 load_dotenv()
 
@@ -12,19 +44,1065 @@ app = Flask(__name__)
 
 # Configuration
 OLLAMA_API_URL = os.getenv('OLLAMA_API_URL', 'http://localhost:11434/api')
+OLLAMA_API_URLS = [url.strip() for url in os.getenv('OLLAMA_API_URLS', OLLAMA_API_URL).split(',') if url.strip()]
+OLLAMA_SOCKET = os.getenv('OLLAMA_SOCKET')
+OLLAMA_POOL_SIZE = int(os.getenv('OLLAMA_POOL_SIZE', '100'))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv('OLLAMA_CONNECT_TIMEOUT', '3.05'))
+OLLAMA_READ_TIMEOUT = float(os.getenv('OLLAMA_READ_TIMEOUT', '30'))
+OLLAMA_GENERATE_TIMEOUT = float(os.getenv('OLLAMA_GENERATE_TIMEOUT', '300'))
+OLLAMA_RETRIES = int(os.getenv('OLLAMA_RETRIES', '2'))
+OLLAMA_BREAKER_THRESHOLD = int(os.getenv('OLLAMA_BREAKER_THRESHOLD', '5'))
+OLLAMA_BREAKER_RESET = float(os.getenv('OLLAMA_BREAKER_RESET', '10'))
+HEALTH_CHECK_INTERVAL = float(os.getenv('HEALTH_CHECK_INTERVAL', '5'))
+BACKEND_MAX_LATENCY = float(os.getenv('BACKEND_MAX_LATENCY', '2'))
+BACKEND_FAILURE_THRESHOLD = int(os.getenv('BACKEND_FAILURE_THRESHOLD', '3'))
+BACKEND_EJECT_TIME = float(os.getenv('BACKEND_EJECT_TIME', '30'))
+AFFINITY_SLACK = int(os.getenv('AFFINITY_SLACK', '4'))
+KEEP_ALIVE_POLICY = parse_keep_alive(os.getenv('KEEP_ALIVE', ''))
+DATA_DIR = os.getenv('DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+METADATA_CACHE_TTL = float(os.getenv('METADATA_CACHE_TTL', '10'))
+METADATA_CACHE_STALE = float(os.getenv('METADATA_CACHE_STALE', '60'))
+COALESCE_REQUESTS = os.getenv('COALESCE_REQUESTS', '1') == '1'
+MODEL_CONCURRENCY = int(os.getenv('MODEL_CONCURRENCY', '4'))
+ADAPTIVE_CONCURRENCY = os.getenv('ADAPTIVE_CONCURRENCY', '1') == '1'
+ADAPTIVE_LIMIT_MIN = int(os.getenv('ADAPTIVE_LIMIT_MIN', '1'))
+ADAPTIVE_LIMIT_MAX = int(os.getenv('ADAPTIVE_LIMIT_MAX', '32'))
+ADAPTIVE_TTFT_TOLERANCE = float(os.getenv('ADAPTIVE_TTFT_TOLERANCE', '2'))
+ADAPTIVE_TPS_TOLERANCE = float(os.getenv('ADAPTIVE_TPS_TOLERANCE', '0.5'))
+QUEUE_MAX_DEPTH = int(os.getenv('QUEUE_MAX_DEPTH', '100'))
+QUEUE_TIME_BUDGET = float(os.getenv('QUEUE_TIME_BUDGET', '30'))
+BATCH_QUEUE_TIME_BUDGET = float(os.getenv('BATCH_QUEUE_TIME_BUDGET', '300'))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '4'))
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', '32'))
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '0'))
+CONTEXT_TRIM_TARGET = float(os.getenv('CONTEXT_TRIM_TARGET', '0.75'))
+CONTEXT_REPLY_TOKENS = int(os.getenv('CONTEXT_REPLY_TOKENS', '1024'))
+AUTO_NUM_CTX = os.getenv('AUTO_NUM_CTX', '1') == '1'
+NUM_CTX_MIN = int(os.getenv('NUM_CTX_MIN', '4096'))
+NUM_CTX_SHRINK_AFTER = float(os.getenv('NUM_CTX_SHRINK_AFTER', '600'))
+WARM_MODELS = [model.strip() for model in os.getenv('WARM_MODELS', '').split(',') if model.strip()]
+WARM_HOURS = parse_hours(os.getenv('WARM_HOURS', ''))
+WARM_MARGIN = float(os.getenv('WARM_MARGIN', '60'))
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', '6'))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+EMBED_CACHE_MAX_BYTES = int(os.getenv('EMBED_CACHE_MAX_BYTES', str(1024 * 1024 * 1024)))
+EMBED_BATCH_SIZE = int(os.getenv('EMBED_BATCH_SIZE', '64'))
+EMBED_BATCH_WAIT = float(os.getenv('EMBED_BATCH_WAIT', '0.005'))
+JOB_TTL = float(os.getenv('JOB_TTL', '86400'))
+BROADCAST_BUFFER = int(os.getenv('BROADCAST_BUFFER', '256'))
+BROADCAST_MAX_SKIPS = int(os.getenv('BROADCAST_MAX_SKIPS', '5'))
+BROADCAST_TTL = float(os.getenv('BROADCAST_TTL', '300'))
+REDACT = redact_patterns(os.getenv('REDACT', ''))
+MAX_RESPONSE_CHARS = int(os.getenv('MAX_RESPONSE_CHARS', '0'))
+CASCADE_MODELS = parse_tiers(os.getenv('CASCADE_MODELS', ''))
+CASCADE_MAX_PROMPT_TOKENS = int(os.getenv('CASCADE_MAX_PROMPT_TOKENS', '1000'))
+CASCADE_MAX_COMPLEXITY = int(os.getenv('CASCADE_MAX_COMPLEXITY', '2'))
+CASCADE_SIGNALS = [signal.strip() for signal in os.getenv('CASCADE_SIGNALS', ','.join(SIGNALS)).split(',') if signal.strip()]
+SEMANTIC_CACHE_MODEL = os.getenv('SEMANTIC_CACHE_MODEL', '')
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.92'))
+SEMANTIC_CACHE_ENTRIES = int(os.getenv('SEMANTIC_CACHE_ENTRIES', '1000'))
+
+def make_client(url):
+    return OllamaClient(
+        url,
+        pool_size=OLLAMA_POOL_SIZE,
+        connect_timeout=OLLAMA_CONNECT_TIMEOUT,
+        read_timeout=OLLAMA_READ_TIMEOUT,
+        generate_timeout=OLLAMA_GENERATE_TIMEOUT,
+        retries=OLLAMA_RETRIES,
+        breaker=CircuitBreaker(OLLAMA_BREAKER_THRESHOLD, OLLAMA_BREAKER_RESET),
+        socket_path=OLLAMA_SOCKET
+    )
+
+# Ollama backends, each with its own pooled client
+backends = BackendPool(
+    [Backend(url, make_client(url)) for url in OLLAMA_API_URLS],
+    check_interval=HEALTH_CHECK_INTERVAL,
+    max_latency=BACKEND_MAX_LATENCY,
+    failure_threshold=BACKEND_FAILURE_THRESHOLD,
+    eject_time=BACKEND_EJECT_TIME,
+    affinity_slack=AFFINITY_SLACK
+)
+backends.start()
+
+# Model list and version responses, revalidated in the background
+metadata_cache = TTLCache(METADATA_CACHE_TTL, METADATA_CACHE_STALE)
+
+# Server-side conversation histories
+os.makedirs(DATA_DIR, exist_ok=True)
+session_store = SessionStore(os.path.join(DATA_DIR, 'sessions.db'))
+
+# Background chat jobs, and those generating in this process (id -> Flight)
+job_store = JobStore(os.path.join(DATA_DIR, 'jobs.db'), JOB_TTL)
+running_jobs = {}
+
+# Generations watched by several viewers
+broadcasts = Hub(
+    BROADCAST_TTL,
+    capacity=BROADCAST_BUFFER,
+    max_skips=BROADCAST_MAX_SKIPS,
+    on_skip=lambda: BROADCAST_SKIPS.inc(),
+    on_drop=lambda: BROADCAST_DROPS.inc()
+)
+
+# Prompt-cache reuse per conversation
+prefix_stats = PrefixStats()
+
+# Completed deterministic chat responses, shared by all worker processes
+response_cache = None
+if RESPONSE_CACHE_MAX_BYTES > 0:
+    response_cache = ResponseCache(os.path.join(DATA_DIR, 'responses.db'), RESPONSE_CACHE_MAX_BYTES)
+
+# Embedding vectors by model and text, shared by all worker processes
+embedding_store = None
+if EMBED_CACHE_MAX_BYTES > 0:
+    embedding_store = EmbeddingStore(os.path.join(DATA_DIR, 'embeddings'), EMBED_CACHE_MAX_BYTES)
+
+# Answers to past first-turn questions, matched by embedding similarity
+semantic_cache = None
+if SEMANTIC_CACHE_MODEL:
+    semantic_cache = SemanticCache(SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_ENTRIES)
+
+# Fast models that answer simple chats for large ones
+cascade = None
+if CASCADE_MODELS:
+    cascade = Cascade(CASCADE_MODELS, CASCADE_MAX_PROMPT_TOKENS, CASCADE_MAX_COMPLEXITY, CASCADE_SIGNALS)
+
+# Upstream generations in progress, shared by identical concurrent requests
+flights = FlightTable()
+
+# Concurrency limits per (backend, model), tuned from observed latency
+limiter = None
+if ADAPTIVE_CONCURRENCY:
+    limiter = AdaptiveLimiter(
+        initial=MODEL_CONCURRENCY,
+        min_limit=ADAPTIVE_LIMIT_MIN,
+        max_limit=ADAPTIVE_LIMIT_MAX,
+        ttft_tolerance=ADAPTIVE_TTFT_TOLERANCE,
+        tps_tolerance=ADAPTIVE_TPS_TOLERANCE
+    )
+
+def model_capacity(model):
+    """Generation slots for `model`: the sum of its backends' limits."""
+    if limiter is None:
+        return MODEL_CONCURRENCY * max(1, len(backends.available()))
+    model = full_model_name(model)
+    return sum(limiter.limit(backend.url, model) for backend in backends.available() or backends.backends)
+
+# Per-model generation slots with fair queuing
+scheduler = AdmissionScheduler(
+    slots=MODEL_CONCURRENCY,
+    capacity=model_capacity,
+    max_queue=QUEUE_MAX_DEPTH,
+    budgets={'interactive': QUEUE_TIME_BUDGET, 'batch': BATCH_QUEUE_TIME_BUDGET}
+)
+
+# Metrics
+metrics = Registry()
+REQUESTS = metrics.counter('proxy_requests_total', 'HTTP requests served by the proxy', ('route', 'status'))
+REQUEST_LATENCY = metrics.histogram('proxy_request_duration_seconds', 'Time to serve a request, including streaming', ('route',))
+REQUESTS_IN_FLIGHT = metrics.gauge('proxy_requests_in_flight', 'Requests currently being served', ('route',))
+GENERATIONS_IN_FLIGHT = metrics.gauge('ollama_generations_in_flight', 'Upstream generations currently running', ('model',))
+TIME_TO_FIRST_TOKEN = metrics.histogram('ollama_time_to_first_token_seconds', 'Time from sending a generation to its first token', ('model',))
+TOKENS_PER_SECOND = metrics.histogram('ollama_tokens_per_second', 'Generation speed reported by Ollama', ('model',), RATE_BUCKETS)
+PROMPT_EVAL_SECONDS = metrics.histogram('ollama_prompt_eval_seconds', 'Prompt evaluation time reported by Ollama', ('model',))
+EVAL_SECONDS = metrics.histogram('ollama_eval_seconds', 'Token generation time reported by Ollama', ('model',))
+LOAD_SECONDS = metrics.histogram('ollama_load_seconds', 'Model load time reported by Ollama', ('model',))
+PROMPT_TOKENS = metrics.counter('ollama_prompt_tokens_total', 'Prompt tokens evaluated by Ollama', ('model',))
+GENERATED_TOKENS = metrics.counter('ollama_generated_tokens_total', 'Tokens generated by Ollama', ('model',))
+UPSTREAM_ERRORS = metrics.counter('ollama_upstream_errors_total', 'Failed upstream generations', ('backend', 'kind'))
+REUSED_PROMPT_TOKENS = metrics.counter('ollama_prompt_tokens_reused_total', 'Estimated prompt tokens in a prefix Ollama had cached from the previous turn', ('model',))
+TRIMMED_TOKENS = metrics.counter('proxy_context_trimmed_tokens_total', 'Estimated history tokens dropped to fit the context budget', ('model',))
+CLIENT_DISCONNECTS = metrics.counter('proxy_client_disconnects_total', 'Chat clients that went away before their answer was complete', ('model',))
+CANCELLED_GENERATIONS = metrics.counter('ollama_generations_cancelled_total', 'Upstream generations aborted because no client was left', ('model',))
+BROADCAST_SKIPS = metrics.counter('proxy_broadcast_skips_total', 'Broadcast viewers skipped ahead after overflowing their buffer')
+BROADCAST_DROPS = metrics.counter('proxy_broadcast_drops_total', 'Broadcast viewers dropped for reading too slowly')
+CHAT_OUTCOMES = metrics.counter('proxy_chat_requests_total', 'Chat requests by how they were answered', ('model', 'outcome'))
+EMBED_TEXTS = metrics.counter('proxy_embed_texts_total', 'Texts embedded by how they were answered', ('model', 'outcome'))
+EMBED_BATCH_TEXTS = metrics.histogram('ollama_embed_batch_texts', 'Texts per upstream embedding call', ('model',), buckets=RATE_BUCKETS)
+SEMANTIC_LOOKUPS = metrics.counter('proxy_semantic_cache_lookups_total', 'Semantic cache lookups by result', ('model', 'outcome'))
+POSTPROCESS_SECONDS = metrics.counter('proxy_postprocess_seconds_total', 'Time spent in each output post-processing stage', ('stage',))
+POSTPROCESS_CHUNKS = metrics.counter('proxy_postprocess_chunks_total', 'Chunks run through output post-processing')
+CASCADE_ROUTES = metrics.counter('proxy_cascade_requests_total', 'Cascaded chats by the tier that answered and why', ('model', 'tier', 'reason'))
+POSTPROCESS_STOPS = metrics.counter('proxy_postprocess_stops_total', 'Generations ended early by a post-processing stage', ('model', 'reason'))
+metrics.gauge(
+    'proxy_semantic_cache_entries', 'Answers held in the semantic cache',
+    callback=lambda: {(): len(semantic_cache) if semantic_cache is not None else 0}
+)
+metrics.gauge(
+    'proxy_broadcast_subscribers', 'Viewers attached to broadcasts',
+    callback=lambda: {(): broadcasts.subscribers()}
+)
+def queue_waiting():
+    waiting = {}
+    for model, info in scheduler.status().items():
+        label = model_label(model)
+        for priority, count in info['waiting'].items():
+            waiting[(label, priority)] = waiting.get((label, priority), 0) + count
+    return waiting
+
+metrics.gauge(
+    'proxy_queue_waiting', 'Requests waiting for a generation slot', ('model', 'priority'),
+    callback=queue_waiting
+)
+metrics.gauge(
+    'ollama_backend_available', 'Whether a backend is receiving traffic', ('backend',),
+    callback=lambda: {(backend.url,): int(backend.available) for backend in backends.backends}
+)
+metrics.gauge(
+    'ollama_concurrency_limit', 'Adaptive concurrency limit', ('backend', 'model'),
+    callback=lambda: {(backend, model): info['limit']
+                      for backend, models in (limiter.status() if limiter is not None else {}).items()
+                      for model, info in models.items()}
+)
+
+def installed_models():
+    """Full names of the models in the cached tag list; empty when it cannot be fetched."""
+    try:
+        tags = metadata_cache.get('tags', fetch_tags)
+    except Exception:
+        return set()
+    return {info.get('name') for info in tags.json().get('models', [])}
+
+def model_label(model):
+    """The `model` label for a client-supplied model name.
+
+    Names are normalized to their full tag, and names no backend lists
+    become "other", so clients cannot grow the label set without bound.
+    """
+    model = full_model_name(model)
+    return model if model in installed_models() else 'other'
+
+def record_generation(model, result):
+    """Record the timings Ollama reports in a response's final chunk; `model` is a `model_label`."""
+    eval_count = result.get('eval_count') or 0
+    eval_duration = (result.get('eval_duration') or 0) / 1e9
+    prompt_eval_duration = (result.get('prompt_eval_duration') or 0) / 1e9
+    if eval_duration > 0:
+        TOKENS_PER_SECOND.observe(eval_count / eval_duration, model)
+        EVAL_SECONDS.observe(eval_duration, model)
+    if prompt_eval_duration > 0:
+        PROMPT_EVAL_SECONDS.observe(prompt_eval_duration, model)
+    LOAD_SECONDS.observe((result.get('load_duration') or 0) / 1e9, model)
+    PROMPT_TOKENS.inc(model, amount=result.get('prompt_eval_count') or 0)
+    GENERATED_TOKENS.inc(model, amount=eval_count)
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+    REQUESTS_IN_FLIGHT.inc(request.endpoint)
+
+@app.after_request
+def record_request(response):
+    route = request.endpoint
+    started = g.request_started
+
+    # Streaming responses finish when the body is closed, not when the view returns
+    def finished():
+        REQUEST_LATENCY.observe(time.perf_counter() - started, route)
+        REQUESTS_IN_FLIGHT.dec(route)
+
+    REQUESTS.inc(route, response.status_code)
+    response.call_on_close(finished)
+    return response
+
+def error_response_status(e):
+    """HTTP status for an upstream failure."""
+    if isinstance(e, Cancelled):
+        # nginx's "client closed request"; only ever seen in logs and metrics
+        return 499
+    if isinstance(e, AdmissionError):
+        return e.status
+    if isinstance(e, PipelineError):
+        return 400
+    if isinstance(e, CircuitOpenError):
+        return 503
+    if isinstance(e, requests.Timeout):
+        return 504
+    if isinstance(e, (requests.ConnectionError, requests.HTTPError)):
+        return 502
+    return 500
+
+def error_response(e):
+    """Map an upstream failure to a JSON error with a fitting status code."""
+    if isinstance(e, AdmissionError):
+        return jsonify(e.to_dict()), e.status, {'Retry-After': str(e.retry_after)}
+    if isinstance(e, CircuitOpenError):
+        return jsonify({"error": str(e)}), 503, {'Retry-After': str(round(e.retry_after))}
+    return jsonify({"error": str(e)}), error_response_status(e)
+
+# Fingerprinted, precompressed static files
+assets = AssetManifest(app.static_folder)
+
+@app.context_processor
+def asset_helpers():
+    return {"asset_url": lambda filename: url_for('asset', filename=assets.url(filename))}
+
+@app.after_request
+def compress_response(response):
+    """Compress text responses for clients that accept zstd or gzip.
+
+    Streamed responses are compressed chunk by chunk with a flush after each
+    one, so tokens reach the client as soon as they would uncompressed.
+    """
+    if (response.mimetype not in COMPRESSIBLE or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or request.method == 'HEAD'):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding, COMPRESS_LEVEL)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < COMPRESS_MIN_SIZE:
+            return response
+        response.set_data(compress(body, encoding, COMPRESS_LEVEL))
+    response.headers['Content-Encoding'] = encoding
+    # The compressed bytes differ, but the representation is the same for revalidation
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
 
 # Routes
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    """Serve a fingerprinted static file; its URL changes with its content, so it never goes stale."""
+    item = assets.get(filename)
+    if item is None:
+        return jsonify({"error": "not found"}), 404
+    encoding = negotiate(request.headers.get('Accept-Encoding'))
+    body = item.encoded.get(encoding)
+    response = Response(body or item.body, mimetype=item.mimetype)
+    if body is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # Each encoding is its own representation, so it gets its own strong validator
+    response.set_etag(f"{item.digest}-{encoding}" if body is not None else item.digest)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response.make_conditional(request)
+
 @app.route('/')
 def index():
     return render_template('index.html', now=datetime.datetime.now())
 
+def cached_response(entry):
+    """Serve a cached JSON body with an ETag, answering 304 when the client has it."""
+    response = Response(entry.body, mimetype='application/json')
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+def fetch_tags():
+    response = backends.choose().client.get('/tags')
+    response.raise_for_status()
+    return response.content
+
+def fetch_version():
+    response = backends.choose().client.get('/version')
+    response.raise_for_status()
+    return json.dumps({
+        "app_version": "1.0.0",
+        "ollama_version": response.json().get('version', 'unknown'),
+        "python_version": os.environ.get('PYTHON_VERSION', '3.x')
+    }).encode()
+
 @app.route('/api/models', methods=['GET'])
 def get_models():
     try:
-        response = requests.get(f"{OLLAMA_API_URL}/tags")
-        return jsonify(response.json())
+        return cached_response(metadata_cache.get('tags', fetch_tags))
+    except Exception as e:
+        return error_response(e)
+
+def fetch_show(model):
+    response = backends.choose(model).client.post('/show', json={"model": model})
+    response.raise_for_status()
+    return response.json()
+
+# /api/show details by model digest, and the num_ctx bucket each model runs with
+model_info_cache = ModelInfoCache(fetch_show)
+context_sizer = ContextSizer(NUM_CTX_MIN, NUM_CTX_SHRINK_AFTER)
+
+def warm_options(model):
+    """Options to load a warm model with: the num_ctx its chats get, so they do not reload it."""
+    if not AUTO_NUM_CTX:
+        return None
+    info = model_info(model)
+    if info is None or not info['context_length']:
+        return None
+    return {"num_ctx": context_sizer.current_bucket(full_model_name(model), info['context_length'])}
+
+# Models kept loaded on every backend, with the num_ctx chats will use
+warm_pool = WarmPool(
+    backends,
+    WARM_MODELS,
+    keep_alive=lambda model: keep_alive_for(KEEP_ALIVE_POLICY, model),
+    options=warm_options,
+    hours=WARM_HOURS,
+    margin=WARM_MARGIN,
+    interval=HEALTH_CHECK_INTERVAL
+)
+warm_pool.start()
+
+def model_info(model):
+    """Return the /api/show details of an installed model (cached per digest), or None."""
+    try:
+        tags = metadata_cache.get('tags', fetch_tags)
+    except Exception:
+        return None
+    model_info_cache.retain(tags.etag, [info.get('digest') for info in tags.json().get('models', [])])
+    digest = model_digest(model)
+    if digest is None:
+        return None
+    try:
+        return model_info_cache.get(full_model_name(model), digest)
+    except Exception:
+        return None
+
+@app.route('/api/models/<path:model>', methods=['GET'])
+def get_model_info(model):
+    """A model's context length and size, and the num_ctx the proxy currently gives it."""
+    info = model_info(model)
+    if info is None:
+        return jsonify({"error": f"model '{model}' not found"}), 404
+    model = full_model_name(model)
+    sized = context_sizer.status().get(model, {})
+    return jsonify(dict(info, model=model, digest=model_digest(model), num_ctx=sized.get('num_ctx')))
+
+def model_digest(model):
+    """Return the digest of an installed model from the cached tag list, or None."""
+    model = full_model_name(model)
+    try:
+        models = metadata_cache.get('tags', fetch_tags).json().get('models', [])
+    except Exception:
+        return None
+    for info in models:
+        if info.get('name') == model:
+            return info.get('digest')
+    return None
+
+def wants_sse(data):
+    """Return True when the client asked for Server-Sent Events framing."""
+    if data.get('format') == 'sse':
+        return True
+    best = request.accept_mimetypes.best_match(['application/x-ndjson', 'text/event-stream'])
+    return best == 'text/event-stream'
+
+def build_payload(model, messages, options=None, stream=False, keep_alive=None, postprocess=None):
+    """Prepare a request to Ollama's /chat endpoint.
+
+    Messages are rebuilt in canonical form so a conversation's prefix is
+    byte-identical from turn to turn, and `keep_alive` defaults to the
+    configured per-model policy. A `postprocess` spec rides along under its
+    own key, which is stripped before the request is sent upstream, so it
+    is part of the coalescing and cache keys.
+    """
+    ollama_payload = {
+        "model": model,
+        "messages": canonical_messages(messages),
+        "stream": stream
+    }
+
+    # Add options if provided
+    if options:
+        ollama_payload["options"] = options
+
+    if keep_alive is None:
+        keep_alive = keep_alive_for(KEEP_ALIVE_POLICY, model)
+    if keep_alive is not None:
+        ollama_payload["keep_alive"] = keep_alive
+
+    if postprocess:
+        ollama_payload["postprocess"] = postprocess
+
+    return ollama_payload
+
+def postprocess_spec(data):
+    """The output pipeline for a request body's `stop`, `redact` and `max_chars`, plus the configured defaults."""
+    spec = pipeline_spec(data.get('stop'), data.get('redact'), data.get('max_chars')) or {}
+    redact = set(spec.get('redact', [])) | set(REDACT)
+    if redact:
+        spec['redact'] = sorted(redact)
+    if MAX_RESPONSE_CHARS > 0:
+        spec['max_chars'] = min(spec.get('max_chars') or MAX_RESPONSE_CHARS, MAX_RESPONSE_CHARS)
+    return spec or None
+
+# Ollama writes compact JSON; the fake server and some proxies add spaces
+DONE = re.compile(rb'"done":\s*true')
+EMPTY_CONTENT = re.compile(rb'"content":\s*""')
+
+def encode_chunk(line, sse=False):
+    """Frame one NDJSON line for the client."""
+    if sse:
+        return b"data: " + line + b"\n\n"
+    return line + b"\n"
+
+def streaming_response(chunks, status=200, headers=None, sse=False):
+    mimetype = 'text/event-stream' if sse else 'application/x-ndjson'
+    headers = dict(headers or {}, **{'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    return Response(stream_with_context(chunks), status=status, mimetype=mimetype, headers=headers)
+
+def assemble_result(lines, final):
+    """Build the response Ollama would return for a non-streaming request from its streamed lines."""
+    content = ''.join(json.loads(line).get('message', {}).get('content', '') for line in lines[:-1])
+    return dict(final, message={"role": "assistant", "content": content})
+
+def produce(flight, ollama_payload, ticket, on_result=None, conversation=None):
+    """Run one upstream generation, publishing Ollama's NDJSON lines to `flight`.
+
+    Ollama is always asked to stream, and its lines are relayed untouched.
+    Only the final line, which carries the timings, is parsed as it arrives;
+    the complete response is assembled from the buffered lines only when a
+    caller needs it (a non-streaming request, a cache, `on_result`). A
+    `conversation` pins the generation to that conversation's backend.
+
+    A `postprocess` spec in the payload runs the content through a pipeline
+    of stages (stop sequences, redaction, a length cap) before it is
+    published; when a stage ends the answer, the upstream connection is
+    closed so Ollama stops generating too.
+
+    The generation's time to first token (measured on Ollama's lines, before
+    post-processing) and speed feed the adaptive concurrency limit of its
+    backend and model. Only models in the tag list get a limit, so unknown
+    names sent by clients cannot grow the table.
+    """
+    model = ollama_payload['model']
+    upstream_payload = {key: value for key, value in ollama_payload.items() if key != 'postprocess'}
+    pipeline = build_pipeline(ollama_payload.get('postprocess'))
+    response = None
+    limit = None
+    headroom = None
+    label = model_label(model)
+    if limiter is not None:
+        headroom = lambda backend: limiter.headroom(backend.url, full_model_name(model))
+    backend = backends.choose(model, affinity=conversation, headroom=headroom)
+    if limiter is not None and label != 'other':
+        limit = limiter.get(backend.url, full_model_name(model))
+        generation = limit.start()
+    sample = {}
+    GENERATIONS_IN_FLIGHT.inc(label)
+    try:
+        with backends.lease(backend=backend):
+            started = time.perf_counter()
+            try:
+                response = backend.client.generate('/chat', json=dict(upstream_payload, stream=True), stream=True)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                backends.record_failure(backend, e)
+                raise
+            # Closing the connection is what makes Ollama stop generating
+            flight.on_cancel = functools.partial(abort, response)
+            if flight.cancelled:
+                raise Cancelled("every client disconnected")
+            flight.start(response.status_code)
+            if not response.ok:
+                UPSTREAM_ERRORS.inc(backend.url, f"http_{response.status_code}")
+            final = None
+            ttft = None
+
+            def timed(lines):
+                # Ollama's own lines are timed: a stage may hold text back
+                # (redaction keeps a window), which is not generation time
+                nonlocal ttft
+                for line in lines:
+                    if ttft is None and not EMPTY_CONTENT.search(line):
+                        ttft = time.perf_counter() - started
+                        TIME_TO_FIRST_TOKEN.observe(ttft, label)
+                    yield line
+
+            lines = (line for line in response.iter_lines() if line)
+            if response.ok:
+                lines = timed(lines)
+                if pipeline is not None:
+                    # Stops reading (and so closes the connection below) once a stage ends the answer
+                    lines = pipeline.process(lines)
+            for line in lines:
+                if flight.cancelled:
+                    raise Cancelled("every client disconnected")
+                # Lines are relayed as Ollama sent them; only the final one is parsed here
+                if response.ok and DONE.search(line):
+                    final = json.loads(line)
+                flight.publish(line)
+            if pipeline is not None:
+                for stage, seconds in pipeline.seconds.items():
+                    POSTPROCESS_SECONDS.inc(stage, amount=seconds)
+                POSTPROCESS_CHUNKS.inc(amount=pipeline.chunks)
+                if pipeline.stopped is not None:
+                    POSTPROCESS_STOPS.inc(label, pipeline.stopped)
+            result = None
+            if final is not None:
+                result = functools.partial(assemble_result, flight.chunks, final)
+                backend.resident.add(full_model_name(model))
+                record_generation(label, final)
+                if ttft is not None:
+                    sample['ttft'] = max(0.0, ttft - (final.get('load_duration') or 0) / 1e9)
+                if final.get('eval_duration'):
+                    sample['tps'] = final.get('eval_count', 0) / (final['eval_duration'] / 1e9)
+                if conversation is not None:
+                    saved = prefix_stats.record(conversation, backend.url, ollama_payload['messages'], final)
+                    REUSED_PROMPT_TOKENS.inc(label, amount=saved)
+                if on_result is not None:
+                    result = result()
+                    on_result(result)
+            flight.finish(result)
+    except Exception as e:
+        if flight.cancelled:
+            CANCELLED_GENERATIONS.inc(label)
+        else:
+            UPSTREAM_ERRORS.inc(backend.url, type(e).__name__)
+        flight.finish(error=e)
+    finally:
+        if response is not None:
+            response.close()
+        if limit is not None:
+            limit.finish(generation, **sample)
+        GENERATIONS_IN_FLIGHT.dec(label)
+        scheduler.release(ticket)
+        flights.remove(flight)
+
+def start_flight(ollama_payload, key, client, priority, on_result=None, conversation=None):
+    """Return `(flight, leader)` for a payload, starting the upstream generation if needed.
+
+    Identical concurrent requests share one flight when coalescing is enabled.
+    A new generation first waits for a slot from the admission scheduler.
+    The caller is subscribed to the flight and must `leave_flight` it.
+    """
+    if COALESCE_REQUESTS:
+        flight, leader = flights.join(key)
+    else:
+        flight, leader = Flight(key), True
+        flight.subscribe()
+    if leader:
+        try:
+            # Queued under the full tag, as slots are sized: `llama3` and
+            # `llama3:latest` are the same model and share one limit
+            ticket = scheduler.acquire(full_model_name(ollama_payload['model']), client, priority)
+        except AdmissionError as e:
+            flight.finish(error=e)
+            flights.remove(flight)
+            raise
+        flight.queue_time = ticket.queue_time
+        threading.Thread(
+            target=produce,
+            args=(flight, ollama_payload, ticket, on_result, conversation),
+            daemon=True
+        ).start()
+    return flight, leader
+
+def leave_flight(flight, model):
+    """Unsubscribe from `flight`; leaving before it is done counts as a disconnect."""
+    if not flight.done:
+        CLIENT_DISCONNECTS.inc(model_label(model))
+    flight.unsubscribe()
+
+def follow_chat(flight, model, sse=False, on_complete=None, headers=None):
+    """Stream a flight's chunks to the client, replaying anything already buffered.
+
+    The server closes this stream when a write to the client fails; while no
+    chunk is due the client's socket is polled so a disconnect during prompt
+    evaluation is noticed too.
+    """
+    alive = client_probe()
+
+    def generate():
+        try:
+            for line in flight.follow(alive=alive):
+                yield encode_chunk(line, sse)
+            if flight.error is not None:
+                yield encode_chunk(json.dumps({"error": str(flight.error)}).encode(), sse)
+            elif flight.result is not None and on_complete is not None:
+                on_complete(flight.result)
+        finally:
+            leave_flight(flight, model)
+
+    return streaming_response(generate(), flight.status, headers, sse)
+
+def replay_lines(result):
+    """A completed response as Ollama would stream it: one content line, then the final line."""
+    content = dict(result, message=result['message'], done=False)
+    for key in ('done_reason', 'total_duration', 'load_duration', 'prompt_eval_count',
+                'prompt_eval_duration', 'eval_count', 'eval_duration'):
+        content.pop(key, None)
+    final = dict(result, message={"role": "assistant", "content": ""})
+    return [json.dumps(content).encode(), json.dumps(final).encode()]
+
+def replay_chat(result, sse=False, headers=None):
+    """Stream a completed response as one content chunk followed by the final chunk."""
+    chunks = (encode_chunk(line, sse) for line in replay_lines(result))
+    return streaming_response(chunks, headers=headers, sse=sse)
+
+def client_id():
+    """Identify the caller for fair queuing."""
+    return request.headers.get('X-Client-Id') or request.remote_addr
+
+def client_probe():
+    """Return a function telling whether the current request's client is still connected.
+
+    It peeks at the client socket without blocking: a readable socket with no
+    data means the client closed the connection. Returns None outside a
+    request, or when the server does not expose the socket.
+    """
+    if not has_request_context():
+        return None
+    sock = request.environ.get('gunicorn.socket') or request.environ.get('werkzeug.socket')
+    if sock is None:
+        return None
+
+    def connected():
+        try:
+            timeout = sock.gettimeout()
+            sock.settimeout(0)
+            try:
+                return sock.recv(1, socket.MSG_PEEK) != b''
+            finally:
+                sock.settimeout(timeout)
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+
+    return connected
+
+def wait_for_client(ready, alive, interval=1.0):
+    """Block until `ready(timeout)` is true, raising Cancelled if the client goes away first."""
+    if alive is None:
+        ready(None)
+        return
+    while not ready(interval):
+        if not alive():
+            raise Cancelled("client disconnected")
+
+def request_priority(data):
+    return request.headers.get('X-Priority') or data.get('priority') or 'interactive'
+
+def reply_tokens(options):
+    """Tokens to leave for the reply: num_predict, or CONTEXT_REPLY_TOKENS when it is unset or unbounded."""
+    num_predict = (options or {}).get('num_predict') or 0
+    return num_predict if num_predict > 0 else CONTEXT_REPLY_TOKENS
+
+def context_budget(options):
+    """Prompt token budget for a request: its context window minus room for the reply."""
+    options = options or {}
+    budgets = []
+    if CONTEXT_TOKEN_BUDGET > 0:
+        budgets.append(CONTEXT_TOKEN_BUDGET)
+    if options.get('num_ctx'):
+        budgets.append(max(options['num_ctx'] - reply_tokens(options), 1))
+    return min(budgets) if budgets else 0
+
+def size_context(ollama_payload, headers):
+    """Give a request the smallest stable num_ctx bucket that fits its prompt and reply.
+
+    Requests that set num_ctx themselves are left alone, as are models whose
+    context length is unknown. Returns True when num_ctx was set here.
+    """
+    options = ollama_payload.get('options') or {}
+    if not AUTO_NUM_CTX or options.get('num_ctx'):
+        return False
+    info = model_info(ollama_payload['model'])
+    if info is None or not info['context_length']:
+        return False
+    needed = sum(message_tokens(message) for message in ollama_payload['messages']) + reply_tokens(options)
+    num_ctx = context_sizer.size(full_model_name(ollama_payload['model']), needed, info['context_length'])
+    # A copy, since the options may be shared with another payload (the cascade's fast tier)
+    ollama_payload['options'] = dict(options, num_ctx=num_ctx)
+    headers['X-Num-Ctx'] = str(num_ctx)
+    return True
+
+def fit_context(ollama_payload, headers):
+    """Trim the payload's oldest turns to its context budget, reporting what was dropped."""
+    messages, dropped, tokens = trim_messages(
+        ollama_payload['messages'],
+        context_budget(ollama_payload.get('options')),
+        CONTEXT_TRIM_TARGET
+    )
+    if dropped:
+        ollama_payload['messages'] = messages
+        headers['X-Context-Trimmed'] = f"messages={dropped}; tokens={tokens}"
+        TRIMMED_TOKENS.inc(model_label(ollama_payload['model']), amount=tokens)
+
+def semantic_query(ollama_payload):
+    """Return `(namespace, vector)` for a semantic cache lookup, or None.
+
+    Only first-turn questions qualify: a follow-up depends on the earlier
+    turns, not just its own wording. The namespace covers the model, the
+    system prompt, the options and the post-processing, so answers never
+    cross those.
+    """
+    messages = ollama_payload['messages']
+    if not messages or messages[-1]['role'] != 'user' or any(m['role'] == 'assistant' for m in messages):
+        return None
+    system = '\n'.join(m['content'] for m in messages if m['role'] == 'system')
+    namespace = canonical_key(
+        model_digest(ollama_payload['model']) or ollama_payload['model'],
+        hashlib.sha256(system.encode('utf-8')).hexdigest(),
+        ollama_payload.get('options') or {},
+        ollama_payload.get('postprocess')
+    )
+    try:
+        vectors, _ = embed_texts(SEMANTIC_CACHE_MODEL, [messages[-1]['content']])
+    except Exception:
+        # Without an embedding the request simply skips the semantic cache
+        return None
+    return namespace, vectors[0]
+
+def open_chat(ollama_payload, client=None, priority='interactive', conversation=None, semantic=False):
+    """Answer a payload from the response cache or attach it to an upstream generation.
+
+    Returns `(cached, flight, headers)`: `cached` is a completed response from
+    the cache (and `flight` None), otherwise `flight` has started and its
+    status is known. Deterministic requests are answered from the response
+    cache when an identical request (same model digest, messages and options)
+    has completed before, and identical requests in flight share one
+    upstream generation. With `semantic`, a first-turn question close enough
+    to one answered before gets that answer. Histories over the context
+    budget are trimmed first, after num_ctx is sized for the request.
+
+    A num_ctx sized here holds the whole prompt and reply, so it does not
+    change the answer and is left out of the keys; requests on either side
+    of a bucket change share the cache and the generation.
+    """
+    headers = {}
+    label = model_label(ollama_payload['model'])
+    sized = size_context(ollama_payload, headers)
+    fit_context(ollama_payload, headers)
+    keyed = ollama_payload
+    if sized:
+        options = {name: value for name, value in ollama_payload['options'].items() if name != 'num_ctx'}
+        keyed = dict(ollama_payload, options=options) if options else {
+            name: value for name, value in ollama_payload.items() if name != 'options'
+        }
+    key = canonical_key(
+        model_digest(ollama_payload['model']) or ollama_payload['model'],
+        {name: value for name, value in keyed.items() if name != 'stream'}
+    )
+    cacheable = response_cache is not None and is_deterministic(ollama_payload.get('options'))
+    if cacheable:
+        cached = response_cache.get(key)
+        if cached is not None:
+            CHAT_OUTCOMES.inc(label, 'cache_hit')
+            headers['X-Cache'] = 'HIT'
+            return cached, None, headers
+
+    query = semantic_query(keyed) if semantic and semantic_cache is not None else None
+    if query is not None:
+        found = semantic_cache.get(*query)
+        SEMANTIC_LOOKUPS.inc(label, 'miss' if found is None else 'hit')
+        if found is not None:
+            CHAT_OUTCOMES.inc(label, 'semantic_hit')
+            headers['X-Semantic-Cache'] = f"HIT; similarity={found[1]:.3f}"
+            return found[0], None, headers
+        headers['X-Semantic-Cache'] = 'MISS'
+
+    def store(result):
+        if cacheable:
+            response_cache.put(key, result)
+        if query is not None:
+            semantic_cache.put(*query, result)
+
+    flight, leader = start_flight(
+        ollama_payload, key, client, priority,
+        store if cacheable or query is not None else None, conversation
+    )
+    CHAT_OUTCOMES.inc(label, 'generated' if leader else 'coalesced')
+    headers['X-Coalesced'] = '0' if leader else '1'
+    if leader:
+        headers['X-Queue-Time'] = f"{flight.queue_time:.3f}"
+    if cacheable:
+        headers['X-Cache'] = 'MISS'
+
+    # Wait for Ollama to answer; failures before that become an error response
+    try:
+        wait_for_client(flight.started.wait, client_probe())
+    except Cancelled:
+        leave_flight(flight, ollama_payload['model'])
+        raise
+    if flight.status is None:
+        leave_flight(flight, ollama_payload['model'])
+        raise flight.error
+    return None, flight, headers
+
+def flight_outcome(flight):
+    """Wait for a flight and return `(status, body)` as a non-streaming response."""
+    result = flight.wait()
+    if flight.error is not None:
+        raise flight.error
+    if result is None:
+        # Ollama rejected the request; relay its error body
+        return flight.status, json.loads(flight.chunks[0]) if flight.chunks else {}
+    return flight.status, result
+
+def complete_chat(ollama_payload, client=None, priority='interactive', conversation=None, semantic=False):
+    """Run a payload to completion and return `(status, body)`; usable outside a request."""
+    cached, flight, _ = open_chat(ollama_payload, client, priority, conversation, semantic)
+    if cached is not None:
+        return 200, cached
+    try:
+        return flight_outcome(flight)
+    finally:
+        leave_flight(flight, ollama_payload['model'])
+
+def forward_chat(ollama_payload, sse=False, on_complete=None, client=None, priority='interactive',
+                 conversation=None, semantic=False):
+    """Send a prepared payload to Ollama; `on_complete` receives the assistant message."""
+    cached, flight, headers = open_chat(ollama_payload, client, priority, conversation, semantic)
+
+    def completed(result):
+        if on_complete is not None:
+            on_complete(result['message'])
+
+    if cached is not None:
+        completed(cached)
+        if ollama_payload['stream']:
+            return replay_chat(cached, sse, headers=headers)
+        return jsonify(cached), 200, headers
+
+    # Stream tokens back as they are generated
+    if ollama_payload['stream']:
+        return follow_chat(flight, ollama_payload['model'], sse=sse, on_complete=completed, headers=headers)
+
+    try:
+        wait_for_client(lambda timeout: flight.wait(timeout) is not None or flight.done, client_probe())
+    finally:
+        leave_flight(flight, ollama_payload['model'])
+    result = flight.result
+    if flight.error is not None:
+        raise flight.error
+    if result is None:
+        # Ollama rejected the request; relay its error body as sent
+        return Response(b''.join(flight.chunks), status=flight.status, mimetype='application/json', headers=headers)
+    completed(result)
+
+    # Return the response
+    return Response(json.dumps(result), status=flight.status, mimetype='application/json', headers=headers)
+
+def embed_upstream(texts, model, params):
+    """Embed a batch of texts on one backend and return the vectors."""
+    backend = backends.choose(model)
+    with backends.lease(backend=backend):
+        try:
+            response = backend.client.generate('/embed', json=dict(params, model=model, input=texts))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            backends.record_failure(backend, e)
+            UPSTREAM_ERRORS.inc(backend.url, type(e).__name__)
+            raise
+    if not response.ok:
+        UPSTREAM_ERRORS.inc(backend.url, f"http_{response.status_code}")
+        raise requests.HTTPError(response=response)
+    EMBED_BATCH_TEXTS.observe(len(texts), model_label(model))
+    return response.json()['embeddings']
+
+# Concurrent embedding requests merged into shared upstream calls
+embed_batcher = EmbedBatcher(embed_upstream, EMBED_BATCH_SIZE, EMBED_BATCH_WAIT)
+
+def embed_texts(model, texts, params=None):
+    """Return float32 vectors for `texts` and how many of them were not embedded again."""
+    params = params or {}
+    settings = {key: value for key, value in params.items() if key != 'keep_alive'}
+    namespace = model_digest(model) or model
+    keys = [canonical_key(text, settings) for text in texts]
+    label = model_label(model)
+    vectors = embedding_store.get(namespace, keys) if embedding_store is not None else {}
+    EMBED_TEXTS.inc(label, 'cached', amount=sum(key in vectors for key in keys))
+
+    # Each distinct uncached text is embedded once, however often it repeats
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in vectors:
+            missing.setdefault(key, text)
+    if missing:
+        embedded = embed_batcher.embed(canonical_key(model, settings), list(missing.values()), model, params)
+        fresh = dict(zip(missing, (np.asarray(vector, dtype='<f4') for vector in embedded)))
+        EMBED_TEXTS.inc(label, 'embedded', amount=len(fresh))
+        if embedding_store is not None:
+            embedding_store.put(namespace, fresh)
+        vectors.update(fresh)
+    return [vectors[key] for key in keys], len(texts) - len(missing)
+
+def wants_npy():
+    if request.args.get('format') == 'npy':
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', 'application/x-npy'])
+    return best == 'application/x-npy'
+
+@app.route('/api/embed', methods=['POST'])
+def embed():
+    """Ollama's /api/embed with a vector cache and request batching.
+
+    Vectors are cached by model digest, settings and text, so repeated
+    chunks are never re-embedded. With `?format=npy` (or `Accept:
+    application/x-npy`) the result is a float32 .npy array of shape
+    (texts, dimensions) instead of JSON.
+    """
+    try:
+        data = request.json or {}
+        model = data.get('model')
+        texts = data.get('input', [])
+        if isinstance(texts, str):
+            texts = [texts]
+        params = {key: data[key] for key in ('truncate', 'dimensions', 'options', 'keep_alive') if key in data}
+        vectors, reused = embed_texts(model, texts, params)
+
+        headers = {'X-Embed-Cached': str(reused)}
+        if wants_npy():
+            buffer = io.BytesIO()
+            np.save(buffer, np.stack(vectors) if vectors else np.zeros((0, 0), '<f4'))
+            return Response(buffer.getvalue(), mimetype='application/x-npy', headers=headers)
+        return jsonify({"model": model, "embeddings": [vector.tolist() for vector in vectors]}), 200, headers
+    except requests.HTTPError as e:
+        if e.response is not None:
+            return Response(e.response.content, status=e.response.status_code, mimetype='application/json')
+        return error_response(e)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return error_response(e)
+
+def cascade_chat(data, ollama_payload, **kwargs):
+    """Answer a chat for a large model from its fast tier when it looks simple enough.
+
+    The fast answer is generated in full so it can be checked before the
+    client sees any of it. When it trips an escalation signal (or the fast
+    model fails), the large model answers instead, streamed as usual. The
+    answering tier and the reason are reported in `X-Model-Tier` and
+    `X-Cascade-Reason`.
+    """
+    model = ollama_payload['model']
+    tier = request.headers.get('X-Model-Tier') or data.get('tier')
+    fast, reason = cascade.route(model, ollama_payload['messages'], tier)
+    if fast is not None:
+        fast_payload = build_payload(
+            fast,
+            ollama_payload['messages'],
+            ollama_payload.get('options'),
+            ollama_payload['stream'],
+            data.get('keep_alive'),
+            ollama_payload.get('postprocess')
+        )
+        try:
+            status, result = complete_chat(fast_payload, kwargs['client'], kwargs['priority'],
+                                           kwargs['conversation'], kwargs['semantic'])
+            escalation = cascade.escalation(result) if status == 200 else 'fast_error'
+        except Cancelled:
+            raise
+        except Exception:
+            escalation = 'fast_error'
+        if escalation is None:
+            CASCADE_ROUTES.inc(model_label(model), 'fast', reason)
+            headers = {'X-Model-Tier': 'fast', 'X-Cascade-Reason': reason}
+            if ollama_payload['stream']:
+                return replay_chat(result, kwargs['sse'], headers=headers)
+            return Response(json.dumps(result), mimetype='application/json', headers=headers)
+        reason = escalation
+
+    CASCADE_ROUTES.inc(model_label(model), 'large', reason)
+    response = make_response(forward_chat(ollama_payload, **kwargs))
+    response.headers['X-Model-Tier'] = 'large'
+    response.headers['X-Cascade-Reason'] = reason
+    return response
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
@@ -32,44 +1110,386 @@ def chat():
         # Get request data
         data = request.json
 
-        model = data.get('model')
-        messages = data.get('messages', [])
-        options = data.get('options', {})
-
-        # Prepare request to Ollama
-        ollama_payload = {
-            "model": model,
-            "messages": messages,
-            "stream": False
-        }
+        ollama_payload = build_payload(
+            data.get('model'),
+            data.get('messages', []),
+            data.get('options', {}),
+            bool(data.get('stream', False)),
+            data.get('keep_alive'),
+            postprocess_spec(data)
+        )
+        options = dict(
+            sse=wants_sse(data),
+            client=client_id(),
+            priority=request_priority(data),
+            conversation=request.headers.get('X-Conversation-Id') or data.get('conversation_id'),
+            semantic=bool(data.get('semantic_cache')) or request.headers.get('X-Semantic-Cache') == '1'
+        )
+        if cascade is not None and cascade.fast_model(ollama_payload['model']) is not None:
+            return cascade_chat(data, ollama_payload, **options)
+        return forward_chat(ollama_payload, **options)
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/chat/batch', methods=['POST'])
+def chat_batch():
+    """Run NDJSON conversations with bounded parallelism, streaming each result as it finishes.
+
+    Each input line is a /api/chat body; each output line is its result (or
+    `error`) tagged with the input's zero-based `index`. Input is read only as
+    fast as workers free up, so the batch is never held in memory.
+    """
+    concurrency = max(1, min(request.args.get('concurrency', BATCH_CONCURRENCY, type=int), BATCH_MAX_CONCURRENCY))
+    client = client_id()
+    priority = request.headers.get('X-Priority') or 'batch'
+    lines = iter(request.stream.readline, b'')
+    results = queue.Queue()
+
+    def run(index, line):
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            results.put({"index": index, "status": 400, "error": f"Invalid JSON: {e}"})
+            return
+        try:
+            status, body = complete_chat(
+                build_payload(data.get('model'), data.get('messages', []), data.get('options', {}),
+                              keep_alive=data.get('keep_alive'), postprocess=postprocess_spec(data)),
+                client,
+                priority,
+                data.get('conversation_id'),
+                bool(data.get('semantic_cache'))
+            )
+            output = dict(body, index=index, status=status)
+            if 'id' in data:
+                output['id'] = data['id']
+        except Exception as e:
+            output = {"index": index, "status": error_response_status(e), "error": str(e)}
+        results.put(output)
+
+    def generate():
+        index = 0
+        running = 0
+        exhausted = False
+        while True:
+            # Top up the workers before waiting for the next result
+            while not exhausted and running < concurrency:
+                line = next(lines, None)
+                if line is None:
+                    exhausted = True
+                elif line.strip():
+                    threading.Thread(target=run, args=(index, line), daemon=True).start()
+                    index += 1
+                    running += 1
+            if running == 0:
+                return
+            yield json.dumps(results.get()).encode() + b"\n"
+            running -= 1
+
+    return streaming_response(generate())
 
-        # Add options if provided
-        if options:
-            ollama_payload["options"] = options
+def run_job(job_id, ollama_payload, client, priority, flush_interval=0.25):
+    """Generate a job's answer in the background, storing its lines as they arrive."""
+    model = ollama_payload['model']
+    try:
+        cached, flight, _ = open_chat(ollama_payload, client, priority)
+    except Exception as e:
+        job_store.finish(job_id, 'error', error=str(e))
+        return
+    if cached is not None:
+        job_store.append(job_id, 0, replay_lines(cached))
+        job_store.finish(job_id, 'done', result=cached)
+        return
+
+    running_jobs[job_id] = flight
+    job_store.start(job_id)
+    try:
+        stored = 0
+        pending = []
+        flushed = time.monotonic()
+        for line in flight.follow(alive=lambda: job_id in running_jobs):
+            pending.append(line)
+            if time.monotonic() - flushed >= flush_interval:
+                # A deleted job stops here, which cancels its generation
+                if not job_store.append(job_id, stored, pending):
+                    return
+                stored += len(pending)
+                pending = []
+                flushed = time.monotonic()
+        if not job_store.append(job_id, stored, pending) or not flight.done:
+            return
+        if flight.error is not None:
+            job_store.finish(job_id, 'error', error=str(flight.error))
+        elif flight.result is None:
+            # Ollama rejected the request
+            body = json.loads(flight.chunks[0]) if flight.chunks else {}
+            job_store.finish(job_id, 'error', error=body.get('error', f"upstream status {flight.status}"))
+        else:
+            job_store.finish(job_id, 'done', result=flight.result)
+    finally:
+        running_jobs.pop(job_id, None)
+        leave_flight(flight, model)
 
-        # Send request to Ollama
-        response = requests.post(
-            f"{OLLAMA_API_URL}/chat",
-            json=ollama_payload
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """Start a chat that keeps generating server-side; returns its id at once."""
+    try:
+        data = request.json or {}
+        ollama_payload = build_payload(
+            data.get('model'),
+            data.get('messages', []),
+            data.get('options', {}),
+            keep_alive=data.get('keep_alive'),
+            postprocess=postprocess_spec(data)
         )
+        job_id = job_store.create(ollama_payload['model'], ollama_payload)
+        threading.Thread(
+            target=run_job,
+            args=(job_id, ollama_payload, client_id(), request_priority(data)),
+            daemon=True
+        ).start()
+        return jsonify({"id": job_id, "status": "queued"}), 202, {'Location': f"/api/jobs/{job_id}"}
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify(job)
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def delete_job(job_id):
+    running_jobs.pop(job_id, None)
+    if not job_store.delete(job_id):
+        return jsonify({"error": "job not found"}), 404
+    return '', 204
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Stream a job's lines, from `?offset=` or after the `Last-Event-ID` a reconnecting client sends.
+
+    Each SSE event's id is the line's offset, so EventSource resumes where it
+    left off. A job generating in this process is followed live; otherwise
+    the store is polled, which also covers jobs owned by another worker.
+    """
+    if job_store.get(job_id) is None:
+        return jsonify({"error": "job not found"}), 404
+    offset = request.args.get('offset', 0, type=int)
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    if last_event_id.isdigit():
+        offset = int(last_event_id) + 1
+    sse = request.accept_mimetypes.best_match(['text/event-stream', 'application/x-ndjson']) != 'application/x-ndjson'
+    alive = client_probe()
+
+    def frame(seq, line):
+        if sse:
+            return b"id: %d\ndata: %s\n\n" % (seq, line)
+        return line + b"\n"
+
+    def generate():
+        seq = offset
+        flight = running_jobs.get(job_id)
+        if flight is not None:
+            for line in flight.follow(start=offset, alive=alive):
+                yield frame(seq, line)
+                seq += 1
+        else:
+            while True:
+                # Lines are stored before the job is finished, so none are missed
+                job = job_store.get(job_id)
+                for line in job_store.lines(job_id, seq):
+                    yield frame(seq, line)
+                    seq += 1
+                if job is None or job['status'] not in ACTIVE:
+                    break
+                if alive is not None and not alive():
+                    return
+                time.sleep(0.25)
+        job = job_store.get(job_id)
+        error = flight.error if flight is not None and flight.error is not None else job and job['error']
+        if error:
+            yield frame(seq, json.dumps({"error": str(error)}).encode())
 
-        # Return the response
-        return jsonify(response.json())
+    return streaming_response(generate(), sse=sse)
+
+def run_broadcast(channel, ollama_payload, client, priority):
+    """Generate a broadcast's answer, publishing each line to its viewers."""
+    try:
+        cached, flight, _ = open_chat(ollama_payload, client, priority)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        channel.finish(error=str(e))
+        return
+    if cached is not None:
+        for line in replay_lines(cached):
+            channel.publish(line)
+        channel.finish()
+        return
+    try:
+        for line in flight.follow():
+            channel.publish(line)
+        if flight.error is not None:
+            channel.finish(error=str(flight.error))
+        elif flight.result is None:
+            channel.finish(error=f"upstream status {flight.status}")
+        else:
+            channel.finish()
+    finally:
+        leave_flight(flight, ollama_payload['model'])
+
+@app.route('/api/broadcasts', methods=['POST'])
+def create_broadcast():
+    """Start a chat that any number of viewers can watch; returns its id at once."""
+    try:
+        data = request.json or {}
+        ollama_payload = build_payload(
+            data.get('model'),
+            data.get('messages', []),
+            data.get('options', {}),
+            keep_alive=data.get('keep_alive'),
+            postprocess=postprocess_spec(data)
+        )
+        channel = broadcasts.create()
+        threading.Thread(
+            target=run_broadcast,
+            args=(channel, ollama_payload, client_id(), request_priority(data)),
+            daemon=True
+        ).start()
+        return jsonify({"id": channel.id, "watch": f"/api/broadcasts/{channel.id}/watch"}), 201
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/broadcasts/<broadcast_id>', methods=['GET'])
+def get_broadcast(broadcast_id):
+    channel = broadcasts.get(broadcast_id)
+    if channel is None:
+        return jsonify({"error": "broadcast not found"}), 404
+    return jsonify(channel.status())
+
+@app.route('/api/broadcasts/<broadcast_id>/watch', methods=['GET'])
+def watch_broadcast(broadcast_id):
+    """Stream a broadcast to one viewer as SSE (or NDJSON), starting with the answer so far."""
+    channel = broadcasts.get(broadcast_id)
+    if channel is None:
+        return jsonify({"error": "broadcast not found"}), 404
+    sse = request.accept_mimetypes.best_match(['text/event-stream', 'application/x-ndjson']) != 'application/x-ndjson'
+    subscriber = channel.subscribe()
+    alive = client_probe()
+
+    def generate():
+        lines = channel.follow(subscriber, alive=alive)
+        try:
+            for line in lines:
+                yield encode_chunk(line, sse)
+        finally:
+            lines.close()
+
+    return streaming_response(generate(), sse=sse)
+
+@app.route('/api/sessions', methods=['POST'])
+def create_session():
+    data = request.json or {}
+    if not data.get('model'):
+        return jsonify({"error": "model is required"}), 400
+    session = session_store.create(data['model'], data.get('system'), data.get('options'))
+    return jsonify(session), 201
+
+@app.route('/api/sessions/<session_id>', methods=['GET'])
+def get_session(session_id):
+    session = session_store.get(session_id)
+    if session is None:
+        return jsonify({"error": "session not found"}), 404
+    session['messages'] = session_store.messages(session_id)
+    session['prompt_cache'] = prefix_stats.get(session_id)
+    return jsonify(session)
+
+@app.route('/api/sessions/<session_id>', methods=['DELETE'])
+def delete_session(session_id):
+    if not session_store.delete(session_id):
+        return jsonify({"error": "session not found"}), 404
+    return '', 204
+
+@app.route('/api/sessions/<session_id>/messages', methods=['POST'])
+def session_chat(session_id):
+    try:
+        # Get request data: only the new turn, plus any settings that changed
+        data = request.json or {}
+        content = data.get('content')
+        if content is None:
+            return jsonify({"error": "content is required"}), 400
+
+        session = session_store.get(session_id)
+        if session is None:
+            return jsonify({"error": "session not found"}), 404
+        if any(key in data for key in ('model', 'system', 'options')):
+            session_store.update(session_id, data.get('model'), data.get('system'), data.get('options'))
+            session = session_store.get(session_id)
+
+        user_message = {"role": "user", "content": content}
+        messages = []
+        if session['system']:
+            messages.append({"role": "system", "content": session['system']})
+        messages.extend(session_store.messages(session_id))
+        messages.append(user_message)
+
+        def on_complete(assistant_message):
+            session_store.append(session_id, user_message, assistant_message)
+
+        ollama_payload = build_payload(
+            session['model'],
+            messages,
+            session['options'],
+            bool(data.get('stream', False)),
+            postprocess=postprocess_spec(data)
+        )
+        return forward_chat(
+            ollama_payload,
+            sse=wants_sse(data),
+            on_complete=on_complete,
+            client=client_id(),
+            priority=request_priority(data),
+            conversation=session_id
+        )
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/conversations/<conversation_id>', methods=['GET'])
+def conversation_stats(conversation_id):
+    """Prompt-cache reuse for a conversation sent with X-Conversation-Id."""
+    stats = prefix_stats.get(conversation_id)
+    if stats is None:
+        return jsonify({"error": "conversation not found"}), 404
+    return jsonify(stats)
+
+@app.route('/api/backends', methods=['GET'])
+def backend_status():
+    return jsonify({"backends": backends.status()})
+
+@app.route('/api/status', methods=['GET'])
+def status():
+    """Backend health plus the residency of every model in the warm pool."""
+    return jsonify({"backends": backends.status(), "warm": warm_pool.status()})
+
+@app.route('/api/limits', methods=['GET'])
+def limits():
+    """Adaptive concurrency limits by backend and model, with their recent changes."""
+    return jsonify(limiter.status() if limiter is not None else {})
+
+@app.route('/api/queue', methods=['GET'])
+def queue_status():
+    """Admission queue state per model; `?client=<id>` adds that client's positions and ETAs."""
+    return jsonify({"models": scheduler.status(request.args.get('client'))})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/version', methods=['GET'])
 def version():
     try:
         # Get Ollama version
-        response = requests.get(f"{OLLAMA_API_URL}/version")
-        ollama_version = response.json().get('version', 'unknown')
-
-        return jsonify({
-            "app_version": "1.0.0",
-            "ollama_version": ollama_version,
-            "python_version": os.environ.get('PYTHON_VERSION', '3.x')
-        })
+        return cached_response(metadata_cache.get('version', fetch_version))
     except Exception as e:
         return jsonify({
             "app_version": "1.0.0",
@@ -79,4 +1499,5 @@ def version():
         })
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # Development server only; production runs `gunicorn --config gunicorn.conf.py app:app`
+    app.run(host='0.0.0.0', port=int(os.getenv('PORT', '5000')), debug=os.getenv('FLASK_DEBUG', '1') == '1')
\ No newline at end of file
@@ -0,0 +1,51 @@
+import hashlib
+import mimetypes
+import os
+
+from compress import available_encodings, compress
+
+
+class Asset:
+    def __init__(self, body, mimetype):
+        self.body = body
+        self.mimetype = mimetype
+        self.digest = hashlib.sha256(body).hexdigest()[:12]
+        # encoding -> precompressed body, kept only where it is smaller
+        self.encoded = {}
+        for encoding in available_encodings():
+            encoded = compress(body, encoding, level=9)
+            if len(encoded) < len(body):
+                self.encoded[encoding] = encoded
+
+
+class AssetManifest:
+    """Static files fingerprinted by content hash and compressed once at startup.
+
+    `url(filename)` returns `js/app.<hash>.js`, so a changed file gets a new
+    URL and every version can be cached by browsers indefinitely.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.assets = {}
+        self.fingerprinted = {}
+        for root, _, files in os.walk(folder):
+            for name in files:
+                path = os.path.join(root, name)
+                filename = os.path.relpath(path, folder).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    body = f.read()
+                asset = Asset(body, mimetypes.guess_type(name)[0] or 'application/octet-stream')
+                stem, ext = os.path.splitext(filename)
+                self.assets[filename] = asset
+                self.fingerprinted[f"{stem}.{asset.digest}{ext}"] = asset
+
+    def url(self, filename):
+        asset = self.assets.get(filename)
+        if asset is None:
+            return filename
+        stem, ext = os.path.splitext(filename)
+        return f"{stem}.{asset.digest}{ext}"
+
+    def get(self, fingerprinted):
+        return self.fingerprinted.get(fingerprinted)
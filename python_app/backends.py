@@ -0,0 +1,192 @@
+import datetime
+import hashlib
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+
+def full_model_name(model):
+    """Ollama reports models by their full tag; `llama3` means `llama3:latest`."""
+    if model and ':' not in model:
+        return f"{model}:latest"
+    return model
+
+
+def rendezvous(key, backends):
+    """Pick the backend with the highest hash score for `key`.
+
+    Rendezvous hashing keeps a key on the same backend as long as that
+    backend is available, and only moves the keys of a backend that leaves.
+    """
+    def score(backend):
+        return hashlib.blake2b(f"{key}|{backend.url}".encode(), digest_size=8).digest()
+    return max(backends, key=score)
+
+
+def parse_time(value):
+    """Parse an RFC 3339 timestamp from Ollama into a Unix time, or None."""
+    if not value:
+        return None
+    # Ollama reports nanoseconds, which fromisoformat does not accept
+    value = re.sub(r'(\.\d{6})\d+', r'\1', value.replace('Z', '+00:00'))
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+class Backend:
+    """One Ollama host and what the proxy knows about it."""
+
+    def __init__(self, url, client):
+        self.url = url
+        self.client = client
+        self.outstanding = 0
+        self.resident = set()
+        # model -> wall-clock time its keep_alive runs out, from /api/ps
+        self.expires = {}
+        self.latency = None
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.last_error = None
+
+    @property
+    def available(self):
+        return time.monotonic() >= self.ejected_until and self.client.breaker.state != 'open'
+
+    def status(self):
+        return {
+            "url": self.url,
+            "available": self.available,
+            "outstanding": self.outstanding,
+            "resident": sorted(self.resident),
+            "latency": None if self.latency is None else round(self.latency, 4),
+            "failures": self.failures,
+            "circuit": self.client.breaker.state,
+            "last_error": self.last_error
+        }
+
+
+class BackendPool:
+    """Routes requests across Ollama hosts.
+
+    A request goes to the available backend with the fewest outstanding
+    requests, preferring hosts that already have the model loaded (as
+    reported by their /api/ps) to avoid a model load; conversations stick
+    to one backend. A background checker
+    polls every backend's /api/ps and ejects hosts that fail
+    `failure_threshold` checks in a row or answer slower than `max_latency`.
+    """
+
+    def __init__(self, backends, check_interval=5.0, max_latency=2.0, failure_threshold=3, eject_time=30.0,
+                 affinity_slack=4):
+        self.backends = backends
+        self.affinity_slack = affinity_slack
+        self.check_interval = check_interval
+        self.max_latency = max_latency
+        self.failure_threshold = failure_threshold
+        self.eject_time = eject_time
+        self.lock = threading.Lock()
+        self.checker = None
+
+    def available(self):
+        return [backend for backend in self.backends if backend.available]
+
+    def choose(self, model=None, affinity=None, headroom=None):
+        """Pick the backend for a request on `model` (any model when None).
+
+        Requests with an `affinity` key (a conversation id) are pinned to the
+        same backend by rendezvous hashing so its prompt cache is reused,
+        unless that backend has `affinity_slack` more outstanding requests
+        than the least loaded one. With `headroom` (a function of a backend),
+        backends it reports as full are passed over while others have room.
+        """
+        candidates = self.available()
+        if not candidates:
+            # Everything is ejected: fall back to the host whose ejection ends first
+            return min(self.backends, key=lambda backend: backend.ejected_until)
+        if headroom is not None:
+            candidates = [backend for backend in candidates if headroom(backend) > 0] or candidates
+        if affinity is not None:
+            pinned = rendezvous(affinity, candidates)
+            fewest = min(backend.outstanding for backend in candidates)
+            if pinned.outstanding <= fewest + self.affinity_slack:
+                return pinned
+        if model is not None:
+            model = full_model_name(model)
+            resident = [backend for backend in candidates if model in backend.resident]
+            if resident:
+                candidates = resident
+        fewest = min(backend.outstanding for backend in candidates)
+        return random.choice([backend for backend in candidates if backend.outstanding == fewest])
+
+    @contextmanager
+    def lease(self, model=None, backend=None):
+        """Hold an outstanding-request count on a backend for the duration of a call."""
+        backend = backend or self.choose(model)
+        with self.lock:
+            backend.outstanding += 1
+        try:
+            yield backend
+        finally:
+            with self.lock:
+                backend.outstanding -= 1
+
+    def record_failure(self, backend, error):
+        with self.lock:
+            backend.failures += 1
+            backend.last_error = str(error)
+            if backend.failures >= self.failure_threshold:
+                backend.ejected_until = time.monotonic() + self.eject_time
+
+    def record_success(self, backend):
+        with self.lock:
+            backend.failures = 0
+            backend.last_error = None
+
+    def check(self, backend):
+        """Poll one backend's loaded models and health."""
+        started = time.monotonic()
+        try:
+            response = backend.client.get('/ps', timeout=self.max_latency * 2)
+            response.raise_for_status()
+            models = response.json().get('models') or []
+        except Exception as e:
+            self.record_failure(backend, e)
+            return
+        elapsed = time.monotonic() - started
+        backend.latency = elapsed if backend.latency is None else 0.7 * backend.latency + 0.3 * elapsed
+        backend.resident = {info.get('name') for info in models} | {info.get('model') for info in models}
+        backend.resident.discard(None)
+        backend.expires = {}
+        for info in models:
+            expires_at = parse_time(info.get('expires_at'))
+            if expires_at is not None:
+                backend.expires[info.get('name') or info.get('model')] = expires_at
+        if backend.latency > self.max_latency:
+            self.record_failure(backend, f"health check took {elapsed:.2f}s")
+        else:
+            self.record_success(backend)
+            backend.ejected_until = 0.0
+
+    def check_all(self):
+        for backend in self.backends:
+            self.check(backend)
+
+    def start(self):
+        """Run health checks in a background thread."""
+        if self.checker is not None:
+            return
+
+        def loop():
+            while True:
+                self.check_all()
+                time.sleep(self.check_interval)
+
+        self.checker = threading.Thread(target=loop, daemon=True)
+        self.checker.start()
+
+    def status(self):
+        return [backend.status() for backend in self.backends]
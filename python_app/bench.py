@@ -0,0 +1,87 @@
+"""Micro-benchmark of the proxy's CPU cost per chat request.
+
+Starts fake_ollama.py with no token delay, drives the proxy in-process with
+Flask's test client and reports the proxy process's CPU time per request for
+streamed and non-streamed chats. The stand-in server runs in its own process,
+so only the proxy's work is counted. Run it on two revisions to compare them:
+
+    python bench.py --requests 200 --tokens 1000
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"fake Ollama did not start on port {port}")
+
+
+def measure(client, body, requests):
+    """Return (CPU ms, wall ms) per request for `requests` sequential chats."""
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    for _ in range(requests):
+        response = client.post('/api/chat', json=body)
+        assert response.status_code == 200, response.data
+        response.get_data()
+        response.close()
+    return ((time.process_time() - cpu) * 1000 / requests,
+            (time.perf_counter() - wall) * 1000 / requests)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--tokens', type=int, default=1000, help='tokens per answer')
+    args = parser.parse_args()
+
+    port = free_port()
+    fake = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, 'fake_ollama.py'), '--port', str(port), '--token-delay', '0', '--load-time', '0'],
+        stdout=subprocess.DEVNULL
+    )
+    try:
+        wait_for(port)
+        os.environ.update({
+            'OLLAMA_API_URLS': f"http://127.0.0.1:{port}/api",
+            'DATA_DIR': tempfile.mkdtemp(prefix='ollama-bench-'),
+            'RESPONSE_CACHE_MAX_BYTES': '0',
+            'HEALTH_CHECK_INTERVAL': '60'
+        })
+        sys.path.insert(0, HERE)
+        import app
+
+        client = app.app.test_client()
+        prompt = ' '.join(f"w{i}" for i in range(args.tokens - 1))
+        print(f"{args.requests} requests, {args.tokens} tokens per answer")
+        for stream in (True, False):
+            body = {"model": "llama3", "messages": [{"role": "user", "content": prompt}], "stream": stream}
+            measure(client, body, max(1, args.requests // 10))
+            cpu, wall = measure(client, body, args.requests)
+            print(f"  {'stream' if stream else 'json':6}  {cpu:8.2f} ms CPU/request  {wall:8.2f} ms wall/request")
+    finally:
+        fake.terminate()
+        fake.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+import json
+import threading
+import time
+import uuid
+from collections import deque
+
+
+class Subscriber:
+    """One viewer's bounded buffer of lines not yet sent to it."""
+
+    def __init__(self, capacity):
+        self.buffer = deque()
+        self.capacity = capacity
+        # A subscriber starts (and resumes after falling behind) from a snapshot
+        self.lagged = True
+        self.dropped = False
+        self.skips = 0
+        self.cond = threading.Condition()
+
+
+class Channel:
+    """Fans one generation's NDJSON lines out to any number of viewers.
+
+    The publisher never waits for a viewer: each has a ring buffer of at
+    most `capacity` lines. A viewer whose buffer overflows loses its backlog
+    and skips ahead to a snapshot of the answer so far. After `max_skips`
+    skips it is dropped. Late joiners start from the same snapshot, so a
+    viewer never costs more than `capacity` lines of memory.
+    """
+
+    def __init__(self, capacity=256, max_skips=5, on_skip=None, on_drop=None):
+        self.id = uuid.uuid4().hex
+        self.capacity = capacity
+        self.max_skips = max_skips
+        self.on_skip = on_skip
+        self.on_drop = on_drop
+        self.model = None
+        self.parts = []
+        self.final = None
+        self.error = None
+        self.done = False
+        self.finished_at = None
+        self.subscribers = set()
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def publish(self, line):
+        chunk = json.loads(line)
+        with self.lock:
+            self.model = chunk.get('model', self.model)
+            if chunk.get('done'):
+                self.final = line
+            else:
+                self.parts.append(chunk.get('message', {}).get('content', ''))
+            for subscriber in list(self.subscribers):
+                self._push(subscriber, line)
+
+    def finish(self, error=None):
+        with self.lock:
+            self.error = error
+            self.done = True
+            self.finished_at = time.monotonic()
+            for subscriber in list(self.subscribers):
+                self._push(subscriber, None)
+
+    def _push(self, subscriber, line):
+        with subscriber.cond:
+            if subscriber.lagged:
+                # Already behind; the snapshot it takes next covers this line
+                pass
+            elif len(subscriber.buffer) < subscriber.capacity:
+                subscriber.buffer.append(line)
+            else:
+                subscriber.buffer.clear()
+                subscriber.skips += 1
+                if subscriber.skips > self.max_skips:
+                    subscriber.dropped = True
+                    self.subscribers.discard(subscriber)
+                    self.dropped += 1
+                    if self.on_drop is not None:
+                        self.on_drop()
+                else:
+                    subscriber.lagged = True
+                    if self.on_skip is not None:
+                        self.on_skip()
+            subscriber.cond.notify()
+
+    def _snapshot(self):
+        """The answer so far as one line (plus the final line and end marker once done)."""
+        lines = []
+        if self.parts or not self.done:
+            lines.append(json.dumps({
+                "model": self.model,
+                "message": {"role": "assistant", "content": ''.join(self.parts)},
+                "done": False,
+                "snapshot": True
+            }).encode())
+        if self.final is not None:
+            lines.append(self.final)
+        if self.done:
+            if self.error is not None:
+                lines.append(json.dumps({"error": self.error}).encode())
+            lines.append(None)
+        return lines
+
+    def subscribe(self):
+        subscriber = Subscriber(self.capacity)
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def follow(self, subscriber, alive=None, interval=1.0):
+        """Yield lines for `subscriber` until the generation ends or the viewer is dropped.
+
+        A content line with `"snapshot": true` carries the whole answer so far
+        and replaces what the viewer has shown.
+        """
+        try:
+            while True:
+                with subscriber.cond:
+                    subscriber.cond.wait_for(
+                        lambda: subscriber.buffer or subscriber.lagged or subscriber.dropped, interval
+                    )
+                    lines = list(subscriber.buffer)
+                    subscriber.buffer.clear()
+                    lagged = subscriber.lagged
+                    dropped = subscriber.dropped
+                if dropped:
+                    yield json.dumps({"error": "dropped: not reading fast enough"}).encode()
+                    return
+                if lagged:
+                    with self.lock, subscriber.cond:
+                        lines = self._snapshot()
+                        subscriber.buffer.clear()
+                        subscriber.lagged = False
+                for line in lines:
+                    if line is None:
+                        return
+                    yield line
+                if not lines and alive is not None and not alive():
+                    return
+        finally:
+            self.unsubscribe(subscriber)
+
+    def status(self):
+        with self.lock:
+            return {
+                "id": self.id,
+                "model": self.model,
+                "done": self.done,
+                "error": self.error,
+                "subscribers": [{
+                    "buffered": len(subscriber.buffer),
+                    "skips": subscriber.skips
+                } for subscriber in self.subscribers],
+                "dropped": self.dropped
+            }
+
+
+class Hub:
+    """Broadcast channels by id; finished ones are kept `ttl` seconds for late joiners."""
+
+    def __init__(self, ttl=300.0, **channel_options):
+        self.ttl = ttl
+        self.channel_options = channel_options
+        self.channels = {}
+        self.lock = threading.Lock()
+
+    def create(self):
+        channel = Channel(**self.channel_options)
+        now = time.monotonic()
+        with self.lock:
+            for channel_id, existing in list(self.channels.items()):
+                if existing.done and now - existing.finished_at > self.ttl:
+                    del self.channels[channel_id]
+            self.channels[channel.id] = channel
+        return channel
+
+    def get(self, channel_id):
+        with self.lock:
+            return self.channels.get(channel_id)
+
+    def __len__(self):
+        return len(self.channels)
+
+    def subscribers(self):
+        with self.lock:
+            return sum(len(channel.subscribers) for channel in self.channels.values())
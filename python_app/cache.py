@@ -0,0 +1,98 @@
+import hashlib
+import json
+import threading
+import time
+
+
+class CacheEntry:
+    """A cached response body together with its validator."""
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.fetched_at = time.monotonic()
+        self._parsed = None
+
+    @property
+    def age(self):
+        return time.monotonic() - self.fetched_at
+
+    def json(self):
+        """Return the body parsed as JSON, parsing it at most once."""
+        if self._parsed is None:
+            self._parsed = json.loads(self.body)
+        return self._parsed
+
+
+class _Pending:
+    """An upstream fetch that other callers for the same key can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None
+        self.error = None
+
+
+class TTLCache:
+    """In-process cache of response bodies with stale-while-revalidate.
+
+    Entries younger than `ttl` are served as-is. Entries younger than
+    `ttl + stale_ttl` are served immediately while one background fetch
+    refreshes them. Anything older is fetched synchronously; concurrent
+    misses for the same key share a single upstream call.
+    """
+
+    def __init__(self, ttl=10.0, stale_ttl=60.0):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.entries = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, fetch):
+        """Return the CacheEntry for `key`, calling `fetch()` for fresh bytes when needed."""
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry.age < self.ttl:
+                return entry
+            if entry.age < self.ttl + self.stale_ttl:
+                self._refresh_in_background(key, fetch)
+                return entry
+        return self._fetch(key, fetch)
+
+    def _fetch(self, key, fetch):
+        with self.lock:
+            pending = self.pending.get(key)
+            leader = pending is None
+            if leader:
+                pending = self.pending[key] = _Pending()
+
+        if not leader:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.entry
+
+        try:
+            pending.entry = self.entries[key] = CacheEntry(fetch())
+            return pending.entry
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.pending[key]
+            pending.done.set()
+
+    def _refresh_in_background(self, key, fetch):
+        if key in self.pending:
+            return
+
+        def refresh():
+            try:
+                self._fetch(key, fetch)
+            except Exception:
+                # Keep serving the stale entry; the next miss will surface the error
+                pass
+
+        threading.Thread(target=refresh, daemon=True).start()
@@ -0,0 +1,107 @@
+import re
+
+from backends import full_model_name
+from context import message_tokens
+
+SIGNALS = ('length', 'refusal', 'uncertain')
+
+# Requests that tend to need the large model
+_CODE = re.compile(r"```|^(?: {4}|\t)\S", re.M)
+_MATH = re.compile(r"\\(?:frac|sum|int|sqrt)|[∑∫√≤≥≠]|\b\d+\s*[\^*/]\s*\d+")
+_HARD_WORDS = re.compile(
+    r"\b(?:prove|proof|derive|analy[sz]e|compare|contrast|design|architect\w*|optimi[sz]e|debug|refactor"
+    r"|algorithm|trade-?offs?|step[- ]by[- ]step|explain why|in depth|pros and cons)\b", re.I
+)
+
+# Answers that suggest the fast model was out of its depth
+_REFUSAL = re.compile(
+    r"\b(?:I(?:'m| am) (?:not able|unable) to|I can(?:no|')t (?:help|assist|answer|provide|do)"
+    r"|I(?:'m| am) sorry, but|as an AI(?: language model)?)", re.I
+)
+_UNCERTAIN = re.compile(
+    r"\b(?:I(?:'m| am) not (?:sure|certain)|I don't know|I do not know|I'm not familiar"
+    r"|I don't have (?:enough )?information|hard to say|I(?: would|'d) guess)", re.I
+)
+
+
+def complexity(messages):
+    """A cheap score of how demanding a conversation is: 0 is a simple question.
+
+    One point each for code, math, more than two questions in the last
+    message and a long conversation, plus one per demanding keyword (at most
+    three).
+    """
+    last = (messages[-1].get('content') or '') if messages else ''
+    score = 0
+    if _CODE.search(last):
+        score += 1
+    if _MATH.search(last):
+        score += 1
+    if last.count('?') > 2:
+        score += 1
+    if sum(message.get('role') == 'user' for message in messages) > 6:
+        score += 1
+    score += min(3, len(_HARD_WORDS.findall(last)))
+    return score
+
+
+class Cascade:
+    """Routes chats for a large model to a fast one when they look simple.
+
+    `tiers` maps a large model to its fast model. A request goes to the fast
+    model when its estimated prompt is at most `max_prompt_tokens` and its
+    `complexity` is below `max_complexity`, and is escalated to the large
+    model when the fast answer trips one of `signals`: `length` (cut off by
+    num_predict, or empty), `refusal` or `uncertain` (markers in the first
+    `window` characters).
+    """
+
+    def __init__(self, tiers, max_prompt_tokens=1000, max_complexity=2, signals=SIGNALS, window=400):
+        self.tiers = {full_model_name(large): fast for large, fast in tiers.items()}
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_complexity = max_complexity
+        self.signals = tuple(signals)
+        self.window = window
+
+    def fast_model(self, model):
+        return self.tiers.get(full_model_name(model))
+
+    def route(self, model, messages, tier=None):
+        """Return `(fast_model, reason)`; `fast_model` is None when the large model should answer."""
+        fast = self.fast_model(model)
+        if fast is None:
+            return None, 'no_fast_tier'
+        if tier == 'large':
+            return None, 'requested'
+        if tier == 'fast':
+            return fast, 'requested'
+        if sum(message_tokens(message) for message in messages) > self.max_prompt_tokens:
+            return None, 'prompt_size'
+        if complexity(messages) >= self.max_complexity:
+            return None, 'complexity'
+        return fast, 'simple'
+
+    def escalation(self, result):
+        """The signal that sends a fast answer on to the large model, or None to keep it."""
+        content = (result.get('message') or {}).get('content') or ''
+        # A proxy-side length cap ends the answer without Ollama's eval_count; that is not a truncation
+        if 'length' in self.signals and (
+                not content.strip() or (result.get('done_reason') == 'length' and 'eval_count' in result)):
+            return 'length'
+        head = content[:self.window]
+        if 'refusal' in self.signals and _REFUSAL.search(head):
+            return 'refusal'
+        if 'uncertain' in self.signals and _UNCERTAIN.search(head):
+            return 'uncertain'
+        return None
+
+
+def parse_tiers(value):
+    """Parse `large=fast,...` pairs, e.g. `llama3:70b=llama3.2:3b`."""
+    tiers = {}
+    for pair in value.split(','):
+        if '=' in pair:
+            large, fast = pair.split('=', 1)
+            if large.strip() and fast.strip():
+                tiers[large.strip()] = fast.strip()
+    return tiers
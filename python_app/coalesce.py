@@ -0,0 +1,127 @@
+import threading
+
+
+class Cancelled(Exception):
+    """The caller (or every caller of a flight) went away before the answer was ready."""
+
+
+class Flight:
+    """One upstream generation whose chunks any number of callers can follow.
+
+    A producer calls `start`, `publish` and `finish`; callers either `follow`
+    the chunk stream from any offset (late joiners replay what is buffered
+    first) or `wait` for the assembled result. The producer may finish with
+    a function instead of a result; it is called once, on first access, so
+    callers that only relay chunks never pay for assembling the result.
+
+    Callers `subscribe` while they are interested and `unsubscribe` when they
+    finish or go away. When the last one leaves before the flight is done it
+    is cancelled and `on_cancel` (set by the producer) aborts the upstream
+    work.
+    """
+
+    def __init__(self, key=None):
+        self.key = key
+        self.chunks = []
+        self.status = None
+        self._result = None
+        self.error = None
+        self.done = False
+        self.subscribers = 0
+        self.cancelled = False
+        self.on_cancel = None
+        self.queue_time = None
+        self.started = threading.Event()
+        self.cond = threading.Condition()
+
+    def start(self, status):
+        self.status = status
+        self.started.set()
+
+    def publish(self, chunk):
+        with self.cond:
+            self.chunks.append(chunk)
+            self.cond.notify_all()
+
+    @property
+    def result(self):
+        if callable(self._result):
+            with self.cond:
+                if callable(self._result):
+                    self._result = self._result()
+        return self._result
+
+    def finish(self, result=None, error=None):
+        with self.cond:
+            self._result = result
+            self.error = error
+            self.done = True
+            self.cond.notify_all()
+        self.started.set()
+
+    def subscribe(self):
+        with self.cond:
+            self.subscribers += 1
+
+    def unsubscribe(self):
+        """Drop a caller; returns True when that cancelled the flight."""
+        with self.cond:
+            self.subscribers -= 1
+            if self.subscribers > 0 or self.done or self.cancelled:
+                return False
+            self.cancelled = True
+            on_cancel = self.on_cancel
+        if on_cancel is not None:
+            on_cancel()
+        return True
+
+    def follow(self, start=0, alive=None, interval=1.0):
+        """Yield chunks from offset `start`, blocking for new ones until the flight is done.
+
+        With `alive`, it is polled every `interval` seconds while no chunk
+        arrives, and following stops as soon as it returns False.
+        """
+        i = start
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: i < len(self.chunks) or self.done,
+                                   interval if alive is not None else None)
+                batch = self.chunks[i:]
+                done = self.done
+            if batch:
+                i += len(batch)
+                yield from batch
+            elif done or not alive():
+                return
+
+    def wait(self, timeout=None):
+        with self.cond:
+            self.cond.wait_for(lambda: self.done, timeout)
+        return self.result
+
+
+class FlightTable:
+    """Registry of in-flight generations by canonical request key."""
+
+    def __init__(self):
+        self.flights = {}
+        self.lock = threading.Lock()
+
+    def join(self, key):
+        """Return `(flight, leader)` subscribed to; the leader is responsible for producing the flight."""
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is not None and not flight.cancelled:
+                flight.subscribe()
+                return flight, False
+            flight = self.flights[key] = Flight(key)
+            flight.subscribe()
+            return flight, True
+
+    def remove(self, flight):
+        with self.lock:
+            if self.flights.get(flight.key) is flight:
+                del self.flights[flight.key]
+
+    def __len__(self):
+        return len(self.flights)
@@ -0,0 +1,99 @@
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; gzip is always available
+    zstandard = None
+
+COMPRESSIBLE = {
+    'application/json',
+    'application/x-ndjson',
+    'text/event-stream',
+    'text/html',
+    'text/plain',
+    'text/css',
+    'text/javascript',
+    'application/javascript'
+}
+
+
+def available_encodings():
+    return ('zstd', 'gzip') if zstandard is not None else ('gzip',)
+
+
+def negotiate(accept_encoding):
+    """Pick the best supported coding from an Accept-Encoding header, or None."""
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    # Prefer zstd over gzip on a tie; the client's q-values decide otherwise
+    best = None
+    for coding in available_encodings():
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if q > 0 and (best is None or q > best[1]):
+            best = (coding, q)
+    return best[0] if best else None
+
+
+def compress(data, encoding, level=6):
+    """Compress a complete body at `level` (1-9 for gzip; zstd goes up to 22)."""
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    compressor = gzip_compressor(level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def gzip_compressor(level=6):
+    return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+class StreamCompressor:
+    """Compresses a stream chunk by chunk, flushing after each one.
+
+    Every chunk comes out as a complete block the client can decode at once,
+    so compression never holds back a token; the shared window still lets
+    later chunks reference earlier ones.
+    """
+
+    def __init__(self, encoding, level=6):
+        self.encoding = encoding
+        if encoding == 'zstd':
+            self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            self.compressor = gzip_compressor(level)
+
+    def compress(self, chunk):
+        if self.encoding == 'zstd':
+            return self.compressor.compress(chunk) + self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return self.compressor.compress(chunk) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+def compress_stream(chunks, encoding, level=6):
+    """Compress an iterable of body chunks, closing it when done."""
+    compressor = StreamCompressor(encoding, level)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            if chunk:
+                yield compressor.compress(chunk)
+        yield compressor.finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
@@ -0,0 +1,68 @@
+import functools
+import math
+import re
+
+# Per-message overhead of the chat template (role markers, separators)
+MESSAGE_OVERHEAD = 4
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+@functools.lru_cache(maxsize=65536)
+def estimate_tokens(text):
+    """Approximate a BPE tokenizer's count for `text`.
+
+    Counts words and punctuation, but never less than one token per four
+    characters, which is what long words and code degrade to. Results are
+    memoised by message text, so a history costs one regex pass per new turn.
+    """
+    if not text:
+        return 0
+    return max(len(_PIECES.findall(text)), math.ceil(len(text) / 4))
+
+
+def message_tokens(message):
+    return estimate_tokens(message.get('content') or '') + MESSAGE_OVERHEAD
+
+
+def trim_messages(messages, budget, target=0.75):
+    """Drop the oldest non-system turns so `messages` fits in `budget` tokens.
+
+    System messages and the latest message are always kept. The cut point is
+    found by replaying the conversation: it only moves when the window
+    overflows `budget`, and then jumps far enough to bring the window down
+    to `target * budget`. Successive turns of a long conversation therefore
+    share the same trimmed prefix (and Ollama's prompt cache) until the
+    budget is exceeded again, instead of shifting by one turn every time.
+
+    Returns `(messages, dropped_messages, dropped_tokens)`.
+    """
+    total = sum(message_tokens(message) for message in messages)
+    if budget <= 0 or total <= budget or len(messages) < 2:
+        return messages, 0, 0
+
+    latest = len(messages) - 1
+    positions = [i for i, message in enumerate(messages) if i == latest or message.get('role') != 'system']
+    turns = [messages[i] for i in positions]
+    fixed = total - sum(message_tokens(message) for message in turns)
+    limit = budget - fixed
+    low_water = budget * target - fixed
+
+    cut = 0
+    window = 0
+    for i, message in enumerate(turns):
+        window += message_tokens(message)
+        if window > limit:
+            while cut < i and window > low_water:
+                window -= message_tokens(turns[cut])
+                cut += 1
+
+    # A conversation should resume on a user turn, not a dangling assistant reply
+    while cut < len(turns) - 1 and turns[cut].get('role') == 'assistant':
+        cut += 1
+
+    if cut == 0:
+        return messages, 0, 0
+    dropped = set(positions[:cut])
+    kept = [message for i, message in enumerate(messages) if i not in dropped]
+    return kept, cut, sum(message_tokens(message) for message in turns[:cut])
@@ -0,0 +1,183 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class EmbeddingStore:
+    """Embedding vectors on disk, addressed by (model, content key).
+
+    Vectors are appended as raw float32 rows to one file per model and
+    dimension, which is memory-mapped for reads; a SQLite index maps each
+    key to its row. Rows are allocated inside a SQLite write transaction, so
+    every worker process can share the store. The store is append-only and
+    stops accepting vectors once its files reach `max_bytes`.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.maps = {}
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, 'index.db')
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    model TEXT,
+                    dim INTEGER,
+                    rows INTEGER,
+                    PRIMARY KEY (model, dim)
+                )
+            """)
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS vectors (
+                    model TEXT,
+                    key TEXT,
+                    dim INTEGER,
+                    row INTEGER,
+                    PRIMARY KEY (model, key)
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _file(self, model, dim):
+        name = hashlib.sha256(model.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.directory, f"{name}-{dim}.f32")
+
+    def _rows(self, path, dim, needed):
+        """A memory map of `path` covering at least `needed` rows."""
+        with self.lock:
+            mapped = self.maps.get(path)
+            if mapped is None or len(mapped) < needed:
+                mapped = np.memmap(path, dtype='<f4', mode='r').reshape(-1, dim)
+                self.maps[path] = mapped
+            return mapped
+
+    def _lookup(self, db, model, keys):
+        """`(key, dim, row)` of each stored key among `keys`."""
+        rows = []
+        unique = list(set(keys))
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(unique), 500):
+            chunk = unique[start:start + 500]
+            rows.extend(db.execute(
+                f"SELECT key, dim, row FROM vectors WHERE model = ? AND key IN ({','.join('?' * len(chunk))})",
+                (model, *chunk)
+            ).fetchall())
+        return rows
+
+    def get(self, model, keys):
+        """Return `{key: vector}` for the keys that are stored."""
+        if not keys:
+            return {}
+        found = {}
+        with self._connect() as db:
+            rows = self._lookup(db, model, keys)
+        for key, dim, row in rows:
+            found[key] = np.array(self._rows(self._file(model, dim), dim, row + 1)[row])
+        return found
+
+    def put(self, model, vectors):
+        """Store `{key: vector}`; keys already present are left alone."""
+        by_dim = {}
+        for key, vector in vectors.items():
+            vector = np.asarray(vector, dtype='<f4')
+            by_dim.setdefault(vector.shape[0], {})[key] = vector
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            used = db.execute("SELECT COALESCE(SUM(rows * dim * 4), 0) FROM files").fetchone()[0]
+            for dim, items in by_dim.items():
+                existing = {key for key, _, _ in self._lookup(db, model, items)}
+                items = {key: vector for key, vector in items.items() if key not in existing}
+                if not items or used + len(items) * dim * 4 > self.max_bytes:
+                    continue
+                row = db.execute("SELECT rows FROM files WHERE model = ? AND dim = ?", (model, dim)).fetchone()
+                first = row[0] if row else 0
+                path = self._file(model, dim)
+                with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+                    f.seek(first * dim * 4)
+                    f.write(np.stack(list(items.values())).tobytes())
+                db.executemany(
+                    "INSERT INTO vectors VALUES (?, ?, ?, ?)",
+                    [(model, key, dim, first + i) for i, key in enumerate(items)]
+                )
+                db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?)", (model, dim, first + len(items)))
+                used += len(items) * dim * 4
+
+    def size(self):
+        with self._connect() as db:
+            return db.execute("SELECT COALESCE(SUM(rows * dim * 4), 0) FROM files").fetchone()[0]
+
+
+class _Batch:
+    def __init__(self):
+        self.texts = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.vectors = None
+        self.error = None
+
+
+class EmbedBatcher:
+    """Merges concurrent embedding requests for the same model into one upstream call.
+
+    The first request for a model opens a batch and waits up to `max_wait`
+    seconds (or until `max_size` texts have joined) before sending it; each
+    caller then receives its own slice of the result.
+    """
+
+    def __init__(self, embed, max_size=64, max_wait=0.005):
+        self.embed_fn = embed
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.open = {}
+        self.lock = threading.Lock()
+
+    def embed(self, key, texts, *args):
+        """Embed `texts`; requests share a batch when their `key` matches."""
+        if len(texts) >= self.max_size or self.max_wait <= 0:
+            return self.embed_fn(texts, *args)
+
+        with self.lock:
+            batch = self.open.get(key)
+            leader = batch is None or len(batch.texts) + len(texts) > self.max_size
+            if leader:
+                if batch is not None:
+                    batch.full.set()
+                batch = self.open[key] = _Batch()
+            start = len(batch.texts)
+            batch.texts.extend(texts)
+            if len(batch.texts) >= self.max_size:
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.max_wait)
+            with self.lock:
+                if self.open.get(key) is batch:
+                    del self.open[key]
+            try:
+                batch.vectors = self.embed_fn(batch.texts, *args)
+            except Exception as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.vectors[start:start + len(texts)]
+
@@ -0,0 +1,226 @@
+"""Stand-in Ollama server for exercising the proxy without a GPU.
+
+Run several on different ports and point the proxy at all of them:
+
+    python fake_ollama.py --port 11501 &
+    python fake_ollama.py --port 11502 --token-delay 0.05 &
+    OLLAMA_API_URLS=http://127.0.0.1:11501/api,http://127.0.0.1:11502/api python app.py
+
+Chat replies echo the last user message word by word. A model is "loaded"
+on first use (costing --load-time) and stays resident for its keep_alive.
+With --degrade N, generations slow down once more than N run at once, like
+a GPU pushed past its batch size.
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def parse_duration(value, default=300.0):
+    """Parse an Ollama keep_alive value ("5m", "30s", 60, -1) into seconds."""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float('inf') if value < 0 else float(value)
+    units = {'s': 1, 'm': 60, 'h': 3600}
+    if value[-1:] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
+class FakeOllama:
+    def __init__(self, models, token_delay, load_time, context_length, degrade=0):
+        self.models = models
+        self.token_delay = token_delay
+        self.degrade = degrade
+        self.load_time = load_time
+        self.context_length = context_length
+        self.resident = {}
+        self.active = 0
+        self.lock = threading.Lock()
+
+    def delay(self):
+        """Seconds per token at the current load.
+
+        Beyond `degrade` concurrent generations every generation slows down
+        more than proportionally, so total throughput falls as load grows.
+        """
+        if not self.degrade or self.active <= self.degrade:
+            return self.token_delay
+        return self.token_delay * (self.active / self.degrade) ** 1.5
+
+    def load(self, model, keep_alive=None):
+        """Make `model` resident, returning the load duration in seconds."""
+        with self.lock:
+            loaded = self.resident.get(model, 0) > time.time()
+        load_time = 0.0 if loaded else self.load_time
+        time.sleep(load_time)
+        with self.lock:
+            self.resident[model] = time.time() + parse_duration(keep_alive)
+        return load_time
+
+    def ps(self):
+        now = time.time()
+        with self.lock:
+            resident = {model: expiry for model, expiry in self.resident.items() if expiry > now}
+        return [{
+            "name": model,
+            "model": model,
+            "expires_at": datetime.datetime.fromtimestamp(
+                min(expiry, now + 10 * 365 * 86400), datetime.timezone.utc).isoformat()
+        } for model, expiry in resident.items()]
+
+
+def make_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Small chunk writes would otherwise wait on the client's delayed ACK (~40 ms)
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, body, status=200):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def send_chunk(self, body):
+            data = json.dumps(body).encode() + b'\n'
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path == '/api/tags':
+                self.send_json({"models": [{
+                    "name": model,
+                    "model": model,
+                    "digest": hashlib.sha256(model.encode()).hexdigest(),
+                    "details": {"parameter_size": "1B"}
+                } for model in server.models]})
+            elif self.path == '/api/version':
+                self.send_json({"version": "0.0.0-fake"})
+            elif self.path == '/api/ps':
+                self.send_json({"models": server.ps()})
+            else:
+                self.send_json({"error": "not found"}, 404)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+            model = body.get('model', '')
+            if ':' not in model:
+                model += ':latest'
+            if self.path != '/api/embed' and model not in server.models:
+                return self.send_json({"error": f"model '{body.get('model')}' not found"}, 404)
+
+            if self.path == '/api/show':
+                self.send_json({
+                    "details": {"parameter_size": "1B", "family": "fake"},
+                    "model_info": {"general.architecture": "fake", "fake.context_length": server.context_length}
+                })
+            elif self.path == '/api/generate':
+                load_time = server.load(model, body.get('keep_alive'))
+                self.send_json({"model": model, "response": "", "done": True, "load_duration": int(load_time * 1e9)})
+            elif self.path == '/api/embed':
+                texts = body.get('input', [])
+                if isinstance(texts, str):
+                    texts = [texts]
+                embeddings = []
+                for text in texts:
+                    digest = hashlib.sha256(text.lower().strip(' ?!.').encode()).digest()
+                    embeddings.append([byte / 255 - 0.5 for byte in digest[:16]])
+                self.send_json({"model": model, "embeddings": embeddings})
+            elif self.path == '/api/chat':
+                self.chat(model, body)
+            else:
+                self.send_json({"error": "not found"}, 404)
+
+        def chat(self, model, body):
+            load_time = server.load(model, body.get('keep_alive'))
+            messages = body.get('messages') or [{}]
+            words = ("echo: " + messages[-1].get('content', '')).split(' ')
+            limit = (body.get('options') or {}).get('num_predict')
+            if limit and limit > 0:
+                words = words[:limit]
+            prompt_tokens = sum(len(message.get('content', '').split()) for message in messages)
+            with server.lock:
+                server.active += 1
+            try:
+                started = time.time()
+                stats = {
+                    "done": True,
+                    "done_reason": "stop",
+                    "load_duration": int(load_time * 1e9),
+                    "prompt_eval_count": prompt_tokens,
+                    "prompt_eval_duration": 1000000,
+                    "eval_count": len(words)
+                }
+                if body.get('stream', True) is False:
+                    time.sleep(server.delay() * len(words))
+                    stats["eval_duration"] = int((time.time() - started) * 1e9)
+                    stats["total_duration"] = stats["eval_duration"] + stats["load_duration"]
+                    return self.send_json(dict(stats, model=model, message={"role": "assistant", "content": ' '.join(words)}))
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for i, word in enumerate(words):
+                    time.sleep(server.delay())
+                    self.send_chunk({
+                        "model": model,
+                        "message": {"role": "assistant", "content": (' ' if i else '') + word},
+                        "done": False
+                    })
+                stats["eval_duration"] = int((time.time() - started) * 1e9)
+                stats["total_duration"] = stats["eval_duration"] + stats["load_duration"]
+                self.send_chunk(dict(stats, model=model, message={"role": "assistant", "content": ""}))
+                self.wfile.write(b'0\r\n\r\n')
+            except (BrokenPipeError, ConnectionResetError):
+                # The proxy closed the connection: stop generating, as Ollama does
+                pass
+            finally:
+                with server.lock:
+                    server.active -= 1
+
+    return Handler
+
+
+class Server(ThreadingHTTPServer):
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=11434)
+    parser.add_argument('--models', default='llama3:latest,phi3:latest')
+    parser.add_argument('--token-delay', type=float, default=0.02, help='seconds per generated token')
+    parser.add_argument('--load-time', type=float, default=0.5, help='seconds to load a model that is not resident')
+    parser.add_argument('--context-length', type=int, default=8192)
+    parser.add_argument('--degrade', type=int, default=0,
+                        help='concurrent generations beyond which throughput degrades (0: never)')
+    args = parser.parse_args()
+
+    server = FakeOllama(
+        [model.strip() for model in args.models.split(',')],
+        args.token_delay,
+        args.load_time,
+        args.context_length,
+        args.degrade
+    )
+    httpd = Server(('127.0.0.1', args.port), make_handler(server))
+    print(f"Fake Ollama listening on http://127.0.0.1:{args.port}/api")
+    httpd.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
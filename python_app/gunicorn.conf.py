@@ -0,0 +1,24 @@
+import os
+
+# Production server settings for the Ollama Chat UI proxy.
+#
+# Each gevent worker runs the Flask app on an event loop: the worker
+# monkey-patches the standard library, so every request (and every upstream
+# call made through `requests`) is a greenlet rather than an OS thread. One
+# process can hold hundreds of long streaming generations at flat memory.
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+worker_class = 'gevent'
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+worker_connections = int(os.getenv('WORKER_CONNECTIONS', '1000'))
+
+# Streaming responses keep the connection busy for the whole generation;
+# gevent workers keep heartbeating while they wait, so this only catches
+# genuinely stuck workers.
+timeout = int(os.getenv('WORKER_TIMEOUT', '60'))
+graceful_timeout = int(os.getenv('GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('LOG_LEVEL', 'info')
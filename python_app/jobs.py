@@ -0,0 +1,192 @@
+import json
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+
+ACTIVE = ('queued', 'running')
+
+# (pid, id) of this process's run; a forked child gets a new id
+_boot = (None, None)
+
+
+def boot_id():
+    """An id unique to this run of this process, unlike its pid, which is reused after a restart."""
+    global _boot
+    if _boot[0] != os.getpid():
+        _boot = (os.getpid(), uuid.uuid4().hex)
+    return _boot[1]
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """Background chat generations and their streamed lines, kept in SQLite.
+
+    A job's lines are stored in order as they are produced, so a client can
+    resume from any offset, and the final result is kept once the job is
+    done; both survive a proxy restart. Jobs are deleted `ttl` seconds after
+    they were created or finished; expired jobs are purged at most every
+    `purge_interval` seconds, on reads as well as writes.
+
+    A job records its owner's pid and `boot_id`, and each process registers
+    its pair in `workers` when it opens the store. A job whose owner's pid
+    is gone, or now belongs to a later run, is reported as interrupted.
+    """
+
+    def __init__(self, path, ttl, purge_interval=60.0):
+        self.path = path
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self.purged_at = 0.0
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    model TEXT,
+                    request TEXT,
+                    status TEXT,
+                    result TEXT,
+                    error TEXT,
+                    lines INTEGER,
+                    owner INTEGER,
+                    created_at REAL,
+                    updated_at REAL,
+                    expires_at REAL,
+                    boot TEXT
+                )
+            """)
+            if 'boot' not in [column[1] for column in db.execute("PRAGMA table_info(jobs)")]:
+                db.execute("ALTER TABLE jobs ADD COLUMN boot TEXT")
+            db.execute("CREATE TABLE IF NOT EXISTS workers (pid INTEGER PRIMARY KEY, boot TEXT)")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS job_lines (
+                    job_id TEXT,
+                    seq INTEGER,
+                    line BLOB,
+                    PRIMARY KEY (job_id, seq)
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_expires_at ON jobs (expires_at)")
+            self._register(db)
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _register(self, db):
+        db.execute("INSERT OR REPLACE INTO workers VALUES (?, ?)", (os.getpid(), boot_id()))
+
+    def _owner_alive(self, db, pid, boot):
+        if boot is None:
+            # Written before boot ids were recorded
+            return process_alive(pid)
+        if pid == os.getpid():
+            return boot == boot_id()
+        row = db.execute("SELECT boot FROM workers WHERE pid = ?", (pid,)).fetchone()
+        return row is not None and row[0] == boot and process_alive(pid)
+
+    def create(self, model, request):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as db:
+            self._purge(db, now)
+            # A forked worker has a new boot id
+            self._register(db)
+            db.execute(
+                "INSERT INTO jobs (id, model, request, status, lines, owner, boot, created_at, updated_at, expires_at) "
+                "VALUES (?, ?, ?, 'queued', 0, ?, ?, ?, ?, ?)",
+                (job_id, model, json.dumps(request), os.getpid(), boot_id(), now, now, now + self.ttl)
+            )
+        return job_id
+
+    def get(self, job_id):
+        with self._connect() as db:
+            self._purge(db, time.time())
+            row = db.execute(
+                "SELECT id, model, status, result, error, lines, owner, boot, created_at, updated_at, expires_at "
+                "FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, model, status, result, error, lines, owner, boot, created_at, updated_at, expires_at = row
+            if status in ACTIVE and not self._owner_alive(db, owner, boot):
+                status, error = 'error', 'interrupted by a proxy restart'
+                db.execute("UPDATE jobs SET status = ?, error = ? WHERE id = ?", (status, error, job_id))
+        return {
+            "id": job_id,
+            "model": model,
+            "status": status,
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "lines": lines,
+            "created_at": created_at,
+            "updated_at": updated_at,
+            "expires_at": expires_at
+        }
+
+    def start(self, job_id):
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            )
+
+    def append(self, job_id, start, lines):
+        """Store lines from offset `start`; returns False once the job was cancelled or deleted."""
+        with self._connect() as db:
+            updated = db.execute(
+                "UPDATE jobs SET lines = ?, updated_at = ? WHERE id = ? AND status IN ('queued', 'running')",
+                (start + len(lines), time.time(), job_id)
+            ).rowcount
+            if not updated:
+                return False
+            db.executemany(
+                "INSERT OR REPLACE INTO job_lines VALUES (?, ?, ?)",
+                [(job_id, start + i, line) for i, line in enumerate(lines)]
+            )
+        return True
+
+    def lines(self, job_id, offset=0):
+        with self._connect() as db:
+            return [line for (line,) in db.execute(
+                "SELECT line FROM job_lines WHERE job_id = ? AND seq >= ? ORDER BY seq", (job_id, offset)
+            )]
+
+    def finish(self, job_id, status, result=None, error=None):
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ?, expires_at = ? "
+                "WHERE id = ? AND status IN ('queued', 'running')",
+                (status, json.dumps(result) if result is not None else None, error, now, now + self.ttl, job_id)
+            )
+
+    def delete(self, job_id):
+        with self._connect() as db:
+            db.execute("DELETE FROM job_lines WHERE job_id = ?", (job_id,))
+            return db.execute("DELETE FROM jobs WHERE id = ?", (job_id,)).rowcount > 0
+
+    def _purge(self, db, now):
+        if now - self.purged_at < self.purge_interval:
+            return
+        self.purged_at = now
+        expired = [(job_id,) for (job_id,) in db.execute("SELECT id FROM jobs WHERE expires_at < ?", (now,))]
+        if expired:
+            db.executemany("DELETE FROM job_lines WHERE job_id = ?", expired)
+            db.executemany("DELETE FROM jobs WHERE id = ?", expired)
@@ -0,0 +1,165 @@
+import threading
+import time
+from collections import deque
+
+
+class _Generation:
+    """A running generation: the generations in flight when it started, and the most it ran alongside."""
+
+    __slots__ = ('started_with', 'peak')
+
+    def __init__(self, in_flight):
+        self.started_with = in_flight
+        self.peak = in_flight
+
+
+class AdaptiveLimit:
+    """A concurrency limit for one model on one backend, tuned by AIMD.
+
+    Every finished generation reports its time to first token (without model
+    load time) and its tokens per second, which are compared with baselines.
+    A generation that started while the limit was fully used and came back
+    healthy raises the limit by `1/limit`, i.e. by one per limit's worth of
+    such generations. A time to first token over `ttft_tolerance` times the
+    baseline, or a speed under `tps_tolerance` times it, multiplies the
+    limit by `backoff`. That happens at most once per limit's worth of
+    generations, because the ones already running were admitted under the
+    old limit.
+
+    Baselines cannot be learned under the load a grown limit admits, so
+    they are the medians of the last `baseline_samples` generations that
+    never ran alongside more than `baseline_limit` others (by default
+    `initial`, the static limit, which is taken to be safe). The limit
+    stays at `initial` until the first baselines are known; after that,
+    such generations keep refreshing them whenever the load allows. The
+    limit is never lowered just to measure.
+    """
+
+    def __init__(self, initial=4, min_limit=1, max_limit=32, ttft_tolerance=2.0, tps_tolerance=0.5,
+                 backoff=0.8, baseline_limit=None, baseline_samples=5, history=100):
+        self.value = float(max(min_limit, min(initial, max_limit)))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.ttft_tolerance = ttft_tolerance
+        self.tps_tolerance = tps_tolerance
+        self.backoff = backoff
+        self.baseline_limit = baseline_limit or initial
+        self.baseline = deque(maxlen=baseline_samples)
+        self.baseline_ttft = None
+        self.baseline_tps = None
+        self.last_ttft = None
+        self.last_tps = None
+        self.since_cut = 0
+        self.running = set()
+        self.history = deque([(time.time(), self.limit, 'initial')], maxlen=history)
+        self.lock = threading.Lock()
+
+    @property
+    def limit(self):
+        return max(self.min_limit, int(self.value))
+
+    @property
+    def in_flight(self):
+        return len(self.running)
+
+    def start(self):
+        """Count a generation in; returns the token to `finish` it with."""
+        with self.lock:
+            generation = _Generation(len(self.running) + 1)
+            self.running.add(generation)
+            for running in self.running:
+                running.peak = max(running.peak, len(self.running))
+            return generation
+
+    def finish(self, generation, ttft=None, tps=None):
+        """Count out a generation, learning from its timings."""
+        with self.lock:
+            self.running.discard(generation)
+            if ttft is None and tps is None:
+                return
+            self.last_ttft = ttft if ttft is not None else self.last_ttft
+            self.last_tps = tps if tps is not None else self.last_tps
+            if generation.peak <= self.baseline_limit:
+                self._sample_baseline(ttft, tps)
+            if self.baseline_ttft is None and self.baseline_tps is None:
+                return
+            before = self.limit
+            self.since_cut += 1
+            reason = None
+            if ttft is not None and self.baseline_ttft and ttft > self.baseline_ttft * self.ttft_tolerance:
+                reason = 'ttft'
+            elif tps is not None and self.baseline_tps and tps < self.baseline_tps * self.tps_tolerance:
+                reason = 'tps'
+            if reason is not None:
+                if self.since_cut >= before:
+                    self.value = max(self.min_limit, self.value * self.backoff)
+                    self.since_cut = 0
+            elif generation.started_with >= before:
+                self.value = min(self.max_limit, self.value + 1 / self.value)
+                reason = 'increase'
+            if self.limit != before:
+                self.history.append((time.time(), self.limit, reason))
+
+    def _sample_baseline(self, ttft, tps):
+        self.baseline.append((ttft, tps))
+        if len(self.baseline) < self.baseline.maxlen:
+            return
+        learned = self.baseline_ttft is None and self.baseline_tps is None
+        ttfts = sorted(sample[0] for sample in self.baseline if sample[0] is not None)
+        speeds = sorted(sample[1] for sample in self.baseline if sample[1] is not None)
+        self.baseline_ttft = ttfts[len(ttfts) // 2] if ttfts else None
+        self.baseline_tps = speeds[len(speeds) // 2] if speeds else None
+        if learned:
+            self.history.append((time.time(), self.limit, 'baseline'))
+
+    def status(self):
+        with self.lock:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "baseline_samples": len(self.baseline),
+                "baseline_ttft": None if self.baseline_ttft is None else round(self.baseline_ttft, 4),
+                "baseline_tps": None if self.baseline_tps is None else round(self.baseline_tps, 2),
+                "last_ttft": None if self.last_ttft is None else round(self.last_ttft, 4),
+                "last_tps": None if self.last_tps is None else round(self.last_tps, 2),
+                "history": [{"time": at, "limit": limit, "reason": reason} for at, limit, reason in self.history]
+            }
+
+
+class AdaptiveLimiter:
+    """`AdaptiveLimit`s by (backend, model), created with `options` by `get`.
+
+    Only `get` creates entries; the caller decides which models deserve one.
+    Lookups of any other model report the initial limit.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+        self.limits = {}
+        self.lock = threading.Lock()
+
+    def get(self, backend, model):
+        with self.lock:
+            limit = self.limits.get((backend, model))
+            if limit is None:
+                limit = self.limits[(backend, model)] = AdaptiveLimit(**self.options)
+            return limit
+
+    def limit(self, backend, model):
+        limit = self.limits.get((backend, model))
+        return limit.limit if limit is not None else self.options.get('initial', 4)
+
+    def headroom(self, backend, model):
+        limit = self.limits.get((backend, model))
+        if limit is None:
+            return self.options.get('initial', 4)
+        return limit.limit - limit.in_flight
+
+    def status(self):
+        """Every limit's state, by backend and then model."""
+        with self.lock:
+            limits = list(self.limits.items())
+        backends = {}
+        for (backend, model), limit in sorted(limits):
+            backends.setdefault(backend, {})[model] = limit.status()
+        return backends
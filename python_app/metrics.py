@@ -0,0 +1,174 @@
+import bisect
+import itertools
+import math
+import threading
+
+SHARDS = 16
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500)
+
+# Thread (or, under gevent, greenlet) idents are aligned addresses, so their
+# low bits are all zero; each thread is dealt a shard round-robin instead
+_local = threading.local()
+_next_shard = itertools.count()
+
+
+def _shard_index():
+    try:
+        return _local.shard
+    except AttributeError:
+        _local.shard = next(_next_shard) % SHARDS
+        return _local.shard
+
+
+class _Shard:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+
+
+class Metric:
+    """A named metric whose samples are spread over lock-striped shards.
+
+    Writers only contend with other threads dealt the same shard; a scrape
+    merges the shards.
+    """
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.shards = [_Shard() for _ in range(SHARDS)]
+
+    def _shard(self):
+        return self.shards[_shard_index()]
+
+    def _labels(self, labels):
+        return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels))
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{{{labels}}} {_format(value)}" if labels
+                         else f"{self.name}{suffix} {_format(value)}")
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        shard = self._shard()
+        with shard.lock:
+            shard.values[labels] = shard.values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return sum(shard.values.get(labels, 0) for shard in self.shards)
+
+    def _merged(self):
+        merged = {}
+        for shard in self.shards:
+            with shard.lock:
+                for labels, value in shard.values.items():
+                    merged[labels] = merged.get(labels, 0) + value
+        return merged
+
+    def samples(self):
+        return [('', self._labels(labels), value) for labels, value in sorted(self._merged().items())]
+
+
+class Gauge(Counter):
+    """A gauge moved with inc/dec, or computed at scrape time by a callback."""
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def samples(self):
+        if self.callback is None:
+            return super().samples()
+        return [('', self._labels(labels), value) for labels, value in sorted(self.callback().items())]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        shard = self._shard()
+        with shard.lock:
+            counts = shard.values.get(labels)
+            if counts is None:
+                # One slot per bucket plus +Inf, then the running sum
+                counts = shard.values[labels] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        merged = {}
+        for shard in self.shards:
+            with shard.lock:
+                for labels, counts in shard.values.items():
+                    total = merged.setdefault(labels, [0] * len(counts))
+                    for i, count in enumerate(counts):
+                        total[i] += count
+        samples = []
+        for labels, counts in sorted(merged.items()):
+            base = self._labels(labels)
+            prefix = base + ',' if base else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append(('_bucket', f'{prefix}le="{_format(bound)}"', cumulative))
+            samples.append(('_sum', base, counts[-1]))
+            samples.append(('_count', base, cumulative))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format."""
+        return '\n'.join(metric.render() for metric in self.metrics) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
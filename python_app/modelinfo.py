@@ -0,0 +1,103 @@
+import threading
+import time
+
+
+def parse_show(body):
+    """The details the proxy uses from an /api/show response."""
+    details = body.get('details') or {}
+    model_info = body.get('model_info') or {}
+    context_length = next(
+        (value for key, value in model_info.items() if key.endswith('.context_length') and isinstance(value, int)),
+        None
+    )
+    return {
+        "context_length": context_length,
+        "parameter_size": details.get('parameter_size'),
+        "family": details.get('family'),
+        "quantization_level": details.get('quantization_level')
+    }
+
+
+class ModelInfoCache:
+    """/api/show details by model digest.
+
+    A digest names immutable model contents, so entries never go stale on
+    their own. They are dropped when the digest disappears from /api/tags,
+    because the model was removed or pulled again under a new digest.
+    """
+
+    def __init__(self, fetch):
+        self.fetch = fetch
+        self.entries = {}
+        self.tags_etag = None
+        self.lock = threading.Lock()
+
+    def retain(self, tags_etag, digests):
+        """Forget digests no longer installed; cheap when the tag list has not changed."""
+        if tags_etag == self.tags_etag:
+            return
+        digests = set(digests)
+        with self.lock:
+            self.tags_etag = tags_etag
+            for digest in list(self.entries):
+                if digest not in digests:
+                    del self.entries[digest]
+
+    def get(self, model, digest):
+        """Return the details of `model`, fetching them once per digest."""
+        with self.lock:
+            info = self.entries.get(digest)
+        if info is None:
+            info = parse_show(self.fetch(model))
+            with self.lock:
+                self.entries[digest] = info
+        return info
+
+
+class ContextSizer:
+    """Picks a num_ctx bucket per request and keeps it stable per model.
+
+    Buckets are powers of two from `min_ctx` up to the model's context
+    length (which is always a bucket). A request gets the smallest bucket
+    that holds what it needs. A model never moves to a smaller bucket until
+    its current one has not been needed for `shrink_after` seconds, because
+    every change of num_ctx makes Ollama reload the model's runner.
+    """
+
+    def __init__(self, min_ctx=4096, shrink_after=600.0):
+        self.min_ctx = min_ctx
+        self.shrink_after = shrink_after
+        # model -> (current bucket, when a request last needed it)
+        self.current = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, needed, max_ctx):
+        size = self.min_ctx
+        while size < needed and size < max_ctx:
+            size *= 2
+        return min(size, max_ctx)
+
+    def size(self, model, needed, max_ctx):
+        """Return the num_ctx for a request on `model` that needs `needed` tokens."""
+        bucket = self.bucket(needed, max_ctx)
+        now = time.monotonic()
+        with self.lock:
+            current, needed_at = self.current.get(model, (None, 0.0))
+            if current is not None and bucket < current <= max_ctx and now - needed_at < self.shrink_after:
+                return current
+            self.current[model] = (bucket, now)
+            return bucket
+
+    def current_bucket(self, model, max_ctx):
+        """The bucket `model` currently runs with, or the smallest one when it has not been sized yet."""
+        with self.lock:
+            current, _ = self.current.get(model, (None, 0.0))
+        if current is not None and current <= max_ctx:
+            return current
+        return self.bucket(0, max_ctx)
+
+    def status(self):
+        now = time.monotonic()
+        with self.lock:
+            return {model: {"num_ctx": bucket, "needed_ago": round(now - needed_at, 1)}
+                    for model, (bucket, needed_at) in self.current.items()}
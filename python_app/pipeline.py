@@ -0,0 +1,244 @@
+import json
+import re
+import time
+
+# Built-in patterns for `Redact`, by name
+PATTERNS = {
+    'email': r'[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}',
+    'aws_key': r'\b(?:AKIA|ASIA)[0-9A-Z]{16}\b',
+    'api_key': r'\b(?:sk|pk|rk)-[A-Za-z0-9_-]{16,}|\bgh[pousr]_[A-Za-z0-9]{36}\b|\bxox[abprs]-[A-Za-z0-9-]{10,}',
+    'credit_card': r'\b\d(?:[ -]?\d){12,18}\b',
+    'ipv4': r'\b(?:(?:25[0-5]|2[0-4]\d|1?\d?\d)\.){3}(?:25[0-5]|2[0-4]\d|1?\d?\d)\b'
+}
+
+
+class PipelineError(ValueError):
+    """Invalid post-processing settings in a request."""
+
+
+class Stage:
+    """One incremental transformation of generated text.
+
+    `feed` receives the next piece of text and returns what can be emitted
+    so far; a stage may hold text back until it knows more. `flush` returns
+    whatever is still held at the end. A stage that decides the answer must
+    end sets `stopped` to the reason.
+    """
+
+    name = None
+
+    def __init__(self):
+        self.stopped = None
+
+    def feed(self, text):
+        return text
+
+    def flush(self):
+        return ''
+
+
+class StopSequences(Stage):
+    """Ends the answer before the first of `stops`, even when it arrives split over several chunks."""
+
+    name = 'stop'
+
+    def __init__(self, stops):
+        super().__init__()
+        self.stops = [stop for stop in stops if stop]
+        self.longest = max((len(stop) for stop in self.stops), default=0)
+        self.buffer = ''
+
+    def feed(self, text):
+        self.buffer += text
+        found = [i for i in (self.buffer.find(stop) for stop in self.stops) if i >= 0]
+        if found:
+            text, self.buffer = self.buffer[:min(found)], ''
+            self.stopped = 'stop'
+            return text
+        # Hold back the longest tail that could still grow into a stop sequence
+        held = 0
+        for size in range(min(len(self.buffer), self.longest - 1), 0, -1):
+            tail = self.buffer[-size:]
+            if any(stop.startswith(tail) for stop in self.stops):
+                held = size
+                break
+        text, self.buffer = self.buffer[:len(self.buffer) - held], self.buffer[len(self.buffer) - held:]
+        return text
+
+    def flush(self):
+        text, self.buffer = self.buffer, ''
+        return text
+
+
+class Redact(Stage):
+    """Replaces matches of the named `PATTERNS` with `[REDACTED:<name>]`.
+
+    The last `window` characters are held back so a match split over
+    chunks is seen whole; matches longer than `window` may slip through.
+    """
+
+    name = 'redact'
+
+    def __init__(self, names, window=64):
+        super().__init__()
+        self.pattern = re.compile('|'.join(f"(?P<{name}>{PATTERNS[name]})" for name in names))
+        self.window = window
+        self.buffer = ''
+
+    def _replace(self, match):
+        return f"[REDACTED:{match.lastgroup}]"
+
+    def feed(self, text):
+        self.buffer += text
+        limit = len(self.buffer) - self.window
+        if limit <= 0:
+            return ''
+        parts = []
+        position = 0
+        for match in self.pattern.finditer(self.buffer):
+            if match.start() >= limit:
+                break
+            if match.end() > limit:
+                # The match may still grow; emit up to where it starts
+                limit = match.start()
+                break
+            parts.append(self.buffer[position:match.start()])
+            parts.append(self._replace(match))
+            position = match.end()
+        parts.append(self.buffer[position:limit])
+        self.buffer = self.buffer[limit:]
+        return ''.join(parts)
+
+    def flush(self):
+        text, self.buffer = self.pattern.sub(self._replace, self.buffer), ''
+        return text
+
+
+class LengthCap(Stage):
+    """Ends the answer after `max_chars` characters."""
+
+    name = 'length'
+
+    def __init__(self, max_chars):
+        super().__init__()
+        self.remaining = max_chars
+
+    def feed(self, text):
+        if len(text) > self.remaining:
+            text = text[:self.remaining]
+            self.stopped = 'length'
+        self.remaining -= len(text)
+        return text
+
+
+class Pipeline:
+    """Runs generated text through stages in order, chunk by chunk.
+
+    Time spent in each stage is added up in `seconds`. Once a stage stops
+    the answer, the stages after it flush what they hold and `stopped` is
+    set; the text held by earlier stages comes after the stop and is dropped.
+    """
+
+    def __init__(self, stages):
+        self.stages = stages
+        self.seconds = {stage.name: 0.0 for stage in stages}
+        self.chunks = 0
+        self.stopped = None
+
+    def _run(self, text, flush):
+        for stage in self.stages:
+            started = time.perf_counter()
+            text = stage.feed(text)
+            if stage.stopped is not None and self.stopped is None:
+                self.stopped = stage.stopped
+            elif flush or self.stopped is not None:
+                text += stage.flush()
+            self.seconds[stage.name] += time.perf_counter() - started
+        return text
+
+    def feed(self, text):
+        self.chunks += 1
+        return self._run(text, False)
+
+    def flush(self):
+        return self._run('', True)
+
+    def process(self, lines):
+        """Yield Ollama's NDJSON chat `lines` with their content run through the stages.
+
+        Lines whose content is unchanged are passed on as they are. When a
+        stage stops the answer, a final line with that stage's `done_reason`
+        is yielded and the rest of `lines` is not read.
+        """
+        for line in lines:
+            chunk = json.loads(line)
+            if chunk.get('done'):
+                text = self.flush()
+                if text:
+                    content = {key: chunk[key] for key in ('model', 'created_at') if key in chunk}
+                    yield json.dumps(dict(content, message={"role": "assistant", "content": text}, done=False)).encode()
+                # The cap may end the answer at the very end too
+                yield json.dumps(dict(chunk, done_reason=self.stopped)).encode() if self.stopped else line
+                return
+            message = chunk.get('message') or {}
+            content = message.get('content') or ''
+            text = self.feed(content)
+            if text == content:
+                yield line
+            elif text or set(message) - {'role', 'content'}:
+                yield json.dumps(dict(chunk, message=dict(message, content=text))).encode()
+            if self.stopped is not None:
+                yield json.dumps(dict(
+                    chunk, message={"role": "assistant", "content": ""}, done=True, done_reason=self.stopped
+                )).encode()
+                return
+
+
+def build_pipeline(spec):
+    """Build a `Pipeline` from `{"stop": [...], "redact": [...], "max_chars": n}`, or None when empty.
+
+    Stop sequences see the model's own text, redaction runs before the length
+    cap, and the cap counts what the client receives.
+    """
+    if not spec:
+        return None
+    stages = []
+    if spec.get('stop'):
+        stages.append(StopSequences(spec['stop']))
+    if spec.get('redact'):
+        stages.append(Redact(spec['redact']))
+    if spec.get('max_chars'):
+        stages.append(LengthCap(spec['max_chars']))
+    return Pipeline(stages) if stages else None
+
+
+def redact_patterns(value):
+    """Validate redaction pattern names given as a list, a comma-separated string or True (all of them)."""
+    if value is True:
+        return list(PATTERNS)
+    if isinstance(value, str):
+        value = [name.strip() for name in value.split(',') if name.strip()]
+    names = list(value or [])
+    unknown = [name for name in names if name not in PATTERNS]
+    if unknown:
+        raise PipelineError(f"unknown redaction pattern(s): {', '.join(unknown)}; known: {', '.join(PATTERNS)}")
+    return names
+
+
+def pipeline_spec(stop=None, redact=None, max_chars=None):
+    """Validate pipeline settings and return them as a spec for `build_pipeline`, or None when empty."""
+    if isinstance(stop, str):
+        stop = [stop]
+    if stop is not None and not all(isinstance(sequence, str) for sequence in stop):
+        raise PipelineError("stop must be a string or a list of strings")
+    redact = redact_patterns(redact)
+    if max_chars is not None and (not isinstance(max_chars, int) or max_chars < 0):
+        raise PipelineError("max_chars must be a non-negative integer")
+    spec = {}
+    if stop:
+        spec['stop'] = sorted(set(stop))
+    if redact:
+        spec['redact'] = sorted(set(redact))
+    if max_chars:
+        spec['max_chars'] = max_chars
+    return spec or None
@@ -0,0 +1,80 @@
+import hashlib
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+
+
+def canonical_key(*parts):
+    """Hash JSON-serialisable parts into a key that ignores dict ordering and whitespace."""
+    canonical = json.dumps(parts, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def is_deterministic(options):
+    """True when the sampling options make Ollama's output repeatable (greedy decoding)."""
+    options = options or {}
+    return options.get('temperature') == 0 or options.get('top_k') == 1
+
+
+class ResponseCache:
+    """Completed chat responses on disk, bounded by bytes with LRU eviction.
+
+    The store is a SQLite file, so every worker process of the proxy shares it.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    body BLOB,
+                    size INTEGER,
+                    last_used REAL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def get(self, key):
+        """Return the cached response dict for `key`, or None."""
+        with self._connect() as db:
+            row = db.execute("SELECT body FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key, result):
+        body = json.dumps(result, separators=(',', ':')).encode('utf-8')
+        if len(body) > self.max_bytes:
+            return
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, body, len(body), time.time())
+            )
+            self._evict(db)
+
+    def _evict(self, db):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        victims = []
+        for key, size in db.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            victims.append((key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+        db.executemany("DELETE FROM responses WHERE key = ?", victims)
@@ -0,0 +1,223 @@
+import itertools
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+PRIORITIES = ('interactive', 'batch')
+
+
+class AdmissionError(Exception):
+    """A request that could not be given a generation slot."""
+
+    status = 503
+
+    def __init__(self, message, model, position=None, eta=None):
+        super().__init__(message)
+        self.model = model
+        self.position = position
+        self.eta = eta
+
+    @property
+    def retry_after(self):
+        return max(1, math.ceil(self.eta or 1))
+
+    def to_dict(self):
+        return {"error": str(self), "model": self.model, "position": self.position, "eta": self.eta}
+
+
+class QueueFullError(AdmissionError):
+    status = 429
+
+
+class QueueTimeoutError(AdmissionError):
+    status = 503
+
+
+class Ticket:
+    """A request's place in a model's admission queue."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, model, client, priority):
+        self.id = next(self._ids)
+        self.model = model
+        self.client = client
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.admitted_at = None
+        self.admitted = threading.Event()
+
+    @property
+    def queue_time(self):
+        return (self.admitted_at or time.monotonic()) - self.enqueued_at
+
+
+class _ModelQueue:
+    def __init__(self):
+        self.active = 0
+        # priority -> client -> deque of waiting tickets; clients are served round-robin
+        self.waiting = {priority: OrderedDict() for priority in PRIORITIES}
+
+    def __len__(self):
+        return sum(len(tickets) for clients in self.waiting.values() for tickets in clients.values())
+
+
+class AdmissionScheduler:
+    """Per-model concurrency slots with fair queuing in front of Ollama.
+
+    Each model admits up to `slots` concurrent generations. Waiting requests
+    are grouped by priority class (interactive before batch) and, within a
+    class, served round-robin across clients so one heavy client cannot
+    starve the others. A request is refused with QueueFullError when the
+    queue is at `max_queue`, and with QueueTimeoutError once it has waited
+    longer than its class's time budget.
+
+    `capacity`, when given, is called with a model name to size its slots
+    dynamically instead of using the fixed `slots`. A model's queue is
+    dropped once nothing is running or waiting on it, so names that are
+    used once do not stay in the table; its service time, used for ETAs,
+    is kept for the `remembered` most recently used models.
+    """
+
+    def __init__(self, slots=4, max_queue=100, budgets=None, capacity=None, remembered=256):
+        self.slots = slots
+        self.capacity_fn = capacity
+        self.max_queue = max_queue
+        self.budgets = budgets or {'interactive': 30.0, 'batch': 300.0}
+        self.queues = {}
+        self.service_times = OrderedDict()
+        self.remembered = remembered
+        self.lock = threading.Lock()
+
+    def capacity(self, model):
+        if self.capacity_fn is not None:
+            return self.capacity_fn(model)
+        return self.slots
+
+    def acquire(self, model, client, priority='interactive'):
+        """Block until `model` has a free slot for this request and return its Ticket."""
+        if priority not in PRIORITIES:
+            priority = 'interactive'
+        ticket = Ticket(model, client, priority)
+
+        with self.lock:
+            queue = self.queues.setdefault(model, _ModelQueue())
+            if queue.active < self.capacity(model) and not len(queue):
+                self._admit(queue, ticket)
+                return ticket
+            if len(queue) >= self.max_queue:
+                raise QueueFullError(
+                    f"Admission queue for {model} is full",
+                    model, len(queue), self._eta(model, queue, len(queue))
+                )
+            queue.waiting[priority].setdefault(client, deque()).append(ticket)
+
+        if ticket.admitted.wait(self.budgets.get(priority)):
+            return ticket
+
+        with self.lock:
+            if ticket.admitted.is_set():
+                return ticket
+            position = self._position(queue, ticket)
+            tickets = queue.waiting[priority][client]
+            tickets.remove(ticket)
+            if not tickets:
+                del queue.waiting[priority][client]
+            self._drop_if_idle(model, queue)
+            raise QueueTimeoutError(
+                f"Waited {ticket.queue_time:.0f}s for a {model} slot",
+                model, position, self._eta(model, queue, position)
+            )
+
+    def release(self, ticket):
+        with self.lock:
+            queue = self.queues[ticket.model]
+            queue.active -= 1
+            elapsed = time.monotonic() - ticket.admitted_at
+            service_time = self.service_times.pop(ticket.model, None)
+            if service_time is None:
+                service_time = elapsed
+            else:
+                service_time = 0.8 * service_time + 0.2 * elapsed
+            self.service_times[ticket.model] = service_time
+            while len(self.service_times) > self.remembered:
+                self.service_times.popitem(last=False)
+            self._dispatch(ticket.model, queue)
+            self._drop_if_idle(ticket.model, queue)
+
+    def _admit(self, queue, ticket):
+        queue.active += 1
+        ticket.admitted_at = time.monotonic()
+        ticket.admitted.set()
+
+    def _dispatch(self, model, queue):
+        while queue.active < self.capacity(model):
+            ticket = self._next_ticket(queue)
+            if ticket is None:
+                return
+            self._admit(queue, ticket)
+
+    def _drop_if_idle(self, model, queue):
+        if not queue.active and not len(queue) and self.queues.get(model) is queue:
+            del self.queues[model]
+
+    def _next_ticket(self, queue):
+        for priority in PRIORITIES:
+            clients = queue.waiting[priority]
+            if not clients:
+                continue
+            client, tickets = clients.popitem(last=False)
+            ticket = tickets.popleft()
+            if tickets:
+                # Rotate the client to the back so the next slot goes to someone else
+                clients[client] = tickets
+            return ticket
+        return None
+
+    def _position(self, queue, ticket):
+        """Approximate number of waiting requests that will be admitted before `ticket`."""
+        position = 0
+        for priority in PRIORITIES:
+            clients = queue.waiting[priority]
+            if priority != ticket.priority:
+                position += sum(len(tickets) for tickets in clients.values())
+                continue
+            index = clients[ticket.client].index(ticket)
+            for tickets in clients.values():
+                position += min(len(tickets), index + 1)
+            return position
+        return position
+
+    def _eta(self, model, queue, position):
+        service_time = self.service_times.get(model)
+        if service_time is None:
+            return None
+        return round((position // self.capacity(model) + 1) * service_time, 1)
+
+    def status(self, client=None):
+        """Queue depth, ETA and (for `client`) per-request positions for every model."""
+        with self.lock:
+            models = {}
+            for model, queue in self.queues.items():
+                info = {
+                    "active": queue.active,
+                    "slots": self.capacity(model),
+                    "waiting": {priority: sum(len(t) for t in clients.values())
+                                for priority, clients in queue.waiting.items()},
+                    "service_time": self.service_times.get(model)
+                }
+                if client is not None:
+                    info["requests"] = []
+                    for clients in queue.waiting.values():
+                        for ticket in clients.get(client, ()):
+                            position = self._position(queue, ticket)
+                            info["requests"].append({
+                                "id": ticket.id,
+                                "priority": ticket.priority,
+                                "position": position,
+                                "eta": self._eta(model, queue, position),
+                                "waited": round(ticket.queue_time, 1)
+                            })
+                models[model] = info
+            return models
@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class _Index:
+    """Unit-length question vectors and their answers for one namespace."""
+
+    def __init__(self, dim):
+        self.vectors = np.zeros((16, dim), dtype='<f4')
+        self.answers = []
+        self.last_used = np.zeros(16)
+
+    def search(self, vector):
+        """Return `(slot, similarity)` of the closest stored question, or None."""
+        if not self.answers:
+            return None
+        similarities = self.vectors[:len(self.answers)] @ vector
+        slot = int(np.argmax(similarities))
+        return slot, float(similarities[slot])
+
+    def put(self, slot, vector, answer):
+        if slot == len(self.answers):
+            if slot == len(self.vectors):
+                self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+                self.last_used = np.concatenate([self.last_used, np.zeros_like(self.last_used)])
+            self.answers.append(answer)
+        else:
+            self.answers[slot] = answer
+        self.vectors[slot] = vector
+        self.last_used[slot] = time.monotonic()
+
+
+class SemanticCache:
+    """Answers to past questions, found again by embedding similarity.
+
+    Namespaces keep unrelated questions apart (the caller derives them from
+    the model, system prompt and options). A lookup is one matrix-vector
+    product over the namespace's questions; the closest answer is returned
+    when its cosine similarity reaches `threshold`. Each namespace holds at
+    most `max_entries` answers and replaces its least recently used one when
+    full; the least recently used namespace is dropped beyond
+    `max_namespaces`.
+    """
+
+    def __init__(self, threshold=0.92, max_entries=1000, max_namespaces=100):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_namespaces = max_namespaces
+        self.namespaces = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _normalise(vector):
+        vector = np.asarray(vector, dtype='<f4')
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, namespace, vector):
+        """Return `(answer, similarity)` for a close enough past question, or None."""
+        vector = self._normalise(vector)
+        with self.lock:
+            index = self.namespaces.get(namespace)
+            if index is None or index.vectors.shape[1] != vector.shape[0]:
+                return None
+            self.namespaces.move_to_end(namespace)
+            found = index.search(vector)
+            if found is None or found[1] < self.threshold:
+                return None
+            slot, similarity = found
+            index.last_used[slot] = time.monotonic()
+            return index.answers[slot], similarity
+
+    def put(self, namespace, vector, answer):
+        vector = self._normalise(vector)
+        with self.lock:
+            index = self.namespaces.get(namespace)
+            if index is None or index.vectors.shape[1] != vector.shape[0]:
+                index = self.namespaces[namespace] = _Index(vector.shape[0])
+            self.namespaces.move_to_end(namespace)
+            found = index.search(vector)
+            if found is not None and found[1] >= self.threshold:
+                # Refresh the answer of an equivalent question rather than adding another
+                slot = found[0]
+            elif len(index.answers) < self.max_entries:
+                slot = len(index.answers)
+            else:
+                slot = int(np.argmin(index.last_used[:len(index.answers)]))
+            index.put(slot, vector, answer)
+            while len(self.namespaces) > self.max_namespaces:
+                self.namespaces.popitem(last=False)
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(index.answers) for index in self.namespaces.values())
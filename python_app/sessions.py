@@ -0,0 +1,111 @@
+import json
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+
+
+class SessionStore:
+    """Conversation histories kept server-side in SQLite.
+
+    Messages are stored one row per turn, so appending a turn costs the same
+    however long the conversation already is.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id TEXT PRIMARY KEY,
+                    model TEXT,
+                    system TEXT,
+                    options TEXT,
+                    created_at REAL,
+                    updated_at REAL
+                )
+            """)
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    session_id TEXT,
+                    seq INTEGER,
+                    role TEXT,
+                    content TEXT,
+                    PRIMARY KEY (session_id, seq)
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def create(self, model, system=None, options=None):
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO sessions VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, model, system, json.dumps(options or {}), now, now)
+            )
+        return self.get(session_id)
+
+    def get(self, session_id):
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT id, model, system, options, created_at, updated_at FROM sessions WHERE id = ?",
+                (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "model": row[1],
+            "system": row[2],
+            "options": json.loads(row[3]),
+            "created_at": row[4],
+            "updated_at": row[5]
+        }
+
+    def update(self, session_id, model=None, system=None, options=None):
+        """Change the session's model, system prompt or options; None leaves a field as is."""
+        with self._connect() as db:
+            db.execute(
+                """UPDATE sessions SET
+                       model = COALESCE(?, model),
+                       system = COALESCE(?, system),
+                       options = COALESCE(?, options),
+                       updated_at = ?
+                   WHERE id = ?""",
+                (model, system, None if options is None else json.dumps(options), time.time(), session_id)
+            )
+
+    def messages(self, session_id):
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT role, content FROM messages WHERE session_id = ? ORDER BY seq",
+                (session_id,)
+            ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def append(self, session_id, *messages):
+        """Append messages to the end of the session's history in one transaction."""
+        with self._connect() as db:
+            for message in messages:
+                db.execute(
+                    """INSERT INTO messages
+                       SELECT ?, COALESCE(MAX(seq) + 1, 0), ?, ? FROM messages WHERE session_id = ?""",
+                    (session_id, message['role'], message['content'], session_id)
+                )
+            db.execute("UPDATE sessions SET updated_at = ? WHERE id = ?", (time.time(), session_id))
+
+    def delete(self, session_id):
+        with self._connect() as db:
+            db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            deleted = db.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount
+        return deleted > 0
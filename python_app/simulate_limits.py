@@ -0,0 +1,101 @@
+"""Simulation of the adaptive concurrency limit against a backend that degrades under load.
+
+Starts fake_ollama.py with --degrade, so generations slow down more than
+proportionally once more than that many run at once, and drives the proxy
+in-process with a fixed number of concurrent clients. Every interval it
+prints the backend's current limit, the generations in flight and the
+completed tokens per second; the limit's history is printed at the end.
+Compare with static slots by passing --static:
+
+    python simulate_limits.py --clients 24 --degrade 8 --seconds 30
+    python simulate_limits.py --clients 24 --degrade 8 --seconds 30 --static
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bench import HERE, free_port, wait_for
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=24, help='concurrent clients')
+    parser.add_argument('--degrade', type=int, default=8, help="stand-in's concurrency before it degrades")
+    parser.add_argument('--initial', type=int, default=4, help='starting (or, with --static, fixed) limit')
+    parser.add_argument('--tokens', type=int, default=40, help='tokens per answer')
+    parser.add_argument('--token-delay', type=float, default=0.01)
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--interval', type=float, default=2)
+    parser.add_argument('--static', action='store_true', help='disable the adaptive limit')
+    args = parser.parse_args()
+
+    port = free_port()
+    fake = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, 'fake_ollama.py'), '--port', str(port), '--load-time', '0',
+         '--token-delay', str(args.token_delay), '--degrade', str(args.degrade)],
+        stdout=subprocess.DEVNULL
+    )
+    try:
+        wait_for(port)
+        os.environ.update({
+            'OLLAMA_API_URLS': f"http://127.0.0.1:{port}/api",
+            'DATA_DIR': tempfile.mkdtemp(prefix='ollama-limits-'),
+            'RESPONSE_CACHE_MAX_BYTES': '0',
+            'COALESCE_REQUESTS': '0',
+            'HEALTH_CHECK_INTERVAL': '60',
+            'MODEL_CONCURRENCY': str(args.initial),
+            'ADAPTIVE_CONCURRENCY': '0' if args.static else '1',
+            'QUEUE_MAX_DEPTH': str(args.clients * 2)
+        })
+        sys.path.insert(0, HERE)
+        import app
+
+        prompt = ' '.join(f"w{i}" for i in range(args.tokens - 1))
+        body = {"model": "llama3", "messages": [{"role": "user", "content": prompt}]}
+        deadline = time.monotonic() + args.seconds
+        tokens = [0]
+        lock = threading.Lock()
+
+        def client():
+            test_client = app.app.test_client()
+            while time.monotonic() < deadline:
+                response = test_client.post('/api/chat', json=body)
+                if response.status_code == 200:
+                    with lock:
+                        tokens[0] += response.get_json().get('eval_count', 0)
+
+        threads = [threading.Thread(target=client, daemon=True) for _ in range(args.clients)]
+        for thread in threads:
+            thread.start()
+
+        url = os.environ['OLLAMA_API_URLS']
+        print(f"{args.clients} clients, stand-in degrades beyond {args.degrade}, "
+              f"{'static' if args.static else 'adaptive'} limit starting at {args.initial}")
+        total = 0
+        while time.monotonic() < deadline:
+            time.sleep(args.interval)
+            with lock:
+                done, tokens[0] = tokens[0], 0
+            total += done
+            limit = app.limiter.get(url, 'llama3:latest').status() if app.limiter is not None else None
+            print(f"  limit {limit['limit'] if limit else args.initial:3}  "
+                  f"in flight {app.GENERATIONS_IN_FLIGHT.value('llama3:latest'):3}  "
+                  f"{done / args.interval:8.1f} tokens/s"
+                  + (f"  ttft {limit['last_ttft']}s (baseline {limit['baseline_ttft']}s)" if limit else ''))
+        for thread in threads:
+            thread.join()
+        print(f"  mean {total / args.seconds:.1f} tokens/s")
+        if app.limiter is not None:
+            print("history:", ', '.join(f"{entry['limit']} ({entry['reason']})"
+                                        for entry in app.limiter.get(url, 'llama3:latest').status()['history']))
+    finally:
+        fake.terminate()
+        fake.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -11,7 +11,7 @@ document.addEventListener('DOMContentLoaded', () => {
   const sendButton = document.getElementById('send-button');
   
   // Chat state
-  let chatHistory = [];
+  let sessionId = null;
   let selectedModel = '';
   
   // Fetch available models
@@ -68,7 +68,7 @@ document.addEventListener('DOMContentLoaded', () => {
     // Add system message when model is selected
     if (selectedModel) {
       chatMessages.innerHTML = '';
-      chatHistory = [];
+      sessionId = null;
       
       addMessageToUI('system', `Model <strong>${selectedModel}</strong> selected. Start chatting!`);
     }
@@ -90,35 +90,6 @@ document.addEventListener('DOMContentLoaded', () => {
     // Add user message to UI
     addMessageToUI('user', userMessage);
     
-    // Prepare messages array
-    let messages = [];
-    
-    // Add system message if provided
-    const systemPrompt = systemPromptInput.value.trim();
-    if (systemPrompt) {
-      messages.push({
-        role: 'system',
-        content: systemPrompt
-      });
-    }
-    
-    // Add chat history
-    messages = messages.concat(chatHistory);
-    
-    // Add current user message
-    messages.push({
-      role: 'user',
-      content: userMessage
-    });
-    
-    // Update chat history (excluding system message)
-    if (!chatHistory.some(msg => msg.role === 'user' && msg.content === userMessage)) {
-      chatHistory.push({
-        role: 'user',
-        content: userMessage
-      });
-    }
-    
     // Clear input
     userInput.value = '';
     
@@ -134,15 +105,21 @@ document.addEventListener('DOMContentLoaded', () => {
     `;
     
     try {
-      // Send to API
-      const response = await fetch('/api/chat', {
+      // Start a server-side session on the first turn
+      if (!sessionId) {
+        sessionId = await createSession();
+      }
+      
+      // Send only the new turn; the server keeps the history
+      const response = await fetch(`/api/sessions/${sessionId}/messages`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json'
         },
         body: JSON.stringify({
-          model: selectedModel,
-          messages: messages,
+          content: userMessage,
+          system: systemPromptInput.value.trim(),
+          stream: true,
           options: {
             temperature: parseFloat(temperatureSlider.value),
             num_predict: parseInt(maxTokensInput.value)
@@ -150,20 +127,8 @@ document.addEventListener('DOMContentLoaded', () => {
         })
       });
       
-      const data = await response.json();
-      
-      // Add assistant response to UI
-      if (data.message && data.message.content) {
-        addMessageToUI('assistant', data.message.content);
-        
-        // Add to chat history
-        chatHistory.push({
-          role: 'assistant',
-          content: data.message.content
-        });
-      } else if (data.error) {
-        addMessageToUI('system', `Error: ${data.error}`);
-      }
+      // Render tokens as they arrive
+      await readChatStream(response);
     } catch (error) {
       console.error('Error sending message:', error);
       addMessageToUI('system', 'Error: Could not connect to the server');
@@ -174,6 +139,75 @@ document.addEventListener('DOMContentLoaded', () => {
     }
   });
   
+  // Create a conversation session for the selected model
+  async function createSession() {
+    const response = await fetch('/api/sessions', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json'
+      },
+      body: JSON.stringify({ model: selectedModel })
+    });
+    const data = await response.json();
+    return data.id;
+  }
+  
+  // Read an NDJSON chat stream and update a single assistant message in place
+  async function readChatStream(response) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let content = '';
+    let messageDiv = null;
+    
+    const handleLine = (line) => {
+      if (!line.trim()) return;
+      const data = JSON.parse(line);
+      
+      if (data.error) {
+        addMessageToUI('system', `Error: ${data.error}`);
+        return;
+      }
+      
+      if (data.message && data.message.content) {
+        content += data.message.content;
+        if (!messageDiv) {
+          messageDiv = addMessageToUI('assistant', content);
+        } else {
+          setMessageContent(messageDiv, content);
+        }
+      }
+    };
+    
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split('\n');
+      buffer = lines.pop();
+      lines.forEach(handleLine);
+    }
+    handleLine(buffer + decoder.decode());
+    
+    return content;
+  }
+  
+  // Render markdown-like formatting into a message element
+  function setMessageContent(messageDiv, content) {
+    let formattedContent = content
+      .replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>')
+      .replace(/\*(.*?)\*/g, '<em>$1</em>')
+      .replace(/```([\s\S]*?)```/g, '<pre class="bg-gray-800 text-white p-3 rounded my-2 overflow-x-auto"><code>$1</code></pre>')
+      .replace(/`(.*?)`/g, '<code class="bg-gray-200 px-1 rounded">$1</code>')
+      .replace(/\n/g, '<br>');
+    
+    messageDiv.innerHTML = formattedContent;
+    
+    // Scroll to bottom
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+  }
+  
   // Add message to UI
   function addMessageToUI(role, content) {
     const messageDiv = document.createElement('div');
@@ -190,20 +224,10 @@ document.addEventListener('DOMContentLoaded', () => {
     
     messageDiv.className = `max-w-[80%] p-3 mb-4 rounded-lg ${messageClasses}`;
     
-    // Process markdown-like formatting
-    let formattedContent = content
-      .replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>')
-      .replace(/\*(.*?)\*/g, '<em>$1</em>')
-      .replace(/```([\s\S]*?)```/g, '<pre class="bg-gray-800 text-white p-3 rounded my-2 overflow-x-auto"><code>$1</code></pre>')
-      .replace(/`(.*?)`/g, '<code class="bg-gray-200 px-1 rounded">$1</code>')
-      .replace(/\n/g, '<br>');
-    
-    messageDiv.innerHTML = formattedContent;
-    
     chatMessages.appendChild(messageDiv);
+    setMessageContent(messageDiv, content);
     
-    // Scroll to bottom
-    chatMessages.scrollTop = chatMessages.scrollHeight;
+    return messageDiv;
   }
   
   // Add keyboard shortcut (Ctrl+Enter to submit)
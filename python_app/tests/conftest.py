@@ -0,0 +1,58 @@
+import importlib
+import os
+import subprocess
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+
+from bench import free_port, wait_for  # noqa: E402
+
+
+def start_fake_ollama(port):
+    """Start a stand-in Ollama server (fake_ollama.py) on `port` and wait until it listens."""
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, 'fake_ollama.py'), '--port', str(port),
+         '--load-time', '0', '--token-delay', '0.002'],
+        stdout=subprocess.DEVNULL
+    )
+    try:
+        wait_for(port)
+    except RuntimeError:
+        process.kill()
+        raise
+    return process
+
+
+def stop(process):
+    process.terminate()
+    process.wait()
+
+
+@pytest.fixture(scope='session')
+def fake_ollama():
+    """A stand-in Ollama server for the whole test session; yields its API URL."""
+    port = free_port()
+    process = start_fake_ollama(port)
+    try:
+        yield f"http://127.0.0.1:{port}/api"
+    finally:
+        stop(process)
+
+
+@pytest.fixture(scope='session')
+def app_module(fake_ollama, tmp_path_factory):
+    """The proxy's `app` module, configured against `fake_ollama` with its data in a temporary directory."""
+    os.environ.update({
+        'OLLAMA_API_URLS': fake_ollama,
+        'DATA_DIR': str(tmp_path_factory.mktemp('data')),
+        'HEALTH_CHECK_INTERVAL': '60'
+    })
+    return importlib.import_module('app')
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
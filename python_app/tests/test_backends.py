@@ -0,0 +1,127 @@
+import time
+
+import pytest
+import requests
+
+from backends import Backend, BackendPool, rendezvous
+from bench import free_port
+from conftest import start_fake_ollama, stop
+from upstream import CircuitBreaker, OllamaClient
+
+
+@pytest.fixture(scope='module')
+def stand_ins():
+    """Two stand-in servers on different ports; yields their API URLs."""
+    ports = [free_port(), free_port()]
+    processes = [start_fake_ollama(port) for port in ports]
+    try:
+        yield [f"http://127.0.0.1:{port}/api" for port in ports]
+    finally:
+        for process in processes:
+            stop(process)
+
+
+def backend(url):
+    # A breaker that never opens, so only the pool decides availability
+    return Backend(url, OllamaClient(url, retries=0, breaker=CircuitBreaker(failure_threshold=1000)))
+
+
+def make_pool(urls, **options):
+    return BackendPool([backend(url) for url in urls], **options)
+
+
+def test_requests_go_to_the_backend_with_fewest_outstanding(stand_ins):
+    pool = make_pool(stand_ins)
+    first, second = pool.backends
+    with pool.lease(backend=first):
+        assert {pool.choose() for _ in range(10)} == {second}
+        with pool.lease(backend=second), pool.lease(backend=second):
+            assert pool.choose() is first
+
+
+def test_backends_with_the_model_loaded_are_preferred(stand_ins):
+    pool = make_pool(stand_ins)
+    first, second = pool.backends
+    requests.post(f"{stand_ins[1]}/chat", json={"model": "phi3", "stream": False,
+                                                "messages": [{"role": "user", "content": "load"}]}).raise_for_status()
+    pool.check_all()
+    assert 'phi3:latest' in second.resident and 'phi3:latest' not in first.resident
+    assert second.expires['phi3:latest'] > time.time()
+    # Even when busier: a model load costs more than a short wait
+    with pool.lease(backend=second):
+        assert {pool.choose('phi3') for _ in range(10)} == {second}
+    assert {pool.choose('llama3') for _ in range(10)} <= {first, second}
+
+
+def test_failing_backends_are_ejected_and_readmitted_after_a_healthy_check(stand_ins):
+    port = free_port()
+    pool = make_pool([stand_ins[0], f"http://127.0.0.1:{port}/api"], failure_threshold=2, eject_time=60)
+    healthy, down = pool.backends
+    pool.check_all()
+    assert down.available and down.failures == 1
+    pool.check_all()
+    assert not down.available and down.last_error
+    assert healthy.available and healthy.failures == 0
+    assert {pool.choose() for _ in range(10)} == {healthy}
+
+    process = start_fake_ollama(port)
+    try:
+        pool.check(down)
+        assert down.available and down.failures == 0 and down.last_error is None
+    finally:
+        stop(process)
+
+
+def test_slow_backends_are_ejected(stand_ins):
+    pool = make_pool(stand_ins, max_latency=1.0, failure_threshold=1)
+    slow, fast = pool.backends
+    # Latency is a moving average; seed it as if earlier checks had been slow
+    slow.latency = 10.0
+    pool.check_all()
+    assert not slow.available
+    assert 'health check took' in slow.last_error
+    assert fast.available
+
+
+def test_everything_ejected_falls_back_to_the_first_to_return(stand_ins):
+    pool = make_pool(stand_ins)
+    first, second = pool.backends
+    first.ejected_until = time.monotonic() + 60
+    second.ejected_until = time.monotonic() + 30
+    assert pool.choose() is second
+
+
+def test_conversations_are_pinned_by_rendezvous_hashing(stand_ins):
+    pool = make_pool(stand_ins, affinity_slack=2)
+    pinned = {conversation: pool.choose(affinity=conversation) for conversation in map(str, range(20))}
+    # Both backends get conversations, and each conversation keeps its backend
+    assert set(pinned.values()) == set(pool.backends)
+    for conversation, chosen in pinned.items():
+        assert pool.choose(affinity=conversation) is chosen
+        assert rendezvous(conversation, pool.backends) is chosen
+
+    # While a backend is ejected its conversations move; once it is back they return
+    first, second = pool.backends
+    first.ejected_until = time.monotonic() + 60
+    assert {pool.choose(affinity=conversation) for conversation in pinned} == {second}
+    first.ejected_until = 0.0
+    assert all(pool.choose(affinity=conversation) is chosen for conversation, chosen in pinned.items())
+
+
+def test_a_pinned_backend_is_left_when_it_is_busier_than_the_slack(stand_ins):
+    pool = make_pool(stand_ins, affinity_slack=2)
+    pinned = pool.choose(affinity='conversation')
+    other = next(backend for backend in pool.backends if backend is not pinned)
+    with pool.lease(backend=pinned), pool.lease(backend=pinned):
+        assert pool.choose(affinity='conversation') is pinned
+        with pool.lease(backend=pinned):
+            assert pool.choose(affinity='conversation') is other
+    assert pool.choose(affinity='conversation') is pinned
+
+
+def test_backends_without_headroom_are_passed_over(stand_ins):
+    pool = make_pool(stand_ins)
+    first, second = pool.backends
+    assert {pool.choose(headroom=lambda backend: 0 if backend is first else 1) for _ in range(10)} == {second}
+    # When every backend is full, any may be chosen
+    assert pool.choose(headroom=lambda backend: 0) in pool.backends
@@ -0,0 +1,176 @@
+import json
+import threading
+import time
+
+from broadcast import Channel, Hub
+
+
+def line(content):
+    return json.dumps({"model": "llama3:latest", "message": {"role": "assistant", "content": content},
+                       "done": False}).encode()
+
+
+FINAL = json.dumps({"model": "llama3:latest", "message": {"role": "assistant", "content": ""},
+                    "done": True, "eval_count": 3}).encode()
+
+
+def shown(lines):
+    """What a viewer displays: snapshots replace the text, other lines add to it."""
+    text = ''
+    for raw in lines:
+        chunk = json.loads(raw)
+        if chunk.get('snapshot'):
+            text = chunk['message']['content']
+        else:
+            text += chunk.get('message', {}).get('content', '')
+    return text
+
+
+def test_late_joiners_catch_up_from_a_snapshot():
+    channel = Channel()
+    channel.publish(line("Hello"))
+    channel.publish(line(" wor"))
+    viewer = channel.follow(channel.subscribe(), interval=0.01)
+    snapshot = json.loads(next(viewer))
+    assert snapshot['snapshot'] is True
+    assert snapshot['message']['content'] == "Hello wor"
+    channel.publish(line("ld"))
+    assert next(viewer) == line("ld")
+    channel.publish(FINAL)
+    channel.finish()
+    assert list(viewer) == [FINAL]
+    assert channel.subscribers == set()
+
+
+def test_joining_a_finished_channel_gets_the_whole_answer():
+    channel = Channel()
+    channel.publish(line("all"))
+    channel.publish(FINAL)
+    channel.finish()
+    lines = list(channel.follow(channel.subscribe()))
+    assert shown(lines) == "all"
+    assert lines[-1] == FINAL
+
+
+def test_an_overflowing_viewer_skips_ahead_to_a_snapshot():
+    skips = []
+    channel = Channel(capacity=3, on_skip=lambda: skips.append(1))
+    subscriber = channel.subscribe()
+    viewer = channel.follow(subscriber, interval=0.01)
+    next(viewer)
+    for n in range(4):
+        channel.publish(line(str(n)))
+    # The fourth line overflowed: the backlog is gone, memory stays bounded
+    assert len(subscriber.buffer) == 0 and subscriber.lagged
+    assert subscriber.skips == 1 and skips == [1]
+    # While lagging nothing is buffered; the snapshot will cover it
+    channel.publish(line("4"))
+    assert len(subscriber.buffer) == 0
+    snapshot = json.loads(next(viewer))
+    assert snapshot['snapshot'] is True and snapshot['message']['content'] == "01234"
+    channel.publish(line("5"))
+    assert next(viewer) == line("5")
+
+
+def test_a_viewer_is_dropped_after_max_skips():
+    drops = []
+    channel = Channel(capacity=1, max_skips=1, on_drop=lambda: drops.append(1))
+    subscriber = channel.subscribe()
+    viewer = channel.follow(subscriber, interval=0.01)
+    next(viewer)
+    for content in "ab":
+        channel.publish(line(content))
+    assert subscriber.skips == 1 and not subscriber.dropped
+    next(viewer)
+    for content in "cd":
+        channel.publish(line(content))
+    assert subscriber.dropped and drops == [1]
+    assert subscriber not in channel.subscribers and channel.dropped == 1
+    assert json.loads(next(viewer)) == {"error": "dropped: not reading fast enough"}
+    assert list(viewer) == []
+
+
+def test_a_finish_arriving_while_the_buffer_is_full_still_ends_the_viewer():
+    channel = Channel(capacity=2, max_skips=5)
+    subscriber = channel.subscribe()
+    viewer = channel.follow(subscriber, interval=0.01)
+    next(viewer)
+    channel.publish(line("one"))
+    channel.publish(line(" two"))
+    assert len(subscriber.buffer) == 2
+    channel.publish(FINAL)
+    channel.finish()
+    lines = list(viewer)
+    assert shown(lines) == "one two"
+    assert lines[-1] == FINAL
+
+
+def test_a_finish_that_drops_the_viewer_still_ends_it():
+    channel = Channel(capacity=1, max_skips=0)
+    subscriber = channel.subscribe()
+    viewer = channel.follow(subscriber, interval=0.01)
+    next(viewer)
+    channel.publish(line("one"))
+    channel.finish(error="upstream failed")
+    assert list(viewer) == [json.dumps({"error": "dropped: not reading fast enough"}).encode()]
+
+
+def test_the_publisher_never_waits_for_a_viewer_that_does_not_read():
+    channel = Channel(capacity=8, max_skips=1000)
+    subscriber = channel.subscribe()
+    # A viewer that took its snapshot and then stopped reading, like one stuck on a slow socket
+    stalled = channel.follow(subscriber, interval=0.01)
+    next(stalled)
+    started = time.monotonic()
+    for n in range(5000):
+        channel.publish(line(str(n % 10)))
+    assert time.monotonic() - started < 5
+    assert len(subscriber.buffer) <= 8
+
+
+def test_concurrent_viewers_all_see_the_complete_answer():
+    channel = Channel(capacity=4, max_skips=10000)
+    words = [f"w{n} " for n in range(2000)]
+    results = {}
+
+    def view(name, delay):
+        lines = []
+        for raw in channel.follow(channel.subscribe(), interval=0.01):
+            lines.append(raw)
+            if delay:
+                time.sleep(delay)
+        results[name] = lines
+
+    viewers = [threading.Thread(target=view, args=(n, n * 0.0005)) for n in range(4)]
+    for viewer in viewers:
+        viewer.start()
+
+    def produce():
+        for word in words:
+            channel.publish(line(word))
+        channel.publish(FINAL)
+        channel.finish()
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    producer.join(10)
+    assert not producer.is_alive()
+    for viewer in viewers:
+        viewer.join(10)
+        assert not viewer.is_alive()
+    assert {name: shown(lines) for name, lines in results.items()} == {n: ''.join(words) for n in range(4)}
+    # The slow viewers got there by skipping ahead
+    assert max(sum(b'"snapshot": true' in raw for raw in lines) for lines in results.values()) > 1
+
+
+def test_hub_keeps_finished_channels_for_late_joiners_until_their_ttl():
+    hub = Hub(ttl=60, capacity=4)
+    channel = hub.create()
+    assert hub.get(channel.id) is channel and channel.capacity == 4
+    channel.finish()
+    hub.create()
+    assert hub.get(channel.id) is channel
+    channel.finished_at -= 61
+    hub.create()
+    assert hub.get(channel.id) is None
+    assert len(hub) == 2
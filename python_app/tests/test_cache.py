@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+
+from cache import TTLCache
+
+
+def counting_fetch(body=b'{"models": []}', delay=0.0):
+    calls = []
+
+    def fetch():
+        calls.append(time.monotonic())
+        time.sleep(delay)
+        return body
+
+    return fetch, calls
+
+
+def test_fresh_entry_is_served_without_fetching():
+    cache = TTLCache(ttl=60, stale_ttl=60)
+    fetch, calls = counting_fetch()
+    first = cache.get('tags', fetch)
+    assert cache.get('tags', fetch) is first
+    assert len(calls) == 1
+    assert first.json() == {"models": []}
+
+
+def test_stale_entry_is_served_while_refreshing_in_background():
+    cache = TTLCache(ttl=0.05, stale_ttl=60)
+    fetch, calls = counting_fetch(delay=0.1)
+    first = cache.get('tags', fetch)
+    time.sleep(0.06)
+
+    started = time.monotonic()
+    assert cache.get('tags', fetch) is first
+    assert time.monotonic() - started < 0.05
+    # A second stale read does not start another refresh
+    assert cache.get('tags', fetch) is first
+    time.sleep(0.2)
+    assert len(calls) == 2
+    assert cache.get('tags', fetch) is not first
+
+
+def test_expired_entry_is_fetched_synchronously():
+    cache = TTLCache(ttl=0.01, stale_ttl=0.01)
+    fetch, calls = counting_fetch()
+    first = cache.get('tags', fetch)
+    time.sleep(0.03)
+    assert cache.get('tags', fetch) is not first
+    assert len(calls) == 2
+
+
+def test_concurrent_misses_share_one_fetch():
+    cache = TTLCache()
+    fetch, calls = counting_fetch(delay=0.1)
+    entries = []
+    threads = [threading.Thread(target=lambda: entries.append(cache.get('tags', fetch))) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert len({id(entry) for entry in entries}) == 1
+
+
+def test_fetch_errors_reach_every_waiter_and_are_not_cached():
+    cache = TTLCache()
+
+    def failing():
+        time.sleep(0.05)
+        raise ConnectionError("backend down")
+
+    errors = []
+
+    def get():
+        try:
+            cache.get('tags', failing)
+        except ConnectionError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=get) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 3
+    fetch, calls = counting_fetch()
+    cache.get('tags', fetch)
+    assert len(calls) == 1
+
+
+def test_etag_changes_with_the_body():
+    cache = TTLCache(ttl=0, stale_ttl=0)
+    first = cache.get('tags', lambda: b'{"models": []}')
+    second = cache.get('tags', lambda: b'{"models": [{"name": "llama3:latest"}]}')
+    assert first.etag != second.etag
+
+
+@pytest.mark.parametrize('path', ['/api/models', '/api/version'])
+def test_metadata_routes_answer_304_for_a_matching_etag(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+    revalidated = client.get(path, headers={'If-None-Match': etag})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b''
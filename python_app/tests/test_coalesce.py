@@ -0,0 +1,49 @@
+import threading
+
+from coalesce import Flight, FlightTable
+
+
+def test_late_followers_replay_buffered_chunks():
+    flight = Flight('key')
+    flight.start(200)
+    flight.publish(b'a')
+    flight.publish(b'b')
+    chunks = []
+    follower = threading.Thread(target=lambda: chunks.extend(flight.follow()))
+    follower.start()
+    flight.publish(b'c')
+    flight.finish({"done": True})
+    follower.join(5)
+    assert chunks == [b'a', b'b', b'c']
+    assert list(flight.follow(start=2)) == [b'c']
+
+
+def test_identical_requests_join_one_flight():
+    table = FlightTable()
+    flight, leader = table.join('key')
+    again, second = table.join('key')
+    other, third = table.join('other')
+    assert leader and not second and third
+    assert again is flight and other is not flight
+    table.remove(flight)
+    fresh, leader = table.join('key')
+    assert leader and fresh is not flight
+
+
+def test_concurrent_identical_chats_share_one_generation(app_module, client):
+    body = {"model": "llama3", "messages": [{"role": "user", "content": "coalesce " + "w " * 50}]}
+    generated = app_module.CHAT_OUTCOMES.value('llama3:latest', 'generated')
+    responses = []
+
+    def post():
+        responses.append(app_module.app.test_client().post('/api/chat', json=body))
+
+    threads = [threading.Thread(target=post) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [response.status_code for response in responses] == [200] * 4
+    assert len({response.get_json()['message']['content'] for response in responses}) == 1
+    assert sorted(response.headers['X-Coalesced'] for response in responses) == ['0', '1', '1', '1']
+    assert app_module.CHAT_OUTCOMES.value('llama3:latest', 'generated') == generated + 1
@@ -0,0 +1,142 @@
+import io
+import threading
+
+import numpy as np
+import pytest
+
+from embeddings import EmbedBatcher, EmbeddingStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return EmbeddingStore(str(tmp_path / 'embeddings'), max_bytes=1 << 20)
+
+
+def vector(n, dim=4):
+    return np.arange(dim, dtype='<f4') + n
+
+
+def test_a_round_trip_over_more_keys_than_one_query_holds(store):
+    vectors = {f"key-{n}": vector(n) for n in range(1200)}
+    store.put('llama3', vectors)
+    found = store.get('llama3', list(vectors) + ['missing'])
+    assert len(found) == 1200
+    for key, expected in vectors.items():
+        np.testing.assert_array_equal(found[key], expected)
+    assert store.size() == 1200 * 4 * 4
+    # Putting the same keys again (over several lookup chunks) stores nothing new
+    store.put('llama3', {key: vector(-1) for key in vectors})
+    assert store.size() == 1200 * 4 * 4
+    np.testing.assert_array_equal(store.get('llama3', ['key-999'])['key-999'], vector(999))
+
+
+def test_rows_are_appended_and_the_map_is_reopened_when_the_file_grows(store):
+    store.put('llama3', {"a": vector(1), "b": vector(2)})
+    np.testing.assert_array_equal(store.get('llama3', ['b'])['b'], vector(2))
+    path = store._file('llama3', 4)
+    assert len(store.maps[path]) == 2
+    store.put('llama3', {"c": vector(3)})
+    np.testing.assert_array_equal(store.get('llama3', ['c'])['c'], vector(3))
+    assert len(store.maps[path]) == 3
+    # Models and dimensions have files of their own
+    store.put('phi3', {"a": vector(7, dim=8)})
+    np.testing.assert_array_equal(store.get('phi3', ['a'])['a'], vector(7, dim=8))
+    np.testing.assert_array_equal(store.get('llama3', ['a'])['a'], vector(1))
+
+
+def test_the_store_stops_growing_at_max_bytes(tmp_path):
+    store = EmbeddingStore(str(tmp_path), max_bytes=3 * 4 * 4)
+    store.put('llama3', {"a": vector(1), "b": vector(2)})
+    # Two more would not fit, so neither is stored
+    store.put('llama3', {"c": vector(3), "d": vector(4)})
+    assert store.get('llama3', ['c', 'd']) == {}
+    store.put('llama3', {"c": vector(3)})
+    assert set(store.get('llama3', ['a', 'b', 'c'])) == {'a', 'b', 'c'}
+    assert store.size() == 3 * 4 * 4
+
+
+def test_a_second_store_on_the_same_directory_sees_the_vectors(store):
+    store.put('llama3', {"a": vector(1)})
+    other = EmbeddingStore(store.directory, max_bytes=1 << 20)
+    np.testing.assert_array_equal(other.get('llama3', ['a'])['a'], vector(1))
+
+
+def embed_with(calls):
+    def embed(texts, *args):
+        calls.append(list(texts))
+        return [f"vector of {text}" for text in texts]
+    return embed
+
+
+def run_together(batcher, requests):
+    """Call `batcher.embed` from one thread per `(key, texts)` at once; returns the results in order."""
+    results = [None] * len(requests)
+    barrier = threading.Barrier(len(requests))
+
+    def call(index, key, texts):
+        barrier.wait()
+        results[index] = batcher.embed(key, texts)
+
+    threads = [threading.Thread(target=call, args=(index, *request)) for index, request in enumerate(requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results
+
+
+def test_concurrent_callers_share_one_upstream_call_and_get_their_own_slice():
+    calls = []
+    batcher = EmbedBatcher(embed_with(calls), max_size=6, max_wait=2.0)
+    results = run_together(batcher, [('llama3', ['a', 'b']), ('llama3', ['c']), ('llama3', ['d', 'e', 'f'])])
+    # Six texts fill the batch, so it goes out without waiting for max_wait
+    assert len(calls) == 1
+    assert sorted(calls[0]) == ['a', 'b', 'c', 'd', 'e', 'f']
+    assert results == [["vector of a", "vector of b"], ["vector of c"],
+                       ["vector of d", "vector of e", "vector of f"]]
+    assert batcher.open == {}
+
+
+def test_batches_are_kept_per_key_and_sent_after_max_wait():
+    calls = []
+    batcher = EmbedBatcher(embed_with(calls), max_size=64, max_wait=0.05)
+    results = run_together(batcher, [('llama3', ['a']), ('phi3', ['b']), ('llama3', ['c'])])
+    assert sorted(map(sorted, calls)) == [['a', 'c'], ['b']]
+    assert results == [["vector of a"], ["vector of b"], ["vector of c"]]
+
+
+def test_large_requests_skip_batching_and_errors_reach_every_caller():
+    calls = []
+    batcher = EmbedBatcher(embed_with(calls), max_size=2, max_wait=1.0)
+    assert batcher.embed('llama3', ['a', 'b']) == ["vector of a", "vector of b"]
+
+    def failing(texts, *args):
+        raise RuntimeError("upstream down")
+
+    batcher = EmbedBatcher(failing, max_size=2, max_wait=1.0)
+    errors = []
+
+    def call(text):
+        try:
+            batcher.embed('llama3', [text])
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call, args=(text,)) for text in 'xy']
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert errors == ["upstream down"] * 2
+
+
+def test_embed_endpoint_reuses_cached_vectors(client):
+    first = client.post('/api/embed', json={"model": "llama3", "input": ["cached text", "other text"]})
+    assert first.status_code == 200
+    assert first.headers['X-Embed-Cached'] == '0'
+    again = client.post('/api/embed', json={"model": "llama3", "input": "cached text"})
+    assert again.headers['X-Embed-Cached'] == '1'
+    assert again.get_json()['embeddings'][0] == first.get_json()['embeddings'][0]
+    npy = client.post('/api/embed?format=npy', json={"model": "llama3", "input": ["cached text", "other text"]})
+    array = np.load(io.BytesIO(npy.get_data()))
+    assert array.shape == (2, 16) and array.dtype == np.float32
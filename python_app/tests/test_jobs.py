@@ -0,0 +1,127 @@
+import json
+import os
+import sqlite3
+import time
+
+import pytest
+
+import jobs
+from jobs import JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.db'), ttl=60)
+
+
+def test_lines_are_stored_in_order_and_readable_from_an_offset(store):
+    job_id = store.create('llama3', {"messages": []})
+    assert store.get(job_id)['status'] == 'queued'
+    store.start(job_id)
+    assert store.append(job_id, 0, [b'a', b'b'])
+    assert store.append(job_id, 2, [b'c'])
+    assert store.lines(job_id) == [b'a', b'b', b'c']
+    assert store.lines(job_id, 1) == [b'b', b'c']
+    store.finish(job_id, 'done', result={"message": {"content": "abc"}})
+    job = store.get(job_id)
+    assert job['status'] == 'done'
+    assert job['lines'] == 3
+    assert job['result'] == {"message": {"content": "abc"}}
+
+
+def test_a_deleted_job_stops_accepting_lines(store):
+    job_id = store.create('llama3', {})
+    assert store.delete(job_id)
+    assert not store.append(job_id, 0, [b'a'])
+    assert store.get(job_id) is None
+    assert not store.delete(job_id)
+
+
+def test_a_job_owned_by_an_earlier_run_with_the_same_pid_is_interrupted(store, monkeypatch):
+    job_id = store.create('llama3', {})
+    store.start(job_id)
+    assert store.get(job_id)['status'] == 'running'
+    # A restart reuses the pid but not the boot id
+    monkeypatch.setattr(jobs, '_boot', (None, None))
+    job = store.get(job_id)
+    assert job['status'] == 'error'
+    assert 'interrupted' in job['error']
+
+
+def test_a_job_whose_owner_pid_now_belongs_to_another_run_is_interrupted(store):
+    job_id = store.create('llama3', {})
+    with store._connect() as db:
+        # pid 1 is alive, but its registered run is not the one that created the job
+        db.execute("UPDATE jobs SET owner = 1, boot = 'earlier' WHERE id = ?", (job_id,))
+        db.execute("INSERT OR REPLACE INTO workers VALUES (1, 'later')")
+    assert store.get(job_id)['status'] == 'error'
+
+
+def test_expired_jobs_are_purged_on_reads(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.db'), ttl=0.01, purge_interval=0)
+    job_id = store.create('llama3', {})
+    store.append(job_id, 0, [b'a'])
+    time.sleep(0.02)
+    assert store.get(job_id) is None
+    assert store.lines(job_id) == []
+
+
+def test_stores_created_before_boot_ids_are_migrated(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE jobs (id TEXT PRIMARY KEY, model TEXT, request TEXT, status TEXT, result TEXT, "
+               "error TEXT, lines INTEGER, owner INTEGER, created_at REAL, updated_at REAL, expires_at REAL)")
+    db.execute("INSERT INTO jobs VALUES ('old', 'llama3', '{}', 'running', NULL, NULL, 0, ?, 0, 0, ?)",
+               (os.getpid(), time.time() + 60))
+    db.commit()
+    db.close()
+    store = JobStore(path, ttl=60)
+    # Without a boot id only the pid can be checked
+    assert store.get('old')['status'] == 'running'
+    assert store.get(store.create('llama3', {}))['status'] == 'queued'
+
+
+def wait_for_job(client, job_id, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f'/api/jobs/{job_id}').get_json()
+        if job['status'] not in jobs.ACTIVE or time.monotonic() > deadline:
+            return job
+        time.sleep(0.02)
+
+
+def test_a_job_runs_to_completion_and_its_stream_can_be_resumed(client):
+    created = client.post('/api/jobs', json={"model": "llama3", "messages": [{"role": "user", "content": "a b c"}]})
+    assert created.status_code == 202
+    job_id = created.get_json()['id']
+    assert created.headers['Location'] == f'/api/jobs/{job_id}'
+
+    job = wait_for_job(client, job_id)
+    assert job['status'] == 'done'
+    assert job['result']['message']['content'] == "echo: a b c"
+
+    lines = client.get(f'/api/jobs/{job_id}/events', headers={'Accept': 'application/x-ndjson'}).get_data().splitlines()
+    chunks = [json.loads(line) for line in lines]
+    assert ''.join(chunk['message']['content'] for chunk in chunks) == "echo: a b c"
+    assert chunks[-1]['done'] is True
+
+    # EventSource resumes after the last event id it saw
+    events = client.get(f'/api/jobs/{job_id}/events', headers={'Accept': 'text/event-stream', 'Last-Event-ID': '1'})
+    frames = [frame for frame in events.get_data().split(b"\n\n") if frame]
+    assert frames[0].startswith(b"id: 2\ndata: ")
+    assert len(frames) == len(lines) - 2
+    assert client.get(f'/api/jobs/{job_id}/events?offset=3', headers={'Accept': 'application/x-ndjson'}).get_data().splitlines() == lines[3:]
+
+
+def test_a_failed_job_reports_its_error(client):
+    created = client.post('/api/jobs', json={"model": "missing", "messages": [{"role": "user", "content": "hi"}]})
+    job = wait_for_job(client, created.get_json()['id'])
+    assert job['status'] == 'error'
+    assert 'not found' in job['error']
+
+
+def test_deleting_a_job(client):
+    job_id = client.post('/api/jobs', json={"model": "llama3", "messages": [{"role": "user", "content": "hi"}]}).get_json()['id']
+    assert client.delete(f'/api/jobs/{job_id}').status_code == 204
+    assert client.get(f'/api/jobs/{job_id}').status_code == 404
+    assert client.get(f'/api/jobs/{job_id}/events').status_code == 404
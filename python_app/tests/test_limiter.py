@@ -0,0 +1,79 @@
+from collections import deque
+
+from limiter import AdaptiveLimit, AdaptiveLimiter
+
+
+def curve(concurrency, knee):
+    """Time to first token and tokens per second at `concurrency`: flat up to `knee`, then worse and worse."""
+    slowdown = max(1.0, concurrency / knee) ** 1.5
+    return 0.05 * slowdown, 50 / slowdown
+
+
+def saturate(limit, knee, steps):
+    """Keep `limit` fully used for `steps` generations, finishing the oldest first; returns the limits seen."""
+    running = deque()
+    limits = []
+    for _ in range(steps):
+        while limit.in_flight < limit.limit:
+            running.append(limit.start())
+        generation = running.popleft()
+        ttft, tps = curve(generation.peak, knee)
+        limit.finish(generation, ttft=ttft, tps=tps)
+        limits.append(limit.limit)
+    for generation in running:
+        limit.finish(generation)
+    return limits
+
+
+def test_limit_waits_for_baselines_at_the_static_limit():
+    limit = AdaptiveLimit(initial=4, baseline_samples=5)
+    assert saturate(limit, knee=8, steps=5) == [4] * 5
+    status = limit.status()
+    assert status['baseline_samples'] == 5
+    assert status['baseline_ttft'] == 0.05 and status['baseline_tps'] == 50
+    assert status['history'][-1]['reason'] == 'baseline'
+
+
+def test_limit_converges_near_the_knee():
+    limit = AdaptiveLimit(initial=4)
+    limits = saturate(limit, knee=8, steps=1500)
+    settled = limits[1000:]
+    assert min(settled) >= 7
+    assert max(settled) <= 13
+    assert min(limits) >= 4
+
+
+def test_limit_backs_off_when_the_backend_is_overloaded():
+    limit = AdaptiveLimit(initial=4)
+    saturate(limit, knee=8, steps=1000)
+    grown = limit.limit
+    # The backend gets slower, e.g. another model now shares the GPU
+    limits = saturate(limit, knee=4, steps=500)
+    assert max(limits[300:]) < grown
+    assert max(limits[300:]) <= 7
+    assert any(change['reason'] in ('ttft', 'tps') for change in limit.status()['history'])
+
+
+def test_limit_stays_between_its_bounds():
+    limit = AdaptiveLimit(initial=2, min_limit=2, max_limit=6)
+    assert max(saturate(limit, knee=100, steps=500)) == 6
+    assert min(saturate(limit, knee=0.5, steps=500)) == 2
+
+
+def test_lookups_do_not_create_limits():
+    limiter = AdaptiveLimiter(initial=3)
+    assert limiter.limit('http://a', 'anything') == 3
+    assert limiter.headroom('http://a', 'anything') == 3
+    assert limiter.status() == {}
+    limit = limiter.get('http://a', 'llama3:latest')
+    limit.start()
+    assert limiter.headroom('http://a', 'llama3:latest') == 2
+    assert list(limiter.status()['http://a']) == ['llama3:latest']
+
+
+def test_unknown_models_get_no_limit(client):
+    client.post('/api/chat', json={"model": "llama3", "messages": [{"role": "user", "content": "hi"}]})
+    client.post('/api/chat', json={"model": "no-such-model-xyz", "messages": [{"role": "user", "content": "hi"}]})
+    models = {model for backend in client.get('/api/limits').get_json().values() for model in backend}
+    assert 'llama3:latest' in models
+    assert 'no-such-model-xyz' not in models
@@ -0,0 +1,76 @@
+import threading
+
+import metrics
+from metrics import Registry
+
+
+def test_counter_and_gauge_render_in_exposition_format():
+    registry = Registry()
+    requests = registry.counter('requests_total', 'Requests', ('route', 'status'))
+    in_flight = registry.gauge('in_flight', 'In flight', ('route',))
+    requests.inc('chat', 200)
+    requests.inc('chat', 200, amount=2)
+    in_flight.inc('chat')
+    in_flight.dec('chat')
+    text = registry.render()
+    assert '# TYPE requests_total counter' in text
+    assert 'requests_total{route="chat",status="200"} 3' in text
+    assert 'in_flight{route="chat"} 0' in text
+
+
+def test_gauge_callback_is_sampled_at_scrape_time():
+    registry = Registry()
+    depth = {'llama3:latest': 2}
+    registry.gauge('queue_waiting', 'Waiting', ('model',), callback=lambda: {(m,): v for m, v in depth.items()})
+    assert 'queue_waiting{model="llama3:latest"} 2' in registry.render()
+    depth['llama3:latest'] = 5
+    assert 'queue_waiting{model="llama3:latest"} 5' in registry.render()
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram('latency_seconds', 'Latency', ('route',), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        latency.observe(value, 'chat')
+    text = registry.render()
+    assert 'latency_seconds_bucket{route="chat",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{route="chat",le="1"} 2' in text
+    assert 'latency_seconds_bucket{route="chat",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{route="chat"} 3' in text
+    assert 'latency_seconds_sum{route="chat"} 5.55' in text
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    registry.counter('errors_total', 'Errors', ('kind',)).inc('say "hi"\n')
+    assert 'errors_total{kind="say \\"hi\\"\\n"} 1' in registry.render()
+
+
+def test_threads_write_to_different_shards_and_scrapes_merge_them():
+    counter = Registry().counter('writes_total', 'Writes')
+    threads = [threading.Thread(target=lambda: [counter.inc() for _ in range(1000)]) for _ in range(metrics.SHARDS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.value() == 1000 * metrics.SHARDS
+    assert sum(1 for shard in counter.shards if shard.values) > 1
+
+
+def test_model_labels_are_normalized_and_clamped(client):
+    client.post('/api/chat', json={"model": "llama3", "messages": [{"role": "user", "content": "hi"}]})
+    client.post('/api/chat', json={"model": "no-such-model-xyz", "messages": [{"role": "user", "content": "hi"}]})
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'proxy_chat_requests_total{model="llama3:latest",outcome="generated"}' in text
+    assert 'ollama_generations_in_flight{model="llama3:latest"} 0' in text
+    assert 'model="llama3"' not in text
+    assert 'no-such-model-xyz' not in text
+    assert 'proxy_chat_requests_total{model="other",outcome="generated"}' in text
+
+
+def test_time_to_first_token_and_speed_are_recorded(client):
+    client.post('/api/chat', json={"model": "phi3", "messages": [{"role": "user", "content": "a b c"}]})
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'ollama_time_to_first_token_seconds_count{model="phi3:latest"} 1' in text
+    assert 'ollama_tokens_per_second_count{model="phi3:latest"} 1' in text
+    assert 'ollama_generated_tokens_total{model="phi3:latest"} 4' in text
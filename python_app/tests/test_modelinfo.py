@@ -0,0 +1,117 @@
+import pytest
+
+import modelinfo
+from modelinfo import ContextSizer, ModelInfoCache, parse_show
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(modelinfo.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_buckets_are_powers_of_two_capped_at_the_context_length():
+    sizer = ContextSizer(min_ctx=2048)
+    assert sizer.bucket(0, 32768) == 2048
+    assert sizer.bucket(2048, 32768) == 2048
+    assert sizer.bucket(2049, 32768) == 4096
+    assert sizer.bucket(9000, 32768) == 16384
+    # The model's context length is always a bucket, even when not a power of two
+    assert sizer.bucket(9000, 12000) == 12000
+    assert sizer.bucket(50000, 12000) == 12000
+    assert sizer.bucket(0, 1024) == 1024
+
+
+def test_a_model_only_shrinks_after_its_bucket_went_unused(clock):
+    sizer = ContextSizer(min_ctx=2048, shrink_after=600)
+    assert sizer.size('llama3:latest', 1000, 32768) == 2048
+    # Growing happens straight away
+    assert sizer.size('llama3:latest', 5000, 32768) == 8192
+    clock[0] += 300
+    assert sizer.size('llama3:latest', 1000, 32768) == 8192
+    # Needing the bucket again restarts the wait
+    assert sizer.size('llama3:latest', 7000, 32768) == 8192
+    clock[0] += 599
+    assert sizer.size('llama3:latest', 1000, 32768) == 8192
+    clock[0] += 1
+    assert sizer.size('llama3:latest', 1000, 32768) == 2048
+    # Models are sized independently
+    assert sizer.size('phi3:latest', 1000, 32768) == 2048
+
+
+def test_a_current_bucket_beyond_a_smaller_context_length_is_not_kept(clock):
+    sizer = ContextSizer(min_ctx=2048)
+    sizer.size('llama3:latest', 20000, 32768)
+    # The model was replaced by one with a shorter context
+    assert sizer.size('llama3:latest', 1000, 8192) == 2048
+
+
+def test_current_bucket_is_what_warm_loads_use(clock):
+    sizer = ContextSizer(min_ctx=2048)
+    assert sizer.current_bucket('llama3:latest', 32768) == 2048
+    sizer.size('llama3:latest', 5000, 32768)
+    assert sizer.current_bucket('llama3:latest', 32768) == 8192
+    assert sizer.current_bucket('llama3:latest', 4096) == 2048
+    assert sizer.status() == {'llama3:latest': {"num_ctx": 8192, "needed_ago": 0.0}}
+
+
+def test_details_are_fetched_once_per_digest_and_dropped_with_it():
+    fetched = []
+
+    def fetch(model):
+        fetched.append(model)
+        return {"details": {"family": "llama"}, "model_info": {"llama.context_length": 8192}}
+
+    cache = ModelInfoCache(fetch)
+    cache.retain('"tags-1"', ['sha-a', 'sha-b'])
+    assert cache.get('llama3:latest', 'sha-a')['context_length'] == 8192
+    cache.get('llama3:latest', 'sha-a')
+    cache.get('phi3:latest', 'sha-b')
+    assert fetched == ['llama3:latest', 'phi3:latest']
+
+    # The same tag list is not walked again
+    cache.entries['sha-gone'] = {}
+    cache.retain('"tags-1"', ['sha-a'])
+    assert 'sha-gone' in cache.entries
+
+    # llama3 was pulled again under a new digest
+    cache.retain('"tags-2"', ['sha-c', 'sha-b'])
+    assert set(cache.entries) == {'sha-b'}
+    cache.get('llama3:latest', 'sha-c')
+    assert fetched == ['llama3:latest', 'phi3:latest', 'llama3:latest']
+
+
+def test_parse_show_finds_the_architecture_context_length():
+    info = parse_show({"details": {"parameter_size": "8B", "quantization_level": "Q4_0"},
+                       "model_info": {"general.architecture": "qwen2", "qwen2.context_length": 32768}})
+    assert info == {"context_length": 32768, "parameter_size": "8B", "family": None, "quantization_level": "Q4_0"}
+    assert parse_show({})['context_length'] is None
+
+
+def test_a_bucket_change_keeps_the_response_cache_and_coalescing_key(app_module, client, monkeypatch):
+    # The stand-in reports a context length of 8192; buckets are 4096 and 8192
+    monkeypatch.setattr(app_module.context_sizer, 'current', {})
+    small = {"model": "llama3", "options": {"temperature": 0},
+             "messages": [{"role": "user", "content": "bucket test"}]}
+    large = {"model": "llama3", "options": {"temperature": 0, "num_predict": 4},
+             "messages": [{"role": "user", "content": "long " * 5000}]}
+
+    first = client.post('/api/chat', json=small)
+    assert first.headers['X-Num-Ctx'] == '4096'
+    assert first.headers['X-Cache'] == 'MISS'
+    assert app_module.warm_options('llama3') == {"num_ctx": 4096}
+
+    assert client.post('/api/chat', json=large).headers['X-Num-Ctx'] == '8192'
+    assert app_module.warm_options('llama3') == {"num_ctx": 8192}
+
+    # The model now runs with the larger bucket, but the request key is the same
+    again = client.post('/api/chat', json=small)
+    assert again.headers['X-Num-Ctx'] == '8192'
+    assert again.headers['X-Cache'] == 'HIT'
+    assert again.get_json()['message'] == first.get_json()['message']
+
+    # A num_ctx the client sets is part of the request and so of the key
+    pinned = client.post('/api/chat', json=dict(small, options={"temperature": 0, "num_ctx": 4096}))
+    assert 'X-Num-Ctx' not in pinned.headers
+    assert pinned.headers['X-Cache'] == 'MISS'
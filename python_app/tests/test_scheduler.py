@@ -0,0 +1,163 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import AdmissionScheduler, QueueFullError, QueueTimeoutError
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def queue_up(scheduler, requests):
+    """Start a thread per `(client, priority)` that acquires a slot; returns the admission order."""
+    admitted = []
+    lock = threading.Lock()
+
+    def acquire(client, priority):
+        ticket = scheduler.acquire('llama3', client, priority)
+        with lock:
+            admitted.append((client, priority, ticket))
+
+    for count, (client, priority) in enumerate(requests, 1):
+        threading.Thread(target=acquire, args=(client, priority), daemon=True).start()
+        # One at a time, so the arrival order is deterministic
+        wait_until(lambda: sum(scheduler.status()['llama3']['waiting'].values()) + len(admitted) == count)
+    return admitted
+
+
+def drain(scheduler, admitted, count):
+    """Release admitted tickets one at a time until `count` queued requests were admitted."""
+    order = []
+    while len(order) < count:
+        wait_until(lambda: len(admitted) > len(order))
+        client, priority, ticket = admitted[len(order)]
+        order.append((client, priority))
+        scheduler.release(ticket)
+    return order
+
+
+def test_admits_up_to_the_slots_at_once():
+    scheduler = AdmissionScheduler(slots=2)
+    first = scheduler.acquire('llama3', 'a')
+    scheduler.acquire('llama3', 'a')
+    assert first.queue_time < 0.1
+    status = scheduler.status()['llama3']
+    assert status['active'] == 2 and status['slots'] == 2
+    # Other models have their own slots
+    scheduler.acquire('phi3', 'a')
+
+
+def test_waiting_clients_are_served_round_robin():
+    scheduler = AdmissionScheduler(slots=1)
+    holder = scheduler.acquire('llama3', 'holder')
+    admitted = queue_up(scheduler, [('heavy', 'interactive')] * 3 + [('light', 'interactive')])
+    wait_until(lambda: scheduler.status()['llama3']['waiting']['interactive'] == 4)
+    scheduler.release(holder)
+    order = drain(scheduler, admitted, 4)
+    assert [client for client, _ in order] == ['heavy', 'light', 'heavy', 'heavy']
+
+
+def test_interactive_requests_go_before_batch():
+    scheduler = AdmissionScheduler(slots=1)
+    holder = scheduler.acquire('llama3', 'holder')
+    admitted = queue_up(scheduler, [('a', 'batch'), ('b', 'batch'), ('c', 'interactive')])
+    wait_until(lambda: sum(scheduler.status()['llama3']['waiting'].values()) == 3)
+    scheduler.release(holder)
+    order = drain(scheduler, admitted, 3)
+    assert order == [('c', 'interactive'), ('a', 'batch'), ('b', 'batch')]
+
+
+def test_full_queue_is_refused_with_429():
+    scheduler = AdmissionScheduler(slots=1, max_queue=1)
+    holder = scheduler.acquire('llama3', 'a')
+    queue_up(scheduler, [('b', 'interactive')])
+    wait_until(lambda: scheduler.status()['llama3']['waiting']['interactive'] == 1)
+    with pytest.raises(QueueFullError) as refused:
+        scheduler.acquire('llama3', 'c')
+    assert refused.value.status == 429
+    assert refused.value.retry_after >= 1
+    assert refused.value.to_dict()['position'] == 1
+    scheduler.release(holder)
+
+
+def test_waiting_past_the_budget_fails_with_503_and_an_eta():
+    scheduler = AdmissionScheduler(slots=1, budgets={'interactive': 0.1, 'batch': 0.1})
+    # One completed generation gives the scheduler a service time to estimate from
+    scheduler.release(scheduler.acquire('llama3', 'a'))
+    scheduler.acquire('llama3', 'a')
+    with pytest.raises(QueueTimeoutError) as timed_out:
+        scheduler.acquire('llama3', 'b')
+    assert timed_out.value.status == 503
+    assert timed_out.value.eta is not None
+    assert scheduler.status()['llama3']['waiting']['interactive'] == 0
+
+
+def test_capacity_callback_sizes_the_slots():
+    capacity = {'llama3': 1}
+    scheduler = AdmissionScheduler(slots=4, capacity=lambda model: capacity[model])
+    holder = scheduler.acquire('llama3', 'a')
+    admitted = queue_up(scheduler, [('b', 'interactive')])
+    time.sleep(0.05)
+    assert admitted == []
+    capacity['llama3'] = 2
+    scheduler.release(holder)
+    scheduler.acquire('llama3', 'c')
+    wait_until(lambda: len(admitted) == 1)
+    assert scheduler.status()['llama3']['active'] == 2
+
+
+def test_full_queue_maps_to_429_with_retry_after(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module.scheduler, 'max_queue', 0)
+    monkeypatch.setattr(app_module.scheduler, 'capacity_fn', lambda model: 1)
+    holder = app_module.scheduler.acquire('llama3:latest', 'holder')
+    try:
+        response = client.post('/api/chat', json={"model": "llama3", "messages": [{"role": "user", "content": "hi"}]})
+    finally:
+        app_module.scheduler.release(holder)
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert response.get_json()['model'] == 'llama3:latest'
+
+
+def test_idle_queues_are_dropped_but_their_service_time_is_kept():
+    scheduler = AdmissionScheduler(slots=1, remembered=2)
+    scheduler.release(scheduler.acquire('llama3', 'a'))
+    assert scheduler.queues == {}
+    assert scheduler.status() == {}
+    assert scheduler.service_times['llama3'] is not None
+    for model in ('a', 'b'):
+        scheduler.release(scheduler.acquire(model, 'a'))
+    assert list(scheduler.service_times) == ['a', 'b']
+
+
+def test_a_timed_out_request_does_not_leave_its_queue_behind():
+    scheduler = AdmissionScheduler(slots=0, budgets={'interactive': 0.01, 'batch': 0.01})
+    with pytest.raises(QueueTimeoutError):
+        scheduler.acquire('llama3', 'a')
+    assert scheduler.queues == {}
+
+
+def test_made_up_model_names_do_not_grow_the_queue_table(app_module, client):
+    for n in range(20):
+        response = client.post('/api/chat', json={"model": f"made-up-{n}", "messages": [{"role": "user", "content": "hi"}]})
+        assert response.status_code == 404
+    assert not [model for model in app_module.scheduler.queues if model.startswith('made-up')]
+    assert not [model for model in client.get('/api/queue').get_json()['models'] if model.startswith('made-up')]
+
+
+def test_short_and_full_model_names_share_one_queue(app_module, monkeypatch):
+    monkeypatch.setattr(app_module.scheduler, 'capacity_fn', lambda model: 1)
+    monkeypatch.setattr(app_module.scheduler, 'budgets', {'interactive': 0.05, 'batch': 0.05})
+    holder = app_module.scheduler.acquire('llama3:latest', 'holder')
+    try:
+        # The only slot is taken under the full name, so the short name has to wait
+        with pytest.raises(QueueTimeoutError):
+            app_module.start_flight({"model": "llama3", "messages": []}, 'short-name', 'client', 'interactive')
+    finally:
+        app_module.scheduler.release(holder)
+    assert app_module.scheduler.queues == {}
@@ -0,0 +1,41 @@
+import json
+
+
+def chat(client, content, **fields):
+    body = dict({"model": "llama3", "messages": [{"role": "user", "content": content}]}, **fields)
+    return client.post('/api/chat', json=body)
+
+
+def test_streamed_chat_relays_ndjson_lines(client):
+    response = chat(client, "one two three", stream=True)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data().splitlines()]
+    assert [line['done'] for line in lines] == [False] * (len(lines) - 1) + [True]
+    assert ''.join(line['message']['content'] for line in lines) == "echo: one two three"
+    assert lines[-1]['eval_count'] == 4
+
+
+def test_streamed_chat_as_server_sent_events(client):
+    response = chat(client, "one two", stream=True, format='sse')
+    assert response.mimetype == 'text/event-stream'
+    events = response.get_data().split(b"\n\n")
+    assert events[-1] == b''
+    chunks = [json.loads(event[len(b"data: "):]) for event in events[:-1]]
+    assert all(event.startswith(b"data: ") for event in events[:-1])
+    assert ''.join(chunk['message']['content'] for chunk in chunks) == "echo: one two"
+    assert chunks[-1]['done'] is True
+
+
+def test_non_streamed_chat_returns_the_assembled_answer(client):
+    response = chat(client, "one two three")
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['message'] == {"role": "assistant", "content": "echo: one two three"}
+    assert body['done'] is True
+
+
+def test_upstream_errors_are_relayed(client):
+    response = chat(client, "hello", model="missing")
+    assert response.status_code == 404
+    assert "not found" in response.get_json()['error']
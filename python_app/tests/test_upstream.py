@@ -0,0 +1,90 @@
+import time
+
+import pytest
+import requests
+
+from upstream import CircuitBreaker, CircuitOpenError, OllamaClient, loopback_url
+
+
+def test_breaker_opens_lets_one_trial_through_and_closes_on_success():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call('http://a')
+
+    time.sleep(0.06)
+    assert breaker.state == 'half-open'
+    breaker.before_call('http://a')
+    # Only one trial at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call('http://a')
+
+    # A failed trial re-opens the circuit straight away
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    time.sleep(0.06)
+    breaker.before_call('http://a')
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    breaker.before_call('http://a')
+
+
+def broken(*args, **kwargs):
+    raise requests.exceptions.ChunkedEncodingError("backend died mid-body")
+
+
+class Interrupted(BaseException):
+    pass
+
+
+def interrupted(*args, **kwargs):
+    raise Interrupted()
+
+
+def test_a_trial_failing_mid_body_does_not_jam_the_breaker(fake_ollama, monkeypatch):
+    client = OllamaClient(fake_ollama, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.05))
+    with monkeypatch.context() as patch:
+        patch.setattr(client.session, 'request', broken)
+        with pytest.raises(requests.exceptions.ChunkedEncodingError):
+            client.get('/tags')
+        assert client.breaker.state == 'open'
+
+        time.sleep(0.06)
+        with pytest.raises(requests.exceptions.ChunkedEncodingError):
+            client.get('/tags')
+        assert client.breaker.state == 'open'
+
+    # The backend recovered: the next trial closes the circuit
+    time.sleep(0.06)
+    assert client.get('/tags').status_code == 200
+    assert client.breaker.state == 'closed'
+
+
+def test_an_interrupted_trial_can_be_retried(fake_ollama, monkeypatch):
+    client = OllamaClient(fake_ollama, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.05))
+    client.breaker.record_failure()
+    time.sleep(0.06)
+    with monkeypatch.context() as patch:
+        patch.setattr(client.session, 'request', interrupted)
+        with pytest.raises(Interrupted):
+            client.get('/tags')
+    assert client.breaker.state == 'half-open'
+    assert client.get('/tags').status_code == 200
+    assert client.breaker.state == 'closed'
+
+
+def test_an_open_circuit_refuses_calls_with_a_retry_after(fake_ollama):
+    client = OllamaClient(fake_ollama, retries=0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60))
+    assert client.get('/tags').status_code == 200
+    client.breaker.record_failure()
+    with pytest.raises(CircuitOpenError) as refused:
+        client.get('/tags')
+    assert refused.value.retry_after >= 1
+
+
+def test_localhost_is_rewritten_to_the_loopback_address():
+    assert loopback_url('http://localhost:11434/api') == 'http://127.0.0.1:11434/api'
+    assert loopback_url('http://ollama:11434/api') == 'http://ollama:11434/api'
@@ -0,0 +1,218 @@
+import socket
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.util.retry import Retry
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker refuses a call to a failing backend."""
+
+    def __init__(self, url, retry_after):
+        super().__init__(f"Ollama backend {url} is unavailable, retry in {retry_after:.0f}s")
+        self.url = url
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Fail fast after repeated failed calls.
+
+    closed -> open after `failure_threshold` consecutive failures; open ->
+    half-open once `reset_timeout` has elapsed, letting a single trial call
+    through; the trial's outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            if self.opened_at is None:
+                return 'closed'
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def before_call(self, url):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+            if remaining > 0 or self.trial_running:
+                raise CircuitOpenError(url, max(remaining, 1.0))
+            self.trial_running = True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+    def abandon(self):
+        """Forget a call that ended without an outcome, so a half-open trial can be retried."""
+        with self.lock:
+            self.trial_running = False
+
+
+class UnixHTTPConnection(HTTPConnection):
+    """urllib3 connection that talks HTTP over a Unix domain socket."""
+
+    def __init__(self, *args, socket_path=None, **kwargs):
+        self.socket_path = socket_path
+        super().__init__(*args, **kwargs)
+
+    def _new_conn(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if isinstance(self.timeout, (int, float)):
+            sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+
+class UnixHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = UnixHTTPConnection
+
+
+class UnixSocketAdapter(HTTPAdapter):
+    """Transport adapter routing every request through one Unix socket."""
+
+    def __init__(self, socket_path, **kwargs):
+        self.socket_path = socket_path
+        super().__init__(**kwargs)
+        self.pool = UnixHTTPConnectionPool(
+            'localhost',
+            maxsize=self._pool_maxsize,
+            block=self._pool_block,
+            socket_path=socket_path
+        )
+
+    def get_connection(self, url, proxies=None):
+        return self.pool
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        return self.pool
+
+    def close(self):
+        super().close()
+        self.pool.close()
+
+
+def loopback_url(url):
+    """Rewrite `localhost` to 127.0.0.1 to skip name resolution and IPv6 fallback."""
+    parts = urlsplit(url)
+    if parts.hostname != 'localhost':
+        return url
+    netloc = '127.0.0.1' + (f":{parts.port}" if parts.port else '')
+    return urlunsplit(parts._replace(netloc=netloc))
+
+
+def abort(response):
+    """Shut down the connection of a streaming response from any thread.
+
+    A read blocked on it (in the thread consuming the stream) returns
+    immediately, and Ollama sees the disconnect and stops generating. The
+    consuming thread still closes the response itself.
+    """
+    sock = getattr(getattr(response.raw, 'connection', None), 'sock', None)
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class OllamaClient:
+    """Pooled keep-alive HTTP client for one Ollama backend.
+
+    Every call gets connect/read deadlines, idempotent calls are retried a
+    bounded number of times and a circuit breaker makes calls fail fast while
+    the backend is down.
+    """
+
+    def __init__(self, base_url, pool_size=100, connect_timeout=3.05, read_timeout=30.0,
+                 generate_timeout=300.0, retries=2, breaker=None, socket_path=None):
+        self.base_url = loopback_url(base_url.rstrip('/'))
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.generate_timeout = generate_timeout
+        self.breaker = breaker or CircuitBreaker()
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=0.1,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            raise_on_status=False
+        )
+        adapter_kwargs = {'pool_connections': 1, 'pool_maxsize': pool_size, 'max_retries': retry}
+
+        self.session = requests.Session()
+        if socket_path:
+            parts = urlsplit(self.base_url)
+            self.session.mount(f"{parts.scheme}://{parts.netloc}", UnixSocketAdapter(socket_path, **adapter_kwargs))
+        else:
+            adapter = HTTPAdapter(**adapter_kwargs)
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+
+    def request(self, method, path, timeout=None, **kwargs):
+        url = f"{self.base_url}{path}"
+        self.breaker.before_call(url)
+        try:
+            response = self.session.request(
+                method,
+                url,
+                timeout=(self.connect_timeout, timeout or self.read_timeout),
+                **kwargs
+            )
+        except Exception:
+            # Connection errors and timeouts, but also a body cut short
+            # (ChunkedEncodingError) or anything else: every way out must
+            # settle a half-open trial, or the circuit never closes again.
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Interrupted (e.g. a gevent timeout or a killed greenlet):
+            # not the backend's fault, but the trial must not stay running
+            self.breaker.abandon()
+            raise
+        if response.status_code in (502, 503, 504):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def generate(self, path, **kwargs):
+        """POST a generation request, allowing for slow prompt evaluation."""
+        return self.request('POST', path, timeout=self.generate_timeout, **kwargs)
+
+    def close(self):
+        self.session.close()
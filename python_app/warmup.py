@@ -0,0 +1,137 @@
+import datetime
+import threading
+import time
+
+from backends import full_model_name
+
+
+def parse_hours(spec):
+    """Parse hour ranges such as "7-19" or "22-6,12-13" into a set of hours (0-23).
+
+    An empty spec means every hour.
+    """
+    hours = set()
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        start, _, end = item.partition('-')
+        start = int(start) % 24
+        end = int(end) % 24 if end else (start + 1) % 24
+        hour = start
+        while True:
+            hours.add(hour)
+            hour = (hour + 1) % 24
+            if hour == end:
+                break
+    return hours or set(range(24))
+
+
+class WarmPool:
+    """Keeps a list of models loaded on every backend.
+
+    On start each model is loaded with a zero-token /api/generate request,
+    sent with the `options` (such as num_ctx) that `options(model)` returns:
+    a model loaded with other options would be reloaded by the first chat.
+    Afterwards a background loop re-issues the load whenever a model is no
+    longer resident, or its keep_alive runs out within `margin` seconds,
+    according to the pool's /api/ps polling. Outside `hours` models are left
+    to expire.
+    """
+
+    def __init__(self, pool, models, keep_alive, options=None, hours=None, margin=60.0, interval=5.0):
+        self.pool = pool
+        self.models = [full_model_name(model) for model in models]
+        self.keep_alive = keep_alive
+        self.options = options or (lambda model: None)
+        self.hours = hours or set(range(24))
+        self.margin = margin
+        self.interval = interval
+        # (backend url, model) -> last warm-up outcome
+        self.state = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def active(self):
+        return datetime.datetime.now().hour in self.hours
+
+    def needs_warming(self, backend, model):
+        if not backend.available:
+            return False
+        if model not in backend.resident:
+            return True
+        expires = backend.expires.get(model)
+        return expires is not None and expires - time.time() < self.margin
+
+    def warm(self, backend, model):
+        """Load `model` on `backend` without generating, returning the load time."""
+        started = time.monotonic()
+        try:
+            body = {"model": model}
+            keep_alive = self.keep_alive(model)
+            if keep_alive is not None:
+                body["keep_alive"] = keep_alive
+            options = self.options(model)
+            if options:
+                body["options"] = options
+            response = backend.client.generate('/generate', json=body)
+            response.raise_for_status()
+            load_duration = (response.json().get('load_duration') or 0) / 1e9
+        except Exception as e:
+            with self.lock:
+                self.state[(backend.url, model)] = {"error": str(e), "warmed_at": None}
+            return None
+        backend.resident.add(model)
+        # Until the next /api/ps poll reports the real expiry
+        backend.expires.pop(model, None)
+        with self.lock:
+            self.state[(backend.url, model)] = {
+                "warmed_at": time.time(),
+                "options": body.get("options"),
+                "load_duration": round(load_duration, 3),
+                "elapsed": round(time.monotonic() - started, 3),
+                "error": None
+            }
+        return load_duration
+
+    def warm_all(self, force=False):
+        """Warm every model that needs it, one thread per backend."""
+        def run(backend):
+            for model in self.models:
+                if force or self.needs_warming(backend, model):
+                    self.warm(backend, model)
+
+        threads = [threading.Thread(target=run, args=(backend,), daemon=True) for backend in self.pool.backends]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def start(self):
+        """Load every model now, then keep them warm in a background thread."""
+        if self.thread is not None or not self.models:
+            return
+
+        def loop():
+            self.warm_all(force=True)
+            while True:
+                time.sleep(self.interval)
+                if self.active():
+                    self.warm_all()
+
+        self.thread = threading.Thread(target=loop, daemon=True)
+        self.thread.start()
+
+    def status(self):
+        now = time.time()
+        with self.lock:
+            state = dict(self.state)
+        models = {}
+        for model in self.models:
+            models[model] = []
+            for backend in self.pool.backends:
+                expires = backend.expires.get(model)
+                models[model].append(dict(
+                    state.get((backend.url, model), {}),
+                    backend=backend.url,
+                    resident=model in backend.resident,
+                    expires_in=None if expires is None else round(expires - now, 1)
+                ))
+        return {"active": self.active(), "hours": sorted(self.hours), "models": models}